@@ -0,0 +1,117 @@
+"""
+In-memory cache of watermarked file bytes for repeated DM attachments
+"""
+
+import asyncio
+import io
+import os
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Optional
+import discord
+
+class AttachmentCache:
+    """LRU of output file bytes keyed by processed_filename, bounded by a total byte budget"""
+    def __init__(self, directory: str = "output", max_bytes: int = 256 * 1024 * 1024, max_file_bytes: Optional[int] = None):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        # One huge video shouldn't flush everything else out
+        self.max_file_bytes = max_file_bytes if max_file_bytes is not None else max_bytes // 4
+        self.entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+    
+    def _stat(self, path: str):
+        try:
+            return os.stat(path)
+        except OSError:
+            return None
+    
+    def _load(self, processed_filename: str) -> Optional[bytes]:
+        path = os.path.join(self.directory, processed_filename)
+        stat = self._stat(path)
+        
+        with self._lock:
+            entry = self.entries.get(processed_filename)
+            if entry is not None:
+                mtime_ns, data = entry
+                # Re-rendered or deleted files must not be served from memory
+                if stat is not None and stat.st_mtime_ns == mtime_ns and stat.st_size == len(data):
+                    self.entries.move_to_end(processed_filename)
+                    self.hits += 1
+                    return data
+                self._evict(processed_filename)
+            self.misses += 1
+        
+        if stat is None:
+            return None
+        
+        with open(path, 'rb') as f:
+            data = f.read()
+        
+        if len(data) <= self.max_file_bytes:
+            with self._lock:
+                self._evict(processed_filename)
+                self.entries[processed_filename] = (stat.st_mtime_ns, data)
+                self.size += len(data)
+                while self.size > self.max_bytes:
+                    oldest = next(iter(self.entries))
+                    self._evict(oldest)
+        return data
+    
+    def _evict(self, processed_filename: str):
+        entry = self.entries.pop(processed_filename, None)
+        if entry is not None:
+            self.size -= len(entry[1])
+    
+    async def get(self, processed_filename: str) -> Optional[bytes]:
+        """File bytes from memory, reading from disk off the event loop on a miss; None if the file is gone"""
+        if not processed_filename:
+            return None
+        with self._lock:
+            entry = self.entries.get(processed_filename)
+        if entry is not None:
+            # Hit path is a stat and a dict lookup, no need for a thread hop
+            return self._load(processed_filename)
+        return await asyncio.to_thread(self._load, processed_filename)
+    
+    async def file_factory(self, processed_filename: str) -> Optional[Callable[[], discord.File]]:
+        """Builds a fresh discord.File per send attempt; None if the file is gone.
+        
+        Files too big to cache are opened from disk on each attempt instead of being read into memory
+        and held by every queued DM that sends them.
+        """
+        if not processed_filename:
+            return None
+        path = os.path.join(self.directory, processed_filename)
+        stat = self._stat(path)
+        if stat is None:
+            return None
+        if stat.st_size > self.max_file_bytes:
+            return lambda: discord.File(path, filename=processed_filename)
+        
+        data = await self.get(processed_filename)
+        if data is None:
+            return None
+        return lambda: self.as_file(data, processed_filename)
+    
+    def invalidate(self, processed_filename: str):
+        with self._lock:
+            self._evict(processed_filename)
+    
+    @staticmethod
+    def as_file(data: bytes, filename: str) -> discord.File:
+        # BytesIO over a bytes object shares its buffer, so each attachment costs no copy
+        return discord.File(io.BytesIO(data), filename=filename)
+    
+    def get_stats(self) -> Dict:
+        with self._lock:
+            return {
+                'files': len(self.entries),
+                'bytes': self.size,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses
+            }
@@ -0,0 +1,76 @@
+"""
+Concurrent bulk DM delivery campaigns
+"""
+
+import asyncio
+from typing import Awaitable, Callable, Dict, List, Optional
+import discord
+
+class BulkCampaign:
+    """Sends one piece of content to many users through its own DM scheduler, so campaigns don't queue behind reveals"""
+    def __init__(self, dm_scheduler, claim_store, user_resolver, max_in_flight: int = 50, claim_batch: int = 50,
+                 progress_interval: float = 5.0):
+        self.dm_scheduler = dm_scheduler
+        self.claim_store = claim_store
+        self.user_resolver = user_resolver
+        self.max_in_flight = max(1, max_in_flight)
+        self.claim_batch = max(1, claim_batch)
+        self.progress_interval = progress_interval
+    
+    async def run(self, watermark_id: str, user_ids: List[int], content: str,
+                  file_factory: Optional[Callable[[], discord.File]] = None,
+                  on_progress: Optional[Callable[[int, int, int], Awaitable[None]]] = None) -> Dict:
+        """Deliver to every user, returns {'sent': [display names], 'failed': [reasons]}.
+        
+        on_progress(sent, failed, total) is awaited every progress_interval seconds while it runs.
+        """
+        sent = []
+        failed = []
+        delivered = []
+        # Bounds lookups and queued sends so a huge list doesn't flood the scheduler at once
+        slots = asyncio.Semaphore(self.max_in_flight)
+        
+        def record_claims():
+            if delivered:
+                self.claim_store.add_claims(watermark_id, delivered, source="bulk")
+                delivered.clear()
+        
+        async def deliver(user_id: int):
+            async with slots:
+                try:
+                    user = await self.user_resolver.resolve(user_id)
+                    await self.dm_scheduler.send(user, content, file_factory, key=watermark_id)
+                except discord.Forbidden:
+                    failed.append(f"User {user_id} (DMs disabled)")
+                    return
+                except discord.NotFound:
+                    failed.append(f"User {user_id} (not found)")
+                    return
+                except Exception as e:
+                    failed.append(f"User {user_id} ({str(e)})")
+                    return
+            
+            sent.append(user.display_name)
+            delivered.append(user_id)
+            if len(delivered) >= self.claim_batch:
+                record_claims()
+        
+        async def report_progress(total: int):
+            while True:
+                await asyncio.sleep(self.progress_interval)
+                try:
+                    await on_progress(len(sent), len(failed), total)
+                except Exception as e:
+                    print(f"Error reporting campaign progress: {e}")
+        
+        # Duplicates in the pasted list would otherwise get the content twice
+        recipients = list(dict.fromkeys(user_ids))
+        reporter = asyncio.create_task(report_progress(len(recipients))) if on_progress else None
+        try:
+            await asyncio.gather(*[deliver(user_id) for user_id in recipients])
+        finally:
+            if reporter is not None:
+                reporter.cancel()
+        record_claims()
+        
+        return {'sent': sent, 'failed': failed}
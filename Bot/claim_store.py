@@ -0,0 +1,428 @@
+"""
+In-memory reveal claim index with an append-only journal and time-bucketed rollups
+"""
+
+import asyncio
+import json
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+# Bucket width and how long buckets are kept (None = forever)
+ROLLUP_RESOLUTIONS = {'minute': (60, 2 * 86400), 'hour': (3600, 90 * 86400), 'day': (86400, None)}
+ALL_CONTENT = '*'
+FIRST_DAY_SECONDS = 86400
+
+class ClaimStore:
+    """Claims live in per-watermark sets; each new claim is one journal line, folded into the snapshot on compaction"""
+    def __init__(self, claims_file: str = "data/reveal_claims.json", journal_file: str = "data/reveal_claims.journal",
+                 rollups_file: str = "data/claim_rollups.json", events_file: str = "data/claim_events.jsonl",
+                 flush_interval: float = 0.5, flush_batch: int = 64,
+                 compact_interval: float = 300, compact_threshold: int = 10000, top_k: int = 25):
+        self.claims_file = claims_file
+        self.journal_file = journal_file
+        self.rollups_file = rollups_file
+        self.events_file = events_file
+        self.flush_interval = flush_interval
+        self.flush_batch = flush_batch
+        self.compact_interval = compact_interval
+        self.compact_threshold = compact_threshold
+        
+        self.claims: Dict[str, set] = {}
+        self.total = 0
+        # Most-claimed watermarks; counts only grow, so nothing outside can overtake without passing the minimum
+        self.top_k = top_k
+        self.top: Dict[str, int] = {}
+        # Deleted content keeps its claims for tracing but drops out of the ranking
+        self.forgotten: set = set()
+        # resolution -> watermark ID (or ALL_CONTENT) -> bucket start -> claims
+        self.rollups: Dict[str, Dict[str, Dict[int, int]]] = {resolution: {} for resolution in ROLLUP_RESOLUTIONS}
+        # watermark ID -> [first claim ts, latest claim ts, claims within a day of the first (None = not known yet)]
+        self.claim_windows: Dict[str, list] = {}
+        # Every event gets a sequence number; the rollups file records the last one it includes
+        self.seq = 0
+        self.pending: List[str] = []
+        self.journal_entries = 0
+        # How far a reading process (the dashboard) has followed the journal and the events archive
+        self.journal_offset = 0
+        self.journal_head = b""
+        self.events_offset = 0
+        self.last_compaction = time.monotonic()
+        
+        # _state guards the sets and pending lines; _io serializes journal and snapshot writes
+        self._state = threading.Lock()
+        self._io = threading.Lock()
+        self.flush_needed = None
+        self.flusher_task = None
+        
+        os.makedirs(os.path.dirname(self.claims_file), exist_ok=True)
+        self.load()
+    
+    def load(self):
+        """Load the snapshot and replay the journal on top of it"""
+        try:
+            if os.path.exists(self.claims_file):
+                with open(self.claims_file, 'r') as f:
+                    for watermark_id, user_ids in json.load(f).items():
+                        self.claims[watermark_id] = set(str(user_id) for user_id in user_ids)
+        except Exception as e:
+            print(f"Error loading reveal claims: {e}")
+        
+        rolled_up_seq = 0
+        try:
+            if os.path.exists(self.rollups_file):
+                with open(self.rollups_file, 'r') as f:
+                    saved = json.load(f)
+                rolled_up_seq = saved.get('seq', 0)
+                self.claim_windows = saved.get('windows', {})
+                for window in self.claim_windows.values():
+                    if len(window) < 3:
+                        # Saved before the first-day count was kept; get_first_day_claims fills it in from the archive
+                        window.append(None)
+                for resolution in ROLLUP_RESOLUTIONS:
+                    self.rollups[resolution] = {
+                        key: {int(bucket): count for bucket, count in buckets.items()}
+                        for key, buckets in saved.get(resolution, {}).items()
+                    }
+        except Exception as e:
+            print(f"Error loading claim rollups: {e}")
+        self.seq = rolled_up_seq
+        
+        if os.path.exists(self.events_file):
+            self.events_offset = os.path.getsize(self.events_file)
+        
+        if os.path.exists(self.journal_file):
+            with open(self.journal_file, 'rb') as f:
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        # Torn by a crash, or still being written by the bot; refresh() picks it up once complete
+                        break
+                    if not self.journal_offset:
+                        self.journal_head = line
+                    self.journal_offset += len(line)
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue
+                    self.claims.setdefault(entry['watermark_id'], set()).add(str(entry['user_id']))
+                    self.journal_entries += 1
+                    
+                    # Events already in the saved rollups (compaction interrupted before truncating) aren't counted twice
+                    seq = entry.get('seq', 0)
+                    if seq > rolled_up_seq and 'ts' in entry:
+                        self._roll_up(entry['watermark_id'], entry['ts'])
+                    self.seq = max(self.seq, seq)
+        
+        self.total = sum(len(user_ids) for user_ids in self.claims.values())
+        self._fill_top()
+    
+    def refresh(self):
+        """Apply claims the bot journaled since the last call, for a process that only reads (the dashboard)"""
+        try:
+            with open(self.journal_file, 'rb') as f:
+                head = f.readline()
+                if not head.endswith(b"\n"):
+                    head = b""
+                if head != self.journal_head:
+                    # Compacted since the last call: the lines we hadn't read yet were archived first
+                    self._apply_lines(self._read_from(self.events_file, self.events_offset, 'events_offset'))
+                    self.journal_head = head
+                    self.journal_offset = 0
+        except FileNotFoundError:
+            return
+        self._apply_lines(self._read_from(self.journal_file, self.journal_offset, 'journal_offset'))
+    
+    def _read_from(self, path: str, offset: int, offset_attr: str) -> bytes:
+        """Complete lines appended to path after offset; advances the named offset past them"""
+        try:
+            with open(path, 'rb') as f:
+                f.seek(offset)
+                data = f.read()
+        except FileNotFoundError:
+            return b""
+        data = data[:data.rfind(b"\n") + 1]
+        setattr(self, offset_attr, offset + len(data))
+        return data
+    
+    def _apply_lines(self, data: bytes):
+        with self._state:
+            for line in data.splitlines():
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                # Sequence numbers make re-reading an event harmless
+                seq = entry.get('seq', 0)
+                if seq and seq <= self.seq:
+                    continue
+                self.seq = max(self.seq, seq)
+                
+                watermark_id = entry['watermark_id']
+                claimed = self.claims.setdefault(watermark_id, set())
+                user_id = str(entry['user_id'])
+                if user_id not in claimed:
+                    claimed.add(user_id)
+                    self.total += 1
+                    self._update_top(watermark_id, len(claimed))
+                if 'ts' in entry:
+                    self._roll_up(watermark_id, entry['ts'])
+    
+    def claim(self, watermark_id: str, user_id, source: str = "button") -> bool:
+        """Record a claim, returns False if the user had already claimed this content"""
+        return self.add_claims(watermark_id, [user_id], source) == 1
+    
+    def add_claims(self, watermark_id: str, user_ids, source: str = "bulk") -> int:
+        """Record a batch of claims in one go, returns how many were new. source is button, send_dm or bulk."""
+        added = 0
+        now = time.time()
+        with self._state:
+            claimed = self.claims.setdefault(watermark_id, set())
+            for user_id in user_ids:
+                user_id = str(user_id)
+                if user_id in claimed:
+                    continue
+                claimed.add(user_id)
+                self.seq += 1
+                self.pending.append(json.dumps({
+                    'seq': self.seq, 'ts': now, 'watermark_id': watermark_id, 'user_id': user_id, 'source': source
+                }) + "\n")
+                self._roll_up(watermark_id, now)
+                added += 1
+            self.total += added
+            if added:
+                self._update_top(watermark_id, len(claimed))
+            batch_ready = len(self.pending) >= self.flush_batch
+        
+        if batch_ready and self.flush_needed is not None:
+            self.flush_needed.set()
+        return added
+    
+    def _update_top(self, watermark_id: str, count: int):
+        if watermark_id in self.forgotten:
+            return
+        if watermark_id in self.top or len(self.top) < self.top_k:
+            self.top[watermark_id] = count
+            return
+        lowest = min(self.top, key=self.top.get)
+        if count > self.top[lowest]:
+            del self.top[lowest]
+            self.top[watermark_id] = count
+    
+    def _fill_top(self):
+        """Offer every watermark outside the ranking to it, filling slots freed by forget()"""
+        for watermark_id, user_ids in self.claims.items():
+            if watermark_id not in self.top and user_ids:
+                self._update_top(watermark_id, len(user_ids))
+    
+    def forget(self, watermark_id: str):
+        """Drop deleted content from the most-claimed ranking; its claims stay for /trace"""
+        with self._state:
+            self.forgotten.add(watermark_id)
+            if self.top.pop(watermark_id, None) is not None:
+                self._fill_top()
+    
+    def _roll_up(self, watermark_id: str, ts: float):
+        for resolution, (width, _) in ROLLUP_RESOLUTIONS.items():
+            bucket = int(ts // width * width)
+            for key in (watermark_id, ALL_CONTENT):
+                buckets = self.rollups[resolution].setdefault(key, {})
+                buckets[bucket] = buckets.get(bucket, 0) + 1
+        
+        window = self.claim_windows.get(watermark_id)
+        if window is None:
+            self.claim_windows[watermark_id] = [ts, ts, 1]
+            return
+        
+        if ts < window[0]:
+            # An older event replayed late moves the first-day window; recount it from the archive
+            window[0] = ts
+            window[2] = None
+        elif window[2] is not None and ts < window[0] + FIRST_DAY_SECONDS:
+            window[2] += 1
+        window[1] = max(window[1], ts)
+    
+    def _prune_rollups(self, now: float):
+        for resolution, (_, retention) in ROLLUP_RESOLUTIONS.items():
+            if retention is None:
+                continue
+            cutoff = now - retention
+            for key in list(self.rollups[resolution]):
+                buckets = {bucket: count for bucket, count in self.rollups[resolution][key].items() if bucket >= cutoff}
+                if buckets:
+                    self.rollups[resolution][key] = buckets
+                else:
+                    del self.rollups[resolution][key]
+    
+    def get_claim_curve(self, watermark_id: str = ALL_CONTENT, resolution: str = 'hour',
+                        since: Optional[float] = None) -> List[Tuple[int, int]]:
+        """(bucket start, claims) pairs in time order; ALL_CONTENT gives totals across every reveal"""
+        with self._state:
+            buckets = list(self.rollups[resolution].get(watermark_id, {}).items())
+        if since is not None:
+            buckets = [(bucket, count) for bucket, count in buckets if bucket >= since]
+        return sorted(buckets)
+    
+    def get_claims_in_bucket(self, ts: float, resolution: str = 'day', watermark_id: str = ALL_CONTENT) -> int:
+        """Claims in the bucket containing ts, e.g. today's claims"""
+        width = ROLLUP_RESOLUTIONS[resolution][0]
+        return self.rollups[resolution].get(watermark_id, {}).get(int(ts // width * width), 0)
+    
+    def get_claim_window(self, watermark_id: str) -> Optional[Tuple[float, float]]:
+        """Timestamps of the first and latest recorded claim"""
+        window = self.claim_windows.get(watermark_id)
+        return (window[0], window[1]) if window else None
+    
+    def get_first_day_claims(self, watermark_id: str) -> int:
+        """Claims within 24 hours of the first one; kept with the window, so it outlives the hourly rollups"""
+        with self._state:
+            window = self.claim_windows.get(watermark_id)
+            if window is None:
+                return 0
+            if window[2] is not None:
+                return window[2]
+            first = window[0]
+            pending = list(self.pending)
+        
+        count = self._count_events(watermark_id, first, first + FIRST_DAY_SECONDS, pending)
+        with self._state:
+            if window[0] == first:
+                window[2] = count
+        return count
+    
+    def _count_events(self, watermark_id: str, start: float, end: float, pending: List[str]) -> int:
+        """Count a watermark's claim events with start <= ts < end in the archive, the journal and unflushed lines"""
+        counted = set()
+        
+        def scan(lines):
+            for line in lines:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                if entry.get('watermark_id') == watermark_id and start <= entry.get('ts', -1) < end:
+                    # seq tells apart an event archived twice by an interrupted compaction
+                    counted.add(entry.get('seq') or (entry['user_id'], entry['ts']))
+        
+        with self._io:
+            for path in (self.events_file, self.journal_file):
+                try:
+                    with open(path, 'rb') as f:
+                        scan(f)
+                except FileNotFoundError:
+                    continue
+        scan(pending)
+        return len(counted)
+    
+    def get_top(self, limit: int = 10) -> List[Tuple[str, int]]:
+        """Most-claimed watermarks as (watermark_id, count), highest first"""
+        with self._state:
+            ranked = sorted(self.top.items(), key=lambda item: (item[1], item[0]), reverse=True)
+        return ranked[:limit]
+    
+    def has_claimed(self, watermark_id: str, user_id) -> bool:
+        return str(user_id) in self.claims.get(watermark_id, ())
+    
+    def get_claims(self, watermark_id: str) -> List[str]:
+        """User IDs (as strings) that claimed a watermark"""
+        with self._state:
+            return list(self.claims.get(watermark_id, ()))
+    
+    def get_claim_count(self, watermark_id: str) -> int:
+        return len(self.claims.get(watermark_id, ()))
+    
+    def get_total_claims(self) -> int:
+        return self.total
+    
+    def get_all_claims(self) -> Dict[str, List[str]]:
+        with self._state:
+            return {watermark_id: list(user_ids) for watermark_id, user_ids in self.claims.items()}
+    
+    def flush(self):
+        """Append pending claims to the journal and fsync them in one go"""
+        with self._io:
+            with self._state:
+                lines, self.pending = self.pending, []
+            self._write_journal(lines)
+    
+    def _write_journal(self, lines: List[str]):
+        if not lines:
+            return
+        with open(self.journal_file, 'a') as f:
+            f.writelines(lines)
+            f.flush()
+            os.fsync(f.fileno())
+        self.journal_entries += len(lines)
+    
+    def compact(self):
+        """Fold the journal into reveal_claims.json and the rollups file, archive its events and start a fresh journal"""
+        with self._io:
+            with self._state:
+                lines, self.pending = self.pending, []
+                snapshot = {watermark_id: sorted(user_ids) for watermark_id, user_ids in self.claims.items()}
+                self._prune_rollups(time.time())
+                rollups = {
+                    resolution: {key: dict(buckets) for key, buckets in by_key.items()}
+                    for resolution, by_key in self.rollups.items()
+                }
+                rollups['windows'] = {watermark_id: list(window) for watermark_id, window in self.claim_windows.items()}
+                rollups['seq'] = self.seq
+            
+            # Journal first so a crash before the snapshot lands loses nothing
+            self._write_journal(lines)
+            
+            # Rollups before the snapshot: their seq tells a replay which journal events they already count
+            self._write_atomic(self.rollups_file, rollups)
+            self._write_atomic(self.claims_file, snapshot, indent=2)
+            
+            # Keep the raw events; a crash right here can only duplicate them, and seq tells duplicates apart
+            if os.path.exists(self.journal_file) and os.path.getsize(self.journal_file):
+                with open(self.journal_file, 'rb') as source, open(self.events_file, 'ab') as archive:
+                    archive.write(source.read())
+                    archive.flush()
+                    os.fsync(archive.fileno())
+            
+            # Everything journaled so far is in the snapshot now
+            open(self.journal_file, 'w').close()
+            self.journal_entries = 0
+            self.last_compaction = time.monotonic()
+    
+    def _write_atomic(self, path: str, data, indent: Optional[int] = None):
+        temp_file = path + ".tmp"
+        with open(temp_file, 'w') as f:
+            json.dump(data, f, indent=indent)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_file, path)
+    
+    def start(self):
+        """Start the background flusher on the running event loop"""
+        if self.flusher_task is not None:
+            return
+        self.flush_needed = asyncio.Event()
+        self.flusher_task = asyncio.create_task(self._flusher())
+    
+    async def stop(self):
+        if self.flusher_task is not None:
+            self.flusher_task.cancel()
+            await asyncio.gather(self.flusher_task, return_exceptions=True)
+            self.flusher_task = None
+        await asyncio.to_thread(self.compact)
+    
+    async def _flusher(self):
+        while True:
+            try:
+                await asyncio.wait_for(self.flush_needed.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self.flush_needed.clear()
+            
+            try:
+                # fsync blocks, keep it off the event loop
+                await asyncio.to_thread(self.flush)
+                
+                due = time.monotonic() - self.last_compaction >= self.compact_interval
+                if self.journal_entries and (due or self.journal_entries >= self.compact_threshold):
+                    await asyncio.to_thread(self.compact)
+            except Exception as e:
+                print(f"Error writing reveal claims: {e}")
@@ -0,0 +1,249 @@
+"""
+Rate-limit-aware delivery scheduler for direct messages
+"""
+
+import asyncio
+import inspect
+import time
+from collections import OrderedDict, deque
+from typing import Awaitable, Callable, Dict, Optional, Union
+import discord
+
+# Builds a fresh attachment per send attempt; may be async to produce it only when the DM goes out
+FileFactory = Callable[[], Union[discord.File, Awaitable[discord.File]]]
+
+class TokenBucket:
+    """Paces sends at `rate` per second with room for a small burst"""
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+    
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+    
+    async def acquire(self):
+        while True:
+            now = time.monotonic()
+            if now < self.blocked_until:
+                await asyncio.sleep(self.blocked_until - now)
+                continue
+            
+            self._refill(now)
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+    
+    def block(self, seconds: float):
+        """Hold every send until Discord's retry-after has passed, and drop the saved-up burst"""
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+        # Refill from the end of the block, or the blocked time would hand the burst straight back
+        self.tokens = 0
+        self.updated = self.blocked_until
+
+class DMRequest:
+    def __init__(self, user, content: Optional[str], file_factory: Optional[FileFactory], key: str):
+        self.user = user
+        self.content = content
+        self.file_factory = file_factory
+        self.key = key
+        self.attempts = 0
+        self.submitted = time.monotonic()
+        self.future = asyncio.get_running_loop().create_future()
+
+class DMScheduler:
+    """Every DM goes through here: one token bucket, bounded concurrency, round-robin between reveals.
+    
+    The pace is static. discord.py sleeps through 429s inside its HTTP client and only raises
+    once it gives up (or the wait exceeds the client's max_ratelimit_timeout), so those are the
+    only rate limits seen here; they pause all sends for the retry-after.
+    """
+    def __init__(self, delay_seconds: float = 1.0, burst: int = 5, max_concurrency: int = 4,
+                 max_retries: int = 3, history_size: int = 200):
+        self.bucket = TokenBucket(1 / delay_seconds if delay_seconds > 0 else 50.0, max(1, burst))
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_retries = max_retries
+        
+        # One FIFO per key (usually a watermark ID) so a big reveal can't starve a small one
+        self.queues: "OrderedDict[str, deque]" = OrderedDict()
+        self.queued = 0
+        self.in_flight = 0
+        self.slots = None
+        self.work_available = None
+        self.dispatcher_task = None
+        self.delivery_tasks = set()
+        
+        self.sent = 0
+        self.failed = 0
+        self.retried = 0
+        self.rate_limited = 0
+        self.latencies = deque(maxlen=history_size)
+    
+    def start(self):
+        """Start the dispatcher on the running event loop"""
+        if self.dispatcher_task is not None:
+            return
+        self.slots = asyncio.Semaphore(self.max_concurrency)
+        self.work_available = asyncio.Event()
+        if self.queued:
+            self.work_available.set()
+        self.dispatcher_task = asyncio.create_task(self._dispatch())
+    
+    async def stop(self):
+        if self.dispatcher_task is not None:
+            self.dispatcher_task.cancel()
+            await asyncio.gather(self.dispatcher_task, return_exceptions=True)
+            self.dispatcher_task = None
+    
+    def submit(self, user, content: Optional[str] = None, file_factory: Optional[FileFactory] = None,
+               key: str = "default") -> asyncio.Future:
+        """Queue a DM, returns a future for the sent message. file_factory builds a fresh discord.File per attempt,
+        directly or as an awaitable."""
+        request = DMRequest(user, content, file_factory, key)
+        self._enqueue(request)
+        self.start()
+        return request.future
+    
+    async def send(self, user, content: Optional[str] = None, file_factory: Optional[FileFactory] = None,
+                   key: str = "default") -> discord.Message:
+        """Queue a DM and wait until it has been delivered; Discord errors are raised as usual"""
+        return await self.submit(user, content, file_factory, key)
+    
+    def _enqueue(self, request: DMRequest, front: bool = False):
+        queue = self.queues.get(request.key)
+        if queue is None:
+            queue = self.queues[request.key] = deque()
+        if front:
+            queue.appendleft(request)
+        else:
+            queue.append(request)
+        self.queued += 1
+        if self.work_available is not None:
+            self.work_available.set()
+    
+    def _next_request(self) -> Optional[DMRequest]:
+        """Take from the key at the head of the rotation, then move that key to the back"""
+        while self.queues:
+            key, queue = next(iter(self.queues.items()))
+            if not queue:
+                del self.queues[key]
+                continue
+            request = queue.popleft()
+            self.queued -= 1
+            if queue:
+                self.queues.move_to_end(key)
+            else:
+                del self.queues[key]
+            return request
+        return None
+    
+    async def _dispatch(self):
+        while True:
+            if not self.queued:
+                self.work_available.clear()
+                await self.work_available.wait()
+                continue
+            
+            await self.slots.acquire()
+            await self.bucket.acquire()
+            
+            request = self._next_request()
+            if request is None:
+                self.slots.release()
+                continue
+            
+            self.in_flight += 1
+            task = asyncio.create_task(self._deliver(request))
+            self.delivery_tasks.add(task)
+            task.add_done_callback(self.delivery_tasks.discard)
+    
+    async def _deliver(self, request: DMRequest):
+        retry_after = None
+        throttled = False
+        error = None
+        try:
+            request.attempts += 1
+            file = request.file_factory() if request.file_factory else None
+            if inspect.isawaitable(file):
+                file = await file
+            if file is not None:
+                message = await request.user.send(content=request.content, file=file)
+            else:
+                message = await request.user.send(content=request.content)
+            
+            self.sent += 1
+            self.latencies.append(time.monotonic() - request.submitted)
+            if not request.future.done():
+                request.future.set_result(message)
+        except discord.RateLimited as e:
+            error, retry_after, throttled = e, e.retry_after, True
+        except discord.HTTPException as e:
+            error = e
+            if e.status == 429:
+                retry_after, throttled = self._retry_after(e), True
+            elif e.status >= 500:
+                retry_after = min(2 ** request.attempts, 30)
+        except Exception as e:
+            error = e
+        finally:
+            self.in_flight -= 1
+            self.slots.release()
+        
+        if error is None:
+            return
+        if retry_after is None or request.attempts > self.max_retries:
+            self._fail(request, error)
+            return
+        
+        self.retried += 1
+        if throttled:
+            self._on_rate_limited(retry_after)
+            # Back to the front of its own queue so ordering within a reveal is kept
+            self._enqueue(request, front=True)
+        else:
+            # Server error: back off this one message without slowing everyone else
+            await asyncio.sleep(retry_after)
+            self._enqueue(request, front=True)
+    
+    def _retry_after(self, error: discord.HTTPException) -> float:
+        """Read the wait from the 429's headers, falling back to the JSON body and then one second"""
+        headers = getattr(error.response, 'headers', None) or {}
+        for header in ('Retry-After', 'X-RateLimit-Reset-After'):
+            try:
+                return float(headers[header])
+            except (KeyError, TypeError, ValueError):
+                continue
+        try:
+            return float(error.retry_after)
+        except (AttributeError, TypeError, ValueError):
+            return 1.0
+    
+    def _on_rate_limited(self, retry_after: float):
+        self.rate_limited += 1
+        self.bucket.block(retry_after)
+    
+    def _fail(self, request: DMRequest, error: Exception):
+        self.failed += 1
+        self.latencies.append(time.monotonic() - request.submitted)
+        if not request.future.done():
+            request.future.set_exception(error)
+    
+    def get_stats(self) -> Dict:
+        """Get queue depth, in-flight sends, current pace and delivery latency"""
+        latencies = sorted(self.latencies)
+        return {
+            'queue_depth': self.queued,
+            'in_flight': self.in_flight,
+            'queued_by_key': {key: len(queue) for key, queue in self.queues.items()},
+            'rate_per_second': self.bucket.rate,
+            'sent': self.sent,
+            'failed': self.failed,
+            'retried': self.retried,
+            'rate_limited': self.rate_limited,
+            'avg_latency_seconds': sum(latencies) / len(latencies) if latencies else 0.0,
+            'p95_latency_seconds': latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] if latencies else 0.0
+        }
@@ -0,0 +1,93 @@
+"""
+Streaming downloads for content URLs submitted through /upload
+"""
+
+import os
+import tempfile
+from typing import Optional, Tuple
+import aiohttp
+
+class DownloadError(Exception):
+    """Raised when a URL can't be downloaded or isn't acceptable content"""
+
+def sniff_extension(head: bytes) -> Optional[str]:
+    """Identify a supported format from the first bytes of a file"""
+    if head.startswith(b'\xff\xd8\xff'):
+        return '.jpg'
+    if head.startswith(b'\x89PNG\r\n\x1a\n'):
+        return '.png'
+    if head[4:8] == b'ftyp':
+        # QuickTime brand is 'qt  ', everything else in the ISO family plays as mp4
+        return '.mov' if head[8:12] == b'qt  ' else '.mp4'
+    if head[:4] == b'RIFF' and head[8:12] == b'AVI ':
+        return '.avi'
+    return None
+
+class Downloader:
+    SNIFF_BYTES = 12
+    
+    def __init__(self, max_bytes: int, chunk_size: int = 256 * 1024, timeout: int = 30, max_connections: int = 10):
+        self.max_bytes = max_bytes
+        self.chunk_size = chunk_size
+        self.timeout = timeout
+        self.max_connections = max_connections
+        self.session = None
+    
+    async def get_session(self) -> aiohttp.ClientSession:
+        """Shared session so repeated uploads reuse pooled connections"""
+        if self.session is None or self.session.closed:
+            self.session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.max_connections),
+                # No total deadline: large videos may take a while, but a stalled socket may not
+                timeout=aiohttp.ClientTimeout(total=None, sock_connect=self.timeout, sock_read=self.timeout)
+            )
+        return self.session
+    
+    async def close(self):
+        if self.session is not None and not self.session.closed:
+            await self.session.close()
+    
+    async def download(self, url: str) -> Tuple[str, str]:
+        """Stream a URL into a temp file, returns (temp_path, extension)"""
+        session = await self.get_session()
+        max_mb = self.max_bytes // (1024 * 1024)
+        
+        async with session.get(url) as response:
+            if response.status >= 400:
+                raise DownloadError(f"Server returned HTTP {response.status}")
+            
+            # Reject early when the server tells us the size up front
+            if response.content_length is not None and response.content_length > self.max_bytes:
+                raise DownloadError(f"File is larger than the {max_mb}MB limit")
+            
+            # Read just enough to identify the format before writing anything
+            head = b''
+            while len(head) < self.SNIFF_BYTES:
+                chunk = await response.content.read(self.chunk_size)
+                if not chunk:
+                    break
+                head += chunk
+            
+            file_ext = sniff_extension(head)
+            if file_ext is None:
+                raise DownloadError("Unsupported file format (expected JPG, PNG, MP4, MOV or AVI)")
+            
+            fd, temp_path = tempfile.mkstemp(suffix=file_ext)
+            try:
+                received = len(head)
+                with os.fdopen(fd, 'wb') as temp_file:
+                    temp_file.write(head)
+                    async for chunk in response.content.iter_chunked(self.chunk_size):
+                        received += len(chunk)
+                        # Content-Length can be missing or wrong, so count as we go
+                        if received > self.max_bytes:
+                            raise DownloadError(f"File is larger than the {max_mb}MB limit")
+                        temp_file.write(chunk)
+            except BaseException:
+                try:
+                    os.unlink(temp_path)
+                except OSError:
+                    pass
+                raise
+        
+        return temp_path, file_ext
@@ -0,0 +1,52 @@
+"""
+Change detection and locking for data files shared by the bot and the dashboard
+"""
+
+import os
+from contextlib import contextmanager
+from typing import Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:
+    # Not available on Windows; writes there fall back to the atomic replace alone
+    fcntl = None
+
+class FileWatch:
+    """Remembers a file's inode, size and mtime and reports when another process has changed it"""
+    def __init__(self, path: str):
+        self.path = path
+        self.signature = self._signature()
+    
+    def _signature(self) -> Optional[Tuple[int, int, int]]:
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        # An atomic replace gives a new inode even when size and mtime happen to match
+        return (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+    
+    def changed(self) -> bool:
+        """True once per change since the last call (or the last mark)"""
+        signature = self._signature()
+        if signature == self.signature:
+            return False
+        self.signature = signature
+        return True
+    
+    def mark(self):
+        """Record our own write so it isn't reported back as someone else's change"""
+        self.signature = self._signature()
+
+@contextmanager
+def locked(path: str):
+    """Exclusive lock held across processes for a read-modify-write of path"""
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path + ".lock", 'a') as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
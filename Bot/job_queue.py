@@ -0,0 +1,248 @@
+"""
+Persistent watermark job queue backed by SQLite
+"""
+
+import asyncio
+import json
+import os
+import shutil
+import sqlite3
+import time
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, Optional
+from .render_pool import is_transient_error
+
+class JobQueue:
+    def __init__(self, watermark_processor, db_path: str = "data/jobs.db", spool_dir: str = "data/jobs",
+                 workers: int = 2, max_attempts: int = 3, retry_delay: float = 10.0, max_retry_delay: float = 600.0):
+        self.watermark_processor = watermark_processor
+        self.db_path = db_path
+        self.spool_dir = spool_dir
+        self.worker_count = max(1, workers)
+        self.max_attempts = max(1, max_attempts)
+        self.retry_delay = max(0.0, retry_delay)
+        self.max_retry_delay = max(self.retry_delay, max_retry_delay)
+        self.on_finished: Optional[Callable[[Dict, Dict], Awaitable[None]]] = None
+        self.waiters = {}
+        self.worker_tasks = []
+        self.wakeup = None
+        self.ensure_directories()
+        self.init_db()
+    
+    def ensure_directories(self):
+        """Ensure required directories exist"""
+        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        os.makedirs(self.spool_dir, exist_ok=True)
+    
+    def init_db(self):
+        """Open the job database and create the schema"""
+        self.db = sqlite3.connect(self.db_path, check_same_thread=False)
+        self.db.row_factory = sqlite3.Row
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                status TEXT NOT NULL,
+                priority INTEGER NOT NULL DEFAULT 0,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                max_attempts INTEGER NOT NULL,
+                file_path TEXT NOT NULL,
+                description TEXT,
+                original_filename TEXT,
+                requester_id INTEGER,
+                result TEXT,
+                error TEXT,
+                not_before REAL NOT NULL DEFAULT 0,
+                created_at TEXT NOT NULL,
+                updated_at TEXT NOT NULL
+            )
+        """)
+        # Databases from before retry backoff lack the column
+        columns = {row['name'] for row in self.db.execute("PRAGMA table_info(jobs)")}
+        if 'not_before' not in columns:
+            self.db.execute("ALTER TABLE jobs ADD COLUMN not_before REAL NOT NULL DEFAULT 0")
+        self.db.execute("CREATE INDEX IF NOT EXISTS idx_jobs_pending ON jobs(status, priority DESC, id)")
+        self.db.commit()
+    
+    def submit(self, file_path: str, description: str, original_filename: Optional[str] = None,
+               requester_id: Optional[int] = None, priority: int = 0) -> int:
+        """Queue a file for watermarking, returns the job ID. The file is moved into the spool directory."""
+        # Own the input so it survives restarts and the caller's temp cleanup
+        spooled_path = os.path.join(self.spool_dir, f"{datetime.now().strftime('%Y%m%d%H%M%S%f')}_{os.path.basename(file_path)}")
+        shutil.move(file_path, spooled_path)
+        
+        now = datetime.now().isoformat()
+        cursor = self.db.execute(
+            """INSERT INTO jobs (status, priority, max_attempts, file_path, description, original_filename, requester_id, created_at, updated_at)
+               VALUES ('queued', ?, ?, ?, ?, ?, ?, ?, ?)""",
+            (priority, self.max_attempts, spooled_path, description, original_filename, requester_id, now, now)
+        )
+        self.db.commit()
+        job_id = cursor.lastrowid
+        
+        # Register the waiter now so a fast worker can't finish before wait() is called
+        try:
+            self.waiters[job_id] = asyncio.get_running_loop().create_future()
+        except RuntimeError:
+            pass
+        
+        if self.wakeup is not None:
+            self.wakeup.set()
+        return job_id
+    
+    async def wait(self, job_id: int) -> Dict:
+        """Wait for a job submitted by this process to finish"""
+        job = self.get_job(job_id)
+        if job and job['status'] in ('done', 'failed'):
+            return self._job_result(job)
+        
+        future = self.waiters.get(job_id)
+        if future is None:
+            future = asyncio.get_running_loop().create_future()
+            self.waiters[job_id] = future
+        return await asyncio.shield(future)
+    
+    def get_job(self, job_id: int) -> Optional[Dict]:
+        row = self.db.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return dict(row) if row else None
+    
+    def get_position(self, job_id: int) -> int:
+        """Number of queued jobs that will run before this one"""
+        job = self.get_job(job_id)
+        if not job or job['status'] != 'queued':
+            return 0
+        row = self.db.execute(
+            "SELECT COUNT(*) FROM jobs WHERE status = 'queued' AND (priority > ? OR (priority = ? AND id < ?))",
+            (job['priority'], job['priority'], job_id)
+        ).fetchone()
+        return row[0]
+    
+    def get_stats(self) -> Dict:
+        """Get job counts per state and the number of render workers"""
+        counts = {status: count for status, count in self.db.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status")}
+        return {
+            'workers': self.worker_count,
+            'queued': counts.get('queued', 0),
+            'running': counts.get('running', 0),
+            'done': counts.get('done', 0),
+            'failed': counts.get('failed', 0)
+        }
+    
+    def start(self):
+        """Resume unfinished jobs and start the render workers"""
+        if self.worker_tasks:
+            return
+        
+        # Anything left running belonged to a previous process that died mid-render
+        resumed = self.db.execute(
+            "UPDATE jobs SET status = 'queued', updated_at = ? WHERE status = 'running'",
+            (datetime.now().isoformat(),)
+        ).rowcount
+        self.db.commit()
+        if resumed:
+            print(f"Resuming {resumed} interrupted watermark job(s)")
+        
+        self.wakeup = asyncio.Event()
+        self.wakeup.set()
+        self.worker_tasks = [asyncio.create_task(self._worker()) for _ in range(self.worker_count)]
+    
+    async def stop(self):
+        for task in self.worker_tasks:
+            task.cancel()
+        await asyncio.gather(*self.worker_tasks, return_exceptions=True)
+        self.worker_tasks = []
+    
+    def _claim_next(self) -> Optional[Dict]:
+        """Mark the highest-priority queued job that is due as running and return it"""
+        row = self.db.execute(
+            "SELECT * FROM jobs WHERE status = 'queued' AND not_before <= ? ORDER BY priority DESC, id LIMIT 1",
+            (time.time(),)
+        ).fetchone()
+        if row is None:
+            return None
+        
+        self.db.execute(
+            "UPDATE jobs SET status = 'running', attempts = attempts + 1, updated_at = ? WHERE id = ?",
+            (datetime.now().isoformat(), row['id'])
+        )
+        self.db.commit()
+        return self.get_job(row['id'])
+    
+    def _next_due(self) -> Optional[float]:
+        """Seconds until the earliest backed-off retry is due, None if nothing is waiting on one"""
+        row = self.db.execute("SELECT MIN(not_before) FROM jobs WHERE status = 'queued'").fetchone()
+        if row[0] is None:
+            return None
+        return max(0.0, row[0] - time.time())
+    
+    async def _worker(self):
+        while True:
+            job = self._claim_next()
+            if job is None:
+                self.wakeup.clear()
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), timeout=self._next_due())
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            
+            try:
+                result = await self.watermark_processor.process_file(
+                    job['file_path'], job['description'], original_filename=job['original_filename']
+                )
+            except asyncio.CancelledError:
+                # Shutting down: leave it for the next start() to resume
+                raise
+            except Exception as e:
+                result = {'status': 'error', 'error': str(e), 'transient': is_transient_error(e)}
+            
+            await self._complete(job, result)
+    
+    async def _complete(self, job: Dict, result: Dict):
+        now = datetime.now().isoformat()
+        # Exponential backoff so a job that always fails doesn't burn its attempts back to back
+        retry_in = min(self.max_retry_delay, self.retry_delay * 2 ** (job['attempts'] - 1))
+        
+        # Only a crashed worker or an I/O hiccup is worth another attempt; bad input fails the same way every time
+        if result.get('status') == 'success':
+            status = 'done'
+        elif result.get('transient') and job['attempts'] < job['max_attempts']:
+            status = 'queued'
+        else:
+            status = 'failed'
+        
+        self.db.execute(
+            "UPDATE jobs SET status = ?, result = ?, error = ?, not_before = ?, updated_at = ? WHERE id = ?",
+            (status, json.dumps(result), result.get('error'), time.time() + retry_in if status == 'queued' else 0, now, job['id'])
+        )
+        self.db.commit()
+        
+        if status == 'queued':
+            print(f"Watermark job {job['id']} failed (attempt {job['attempts']}), retrying in {retry_in:.0f}s: {result.get('error')}")
+            return
+        
+        try:
+            os.remove(job['file_path'])
+        except OSError:
+            pass
+        
+        job = self.get_job(job['id'])
+        future = self.waiters.pop(job['id'], None)
+        if future is not None and not future.done():
+            future.set_result(self._job_result(job))
+        elif self.on_finished is not None:
+            # Nobody in this process is waiting, e.g. the job was resumed after a restart
+            try:
+                await self.on_finished(job, self._job_result(job))
+            except Exception as e:
+                print(f"Error notifying uploader for job {job['id']}: {e}")
+    
+    def _job_result(self, job: Dict) -> Dict:
+        try:
+            result = json.loads(job['result']) if job['result'] else {}
+        except ValueError:
+            result = {}
+        if job['status'] == 'failed' and 'error' not in result:
+            result['error'] = job['error'] or 'Unknown error'
+        result['status'] = 'success' if job['status'] == 'done' else 'error'
+        return result
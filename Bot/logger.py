@@ -1,37 +1,484 @@
+"""
+Append-only, segmented delivery log
+"""
+
+import asyncio
+import gzip
 import json
 import os
-from datetime import datetime
-from typing import List, Dict, Optional
+import re
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter, deque
+from datetime import datetime, timezone
+from typing import Dict, Iterator, List, Optional, Tuple
 import discord
 
+SEGMENT_PATTERN = re.compile(r'^(\d{6})\.jsonl(\.gz)?$')
+MAX_EMBEDS_PER_MESSAGE = 10
+# Entries written before user IDs were stored separately only have "Name (1234)" strings
+LEGACY_USER_FIELDS = ('uploader', 'recipient', 'sender', 'user', 'admin')
+LEGACY_USER_ID = re.compile(r'\((\d+)\)\s*$')
+# Every Nth entry's timestamp is kept with its offset so time-range queries can seek close to the start
+TIME_INDEX_STRIDE = 256
+
+def entry_user_ids(entry: Dict) -> set:
+    """Every user ID an entry involves, as strings"""
+    user_ids = set()
+    for field, value in entry.items():
+        if field.endswith('_id') and field != 'watermark_id' and isinstance(value, int):
+            user_ids.add(str(value))
+    if not user_ids:
+        for field in LEGACY_USER_FIELDS:
+            match = LEGACY_USER_ID.search(str(entry.get(field, '')))
+            if match:
+                user_ids.add(match.group(1))
+    return user_ids
+
+def empty_index() -> Dict:
+    return {'watermark_id': {}, 'user_id': {}, 'time': [], 'last': None, 'entries': 0}
+
+def index_entry(segment_index: Dict, entry: Dict, offset: int):
+    """Add one entry at a byte offset to a segment's index"""
+    for field, keys in entry_index_keys(entry).items():
+        for key in keys:
+            segment_index[field].setdefault(key, []).append(offset)
+    
+    # Entries are appended in time order, so a segment's samples are sorted
+    timestamp = entry.get('timestamp')
+    if timestamp:
+        if segment_index['entries'] % TIME_INDEX_STRIDE == 0 or not segment_index['time']:
+            segment_index['time'].append([timestamp, offset])
+        segment_index['last'] = timestamp
+    segment_index['entries'] += 1
+
+def iso_utc(moment: Optional[datetime]) -> Optional[str]:
+    """Log timestamps are naive UTC ISO strings, which sort the same way as the times they encode"""
+    if moment is None:
+        return None
+    if moment.tzinfo is not None:
+        moment = moment.astimezone(timezone.utc).replace(tzinfo=None)
+    return moment.isoformat()
+
+def entry_index_keys(entry: Dict) -> Dict[str, set]:
+    watermark_id = entry.get('watermark_id')
+    return {
+        'watermark_id': {watermark_id} if watermark_id else set(),
+        'user_id': entry_user_ids(entry)
+    }
+
 class BotLogger:
-    def __init__(self):
-        self.delivery_log_file = "data/delivery_log.json"
+    """Entries are appended to numbered JSONL segments in data/logs; full segments are rotated out and gzipped"""
+    def __init__(self, log_dir: str = "data/logs", legacy_file: str = "data/delivery_log.json",
+                 max_recent: int = 1000, segment_bytes: int = 8 * 1024 * 1024, segment_seconds: float = 86400,
+                 flush_interval: float = 1.0, flush_batch: int = 100,
+                 channel_interval: float = 2.0, channel_max_queued: int = 500, read_only: bool = False):
+        self.log_dir = log_dir
+        # The dashboard follows the bot's log with refresh() and must never trim, compress or index files itself
+        self.read_only = read_only
+        self.delivery_log_file = legacy_file
+        self.segment_bytes = segment_bytes
+        self.segment_seconds = segment_seconds
+        self.flush_interval = flush_interval
+        self.flush_batch = flush_batch
         self.log_channel = None
+        
+        # Log channel embeds are posted in batches by a background task, never inline with the event
+        self.channel_interval = channel_interval
+        self.channel_max_queued = channel_max_queued
+        self.channel_embeds: List[discord.Embed] = []
+        # Embed titles counted instead of posted: backlog overflow and anything caught by a rate limit
+        self.channel_skipped: Counter = Counter()
+        self.channel_paused_until = 0.0
+        self.publisher_task = None
+        
+        # Newest entries in memory for the dashboard; the full history stays on disk
+        self.logs = deque(maxlen=max_recent)
+        # (line, entry) pairs waiting for the next flush, and the batch being written right now
+        self.pending: List[Tuple[str, Dict]] = []
+        self.writing: List[Tuple[str, Dict]] = []
+        # segment -> field -> key -> byte offsets of matching lines, plus sampled timestamps;
+        # sealed segments keep theirs in NNNNNN.idx.json
+        self.indexes: Dict[int, Dict] = {}
+        self.segment_index = 0
+        self.segment_bytes_written = 0
+        self.segment_started = time.time()
+        
+        # _state guards the recent entries, pending lines and indexes; _io serializes segment writes and rotation
+        self._state = threading.Lock()
+        self._io = threading.Lock()
+        self.flush_needed = None
+        self.flusher_task = None
+        
+        os.makedirs(self.log_dir, exist_ok=True)
+        if not self.read_only:
+            self.migrate_legacy()
+        self.open_segments()
         self.load_logs()
     
-    def load_logs(self):
-        """Load delivery logs from file"""
+    def _segment_path(self, index: int, compressed: bool = False) -> str:
+        return os.path.join(self.log_dir, f"{index:06d}.jsonl" + (".gz" if compressed else ""))
+    
+    def _index_path(self, index: int) -> str:
+        return os.path.join(self.log_dir, f"{index:06d}.idx.json")
+    
+    def _segments(self) -> List[Tuple[int, str]]:
+        """(index, path) of every segment, oldest first"""
+        segments = []
+        for name in os.listdir(self.log_dir):
+            match = SEGMENT_PATTERN.match(name)
+            if match:
+                segments.append((int(match.group(1)), os.path.join(self.log_dir, name)))
+        return sorted(segments)
+    
+    def _read_segment(self, path: str) -> Iterator[Dict]:
+        opener = gzip.open if path.endswith('.gz') else open
+        with opener(path, 'rt', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    # A crash can leave a torn last line; everything before it is intact
+                    continue
+    
+    def migrate_legacy(self):
+        """One-shot import of the old delivery_log.json into the first segment, renamed afterwards"""
+        if not os.path.exists(self.delivery_log_file) or self._segments():
+            return
+        
         try:
-            if os.path.exists(self.delivery_log_file):
-                with open(self.delivery_log_file, 'r') as f:
-                    self.logs = json.load(f)
-            else:
-                self.logs = []
+            with open(self.delivery_log_file, 'r') as f:
+                legacy = json.load(f)
+            with open(self._segment_path(1), 'w', encoding='utf-8') as f:
+                f.writelines(json.dumps(entry) + "\n" for entry in legacy)
+            os.replace(self.delivery_log_file, self.delivery_log_file + ".migrated")
+            print(f"Migrated {len(legacy)} log entries to {self.log_dir}")
         except Exception as e:
-            print(f"Error loading logs: {e}")
-            self.logs = []
+            print(f"Error migrating delivery log: {e}")
+    
+    def open_segments(self):
+        """Pick the segment to append to, load the indexes and finish any rotation a crash interrupted"""
+        segments = self._segments()
+        
+        if segments and not segments[-1][1].endswith('.gz'):
+            self.segment_index = segments[-1][0]
+            active = segments[-1][1]
+            if not self.read_only:
+                self._trim_torn_line(active)
+            for entry in self._read_segment(active):
+                self.segment_started = self._entry_time(entry)
+                break
+        else:
+            self.segment_index = segments[-1][0] + 1 if segments else 1
+        
+        for index, path in segments:
+            if index in self.indexes:
+                continue
+            if index == self.segment_index:
+                # The active segment is still growing, its index lives in memory only
+                self.indexes[index], self.segment_bytes_written = self._build_index(path)
+                continue
+            self.indexes[index] = self._load_index(index, path)
+            if not path.endswith('.gz') and not self.read_only:
+                self._compress(path)
+    
+    def _trim_torn_line(self, path: str):
+        # New lines appended after a torn one would be glued onto it, so cut it off
+        with open(path, 'rb+') as f:
+            size = f.seek(0, os.SEEK_END)
+            if not size:
+                return
+            f.seek(size - 1)
+            if f.read(1) == b"\n":
+                return
+            # Only happens after a crash, and segments are small enough to read whole
+            f.seek(0)
+            f.truncate(f.read().rfind(b"\n") + 1)
     
-    def save_logs(self):
-        """Save logs to file"""
+    def _build_index(self, path: str) -> Tuple[Dict, int]:
+        """Scan a segment for the byte offset of every indexed key and a sample of timestamps.
+        
+        Also returns where the last complete line ends.
+        """
+        index = empty_index()
+        try:
+            f = gzip.open(path, 'rb') if path.endswith('.gz') else open(path, 'rb')
+        except FileNotFoundError:
+            # Listed before the writer rotated and gzipped it
+            f = gzip.open(path + ".gz", 'rb')
+        offset = 0
+        with f:
+            for line in f:
+                if not line.endswith(b"\n"):
+                    # Still being written by the other process
+                    break
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    entry = None
+                if entry is not None:
+                    index_entry(index, entry, offset)
+                offset += len(line)
+        return index, offset
+    
+    def _load_index(self, index: int, path: str) -> Dict:
         try:
-            os.makedirs(os.path.dirname(self.delivery_log_file), exist_ok=True)
-            # Keep only the last 1000 logs to prevent file from growing too large
-            self.logs = self.logs[-1000:]
-            with open(self.delivery_log_file, 'w') as f:
-                json.dump(self.logs, f, indent=2)
+            with open(self._index_path(index), 'r') as f:
+                segment_index = json.load(f)
+            # Index files from before time sampling get rebuilt once
+            if 'time' in segment_index:
+                return segment_index
+        except FileNotFoundError:
+            pass
         except Exception as e:
-            print(f"Error saving logs: {e}")
+            print(f"Error loading log index for {path}, rebuilding: {e}")
+        
+        # Migrated, written before indexes existed, or the crash came before the index was saved
+        segment_index, _ = self._build_index(path)
+        if not self.read_only:
+            self._write_index(index, segment_index)
+        return segment_index
+    
+    def _write_index(self, index: int, segment_index: Dict):
+        path = self._index_path(index)
+        temp_file = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(temp_file, 'w') as f:
+                json.dump(segment_index, f)
+            os.replace(temp_file, path)
+        except Exception as e:
+            print(f"Error saving log index {path}: {e}")
+    
+    def _entry_time(self, entry: Dict) -> float:
+        try:
+            return datetime.fromisoformat(entry['timestamp']).timestamp()
+        except (KeyError, TypeError, ValueError):
+            return time.time()
+    
+    def _compress(self, path: str):
+        compressed = path + ".gz"
+        try:
+            if not os.path.exists(compressed):
+                # The dashboard process may finish the same interrupted rotation; each writes its own temp file
+                temp_file = f"{compressed}.{os.getpid()}.tmp"
+                with open(path, 'rb') as source, gzip.open(temp_file, 'wb') as target:
+                    while True:
+                        chunk = source.read(1024 * 1024)
+                        if not chunk:
+                            break
+                        target.write(chunk)
+                os.replace(temp_file, compressed)
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print(f"Error compressing log segment {path}: {e}")
+    
+    def load_logs(self):
+        """Fill the recent entries from the newest segments"""
+        lines = []
+        for _, path in reversed(self._segments()):
+            opener = gzip.open if path.endswith('.gz') else open
+            try:
+                with opener(path, 'rb') as f:
+                    # Only the tail gets parsed, however big the segment is
+                    lines = list(deque(f, maxlen=self.logs.maxlen)) + lines
+            except Exception as e:
+                print(f"Error loading logs from {path}: {e}")
+            if len(lines) >= self.logs.maxlen:
+                break
+        
+        for line in lines[-self.logs.maxlen:]:
+            try:
+                self.logs.append(json.loads(line))
+            except ValueError:
+                continue
+    
+    def refresh(self):
+        """Follow entries another process appended since the last call, reading only the new bytes"""
+        with self._io:
+            while True:
+                # Checked before reading: once the next segment exists the writer is done with this one,
+                # so the read below gets all of it
+                following = self.segment_index + 1
+                rotated = (os.path.exists(self._segment_path(following)) or
+                           os.path.exists(self._segment_path(following, compressed=True)))
+                self._tail_segment(self.segment_index)
+                if not rotated:
+                    break
+                self.segment_index = following
+                self.segment_bytes_written = 0
+    
+    def _tail_segment(self, segment: int):
+        try:
+            size = os.path.getsize(self._segment_path(segment))
+            if size == self.segment_bytes_written:
+                return
+        except FileNotFoundError:
+            # Gzipped since the last call, or not created yet
+            if not os.path.exists(self._segment_path(segment, compressed=True)):
+                return
+        
+        with self._open_at(segment) as f:
+            f.seek(self.segment_bytes_written)
+            data = f.read()
+        
+        with self._state:
+            segment_index = self.indexes.setdefault(segment, empty_index())
+            offset = self.segment_bytes_written
+            for line in data[:data.rfind(b"\n") + 1].splitlines(keepends=True):
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    entry = None
+                if entry is not None:
+                    index_entry(segment_index, entry, offset)
+                    self.logs.append(entry)
+                offset += len(line)
+            self.segment_bytes_written = offset
+    
+    def append_log(self, log_entry: Dict):
+        """Queue an entry for the next flush; constant cost no matter how long the history is"""
+        with self._state:
+            self.logs.append(log_entry)
+            self.pending.append((json.dumps(log_entry) + "\n", log_entry))
+            batch_ready = len(self.pending) >= self.flush_batch
+        
+        if self.flusher_task is None:
+            # No event loop buffering yet (startup, scripts): write through
+            self.flush()
+        elif batch_ready:
+            self.flush_needed.set()
+    
+    def flush(self):
+        """Append pending entries to the active segment, rotating it first if it's full or old"""
+        with self._io:
+            with self._state:
+                batch, self.pending = self.pending, []
+                self.writing = batch
+            if not batch:
+                return
+            
+            try:
+                self._rotate_if_needed()
+                encoded = [line.encode('utf-8') for line, _ in batch]
+                with open(self._segment_path(self.segment_index), 'ab') as f:
+                    f.write(b"".join(encoded))
+                
+                with self._state:
+                    segment_index = self.indexes.setdefault(self.segment_index, empty_index())
+                    offset = self.segment_bytes_written
+                    for data, (_, entry) in zip(encoded, batch):
+                        index_entry(segment_index, entry, offset)
+                        offset += len(data)
+                    self.segment_bytes_written = offset
+                    self.writing = []
+            except Exception as e:
+                print(f"Error saving logs: {e}")
+            finally:
+                with self._state:
+                    self.writing = []
+    
+    def _rotate_if_needed(self):
+        if not self.segment_bytes_written:
+            self.segment_started = time.time()
+            return
+        too_big = self.segment_bytes_written >= self.segment_bytes
+        too_old = time.time() - self.segment_started >= self.segment_seconds
+        if too_big or too_old:
+            finished = self.segment_index
+            self.segment_index += 1
+            self.segment_bytes_written = 0
+            self.segment_started = time.time()
+            # Index first: it only holds offsets, which gzip doesn't change
+            self._write_index(finished, self.indexes.get(finished, empty_index()))
+            self._compress(self._segment_path(finished))
+    
+    def start(self):
+        """Start the background flusher and log channel publisher on the running event loop"""
+        if self.flusher_task is not None:
+            return
+        self.flush_needed = asyncio.Event()
+        self.flusher_task = asyncio.create_task(self._flusher())
+        self.publisher_task = asyncio.create_task(self._publisher())
+    
+    async def stop(self):
+        for task in (self.flusher_task, self.publisher_task):
+            if task is not None:
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+        self.flusher_task = None
+        self.publisher_task = None
+        await asyncio.to_thread(self.flush)
+    
+    async def _flusher(self):
+        while True:
+            try:
+                await asyncio.wait_for(self.flush_needed.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self.flush_needed.clear()
+            # File writes and gzip block, keep them off the event loop
+            await asyncio.to_thread(self.flush)
+    
+    def publish_embed(self, embed: discord.Embed):
+        """Queue an embed for the log channel; never waits on Discord"""
+        if len(self.channel_embeds) < self.channel_max_queued:
+            self.channel_embeds.append(embed)
+        else:
+            # Backlog is full (usually a long rate limit): keep a count instead of the embed
+            self.channel_skipped[embed.title] += 1
+    
+    def _next_channel_batch(self) -> Tuple[List[discord.Embed], Counter]:
+        """Up to one message worth of embeds; older ones are folded into the summary counts"""
+        embeds, self.channel_embeds = self.channel_embeds, []
+        summarized, self.channel_skipped = self.channel_skipped, Counter()
+        if len(embeds) > MAX_EMBEDS_PER_MESSAGE or summarized:
+            # Leave room for the summary embed and post the newest events in full
+            shown = MAX_EMBEDS_PER_MESSAGE - 1
+            for embed in embeds[:-shown]:
+                summarized[embed.title] += 1
+            embeds = embeds[-shown:]
+        return embeds, summarized
+    
+    def _summary_embed(self, summarized: Counter) -> discord.Embed:
+        lines = [f"{title}: {count}" for title, count in summarized.most_common()]
+        return discord.Embed(
+            title="📋 More Activity",
+            description="Too many events to post individually:\n" + "\n".join(lines),
+            color=0x2f3136,
+            timestamp=datetime.utcnow()
+        )
+    
+    async def _publisher(self):
+        while True:
+            await asyncio.sleep(max(self.channel_interval, self.channel_paused_until - time.monotonic()))
+            if not self.log_channel or not (self.channel_embeds or self.channel_skipped):
+                continue
+            
+            embeds, summarized = self._next_channel_batch()
+            message_embeds = embeds + ([self._summary_embed(summarized)] if summarized else [])
+            try:
+                await self.log_channel.send(embeds=message_embeds)
+                continue
+            except discord.RateLimited as e:
+                retry_after = e.retry_after
+            except discord.HTTPException as e:
+                if e.status != 429:
+                    print(f"Error sending logs to channel: {e}")
+                    continue
+                headers = getattr(e.response, 'headers', None) or {}
+                retry_after = float(headers.get('Retry-After', 1.0))
+            except Exception as e:
+                print(f"Error sending logs to channel: {e}")
+                continue
+            
+            # Rate limited: hold off and let this batch collapse into the next summary instead of retrying it
+            self.channel_paused_until = time.monotonic() + retry_after
+            self.channel_skipped.update(summarized)
+            for embed in embeds:
+                self.channel_skipped[embed.title] += 1
     
     def set_log_channel(self, channel: discord.TextChannel):
         """Set the Discord channel for logging"""
@@ -43,15 +490,15 @@ class BotLogger:
             'timestamp': datetime.utcnow().isoformat(),
             'action': 'upload',
             'uploader': f"{uploader.display_name} ({uploader.id})",
+            'uploader_id': uploader.id,
             'watermark_id': watermark_id,
             'filename': filename,
             'description': description
         }
         
-        self.logs.append(log_entry)
-        self.save_logs()
+        self.append_log(log_entry)
         
-        # Send to log channel if available
+        # Queued for the log channel publisher
         if self.log_channel:
             embed = discord.Embed(
                 title="📤 Content Uploaded",
@@ -63,10 +510,7 @@ class BotLogger:
             embed.add_field(name="Filename", value=filename, inline=True)
             embed.add_field(name="Description", value=description, inline=False)
             
-            try:
-                await self.log_channel.send(embed=embed)
-            except Exception as e:
-                print(f"Error sending upload log to channel: {e}")
+            self.publish_embed(embed)
     
     async def log_delivery(self, recipient: discord.User, watermark_id: str, status: str, sender: discord.User):
         """Log content delivery"""
@@ -74,15 +518,16 @@ class BotLogger:
             'timestamp': datetime.utcnow().isoformat(),
             'action': 'delivery',
             'recipient': f"{recipient.display_name} ({recipient.id})",
+            'recipient_id': recipient.id,
             'watermark_id': watermark_id,
             'status': status,
-            'sender': f"{sender.display_name} ({sender.id})"
+            'sender': f"{sender.display_name} ({sender.id})",
+            'sender_id': sender.id
         }
         
-        self.logs.append(log_entry)
-        self.save_logs()
+        self.append_log(log_entry)
         
-        # Send to log channel if available
+        # Queued for the log channel publisher
         if self.log_channel:
             status_emoji = "✅" if "success" in status else "❌"
             embed = discord.Embed(
@@ -95,10 +540,7 @@ class BotLogger:
             embed.add_field(name="Status", value=status.replace("_", " ").title(), inline=True)
             embed.add_field(name="Sent by", value=sender.display_name, inline=True)
             
-            try:
-                await self.log_channel.send(embed=embed)
-            except Exception as e:
-                print(f"Error sending delivery log to channel: {e}")
+            self.publish_embed(embed)
     
     async def log_interaction(self, user: discord.User, interaction_type: str, details: str):
         """Log user interaction with watermarked content"""
@@ -106,14 +548,14 @@ class BotLogger:
             'timestamp': datetime.utcnow().isoformat(),
             'action': 'interaction',
             'user': f"{user.display_name} ({user.id})",
+            'user_id': user.id,
             'interaction_type': interaction_type,
             'details': details
         }
         
-        self.logs.append(log_entry)
-        self.save_logs()
+        self.append_log(log_entry)
         
-        # Send to log channel if available
+        # Queued for the log channel publisher
         if self.log_channel:
             embed = discord.Embed(
                 title="👀 Content Interaction",
@@ -124,10 +566,7 @@ class BotLogger:
             embed.add_field(name="Type", value=interaction_type.replace("_", " ").title(), inline=True)
             embed.add_field(name="Details", value=details[:100] + ("..." if len(details) > 100 else ""), inline=False)
             
-            try:
-                await self.log_channel.send(embed=embed)
-            except Exception as e:
-                print(f"Error sending interaction log to channel: {e}")
+            self.publish_embed(embed)
     
     async def log_admin_action(self, admin: discord.User, action: str):
         """Log admin actions"""
@@ -135,13 +574,13 @@ class BotLogger:
             'timestamp': datetime.utcnow().isoformat(),
             'action': 'admin_action',
             'admin': f"{admin.display_name} ({admin.id})",
+            'admin_id': admin.id,
             'details': action
         }
         
-        self.logs.append(log_entry)
-        self.save_logs()
+        self.append_log(log_entry)
         
-        # Send to log channel if available
+        # Queued for the log channel publisher
         if self.log_channel:
             embed = discord.Embed(
                 title="⚙️ Admin Action",
@@ -151,23 +590,126 @@ class BotLogger:
             embed.add_field(name="Admin", value=admin.display_name, inline=True)
             embed.add_field(name="Action", value=action, inline=False)
             
+            self.publish_embed(embed)
+    
+    def iter_logs(self) -> Iterator[Dict]:
+        """Every entry ever logged, oldest first, including ones not flushed yet"""
+        with self._state:
+            unflushed = [entry for _, entry in self.writing + self.pending]
+        for _, path in self._segments():
             try:
-                await self.log_channel.send(embed=embed)
+                yield from self._read_segment(path)
             except Exception as e:
-                print(f"Error sending admin log to channel: {e}")
+                print(f"Error reading logs from {path}: {e}")
+        yield from unflushed
+    
+    def _open_at(self, segment: int):
+        try:
+            return open(self._segment_path(segment), 'rb')
+        except FileNotFoundError:
+            # Rotated and gzipped since the lookup; offsets are the same in the uncompressed stream
+            return gzip.open(self._segment_path(segment, compressed=True), 'rb')
+    
+    def _read_at(self, segment: int, offsets: List[int]) -> List[Dict]:
+        entries = []
+        try:
+            with self._open_at(segment) as f:
+                # Offsets are ascending, so a gzipped segment is decompressed at most once, front to back
+                for offset in offsets:
+                    f.seek(offset)
+                    try:
+                        entries.append(json.loads(f.readline()))
+                    except ValueError:
+                        continue
+        except Exception as e:
+            print(f"Error reading log segment {segment}: {e}")
+        return entries
+    
+    def _lookup(self, field: str, key: str) -> List[Dict]:
+        with self._state:
+            locations = [
+                (segment, list(segment_index[field][key]))
+                for segment, segment_index in sorted(self.indexes.items())
+                if key in segment_index[field]
+            ]
+            unflushed = [entry for _, entry in self.writing + self.pending if key in entry_index_keys(entry)[field]]
+        
+        entries = []
+        for segment, offsets in locations:
+            entries.extend(self._read_at(segment, offsets))
+        return entries + unflushed
+    
+    def query(self, start: Optional[datetime] = None, end: Optional[datetime] = None,
+              action: Optional[str] = None) -> Iterator[Dict]:
+        """Stream entries with start <= timestamp < end, oldest first, optionally of one action.
+        
+        Only segments overlapping the range are opened, and each is entered at the
+        sampled offset just before start, so the cost follows the size of the window.
+        """
+        low, high = iso_utc(start), iso_utc(end)
+        with self._state:
+            plan = []
+            for segment, segment_index in sorted(self.indexes.items()):
+                samples = segment_index['time']
+                if not samples:
+                    continue
+                if high is not None and samples[0][0] >= high:
+                    break
+                if low is not None and segment_index['last'] < low:
+                    continue
+                # Last sample strictly before start; entries sharing its timestamp may come earlier
+                position = max(bisect_left(samples, [low]) - 1, 0) if low is not None else 0
+                # The active segment is read only up to what's indexed, the unflushed rest is copied below
+                limit = self.segment_bytes_written if segment == self.segment_index else None
+                plan.append((segment, samples[position][1], limit))
+            unflushed = [entry for _, entry in self.writing + self.pending]
+        
+        def wanted(entry: Dict) -> bool:
+            return action is None or entry.get('action') == action
+        
+        for segment, offset, limit in plan:
+            try:
+                with self._open_at(segment) as f:
+                    f.seek(offset)
+                    for line in f:
+                        if limit is not None and offset >= limit:
+                            break
+                        offset += len(line)
+                        try:
+                            entry = json.loads(line)
+                        except ValueError:
+                            continue
+                        timestamp = entry.get('timestamp', '')
+                        if low is not None and timestamp < low:
+                            continue
+                        if high is not None and timestamp >= high:
+                            return
+                        if wanted(entry):
+                            yield entry
+            except OSError as e:
+                print(f"Error reading log segment {segment}: {e}")
+        
+        for entry in unflushed:
+            timestamp = entry.get('timestamp', '')
+            if (low is None or timestamp >= low) and (high is None or timestamp < high) and wanted(entry):
+                yield entry
+    
+    def version(self) -> tuple:
+        """Changes whenever an entry is logged, or followed from the other process"""
+        with self._state:
+            return (self.segment_index, self.segment_bytes_written, len(self.pending))
     
     def get_recent_logs(self, limit: int = 50) -> List[Dict]:
         """Get recent logs"""
-        return self.logs[-limit:] if self.logs else []
+        with self._state:
+            if limit <= self.logs.maxlen or len(self.logs) < self.logs.maxlen:
+                return list(self.logs)[-limit:]
+        return list(deque(self.iter_logs(), maxlen=limit))
     
     def get_logs_by_watermark_id(self, watermark_id: str) -> List[Dict]:
         """Get all logs for a specific watermark ID"""
-        return [log for log in self.logs if log.get('watermark_id') == watermark_id]
+        return self._lookup('watermark_id', watermark_id)
     
     def get_logs_by_user(self, user_id: int) -> List[Dict]:
-        """Get all logs for a specific user"""
-        user_id_str = str(user_id)
-        return [log for log in self.logs 
-                if user_id_str in log.get('recipient', '') or 
-                   user_id_str in log.get('user', '') or 
-                   user_id_str in log.get('uploader', '')]
+        """Get all logs involving a user, whether as recipient, sender, uploader or admin"""
+        return self._lookup('user_id', str(int(user_id)))
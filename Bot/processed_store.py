@@ -0,0 +1,177 @@
+"""
+Indexed SQLite store for processed file records
+"""
+
+import json
+import os
+import sqlite3
+import threading
+from typing import Dict, List, Optional
+from .file_watch import locked
+
+class ProcessedFileStore:
+    COLUMNS = ('watermark_id', 'original_filename', 'processed_filename', 'description',
+               'created_at', 'file_type', 'source_filename', 'file_size')
+    
+    def __init__(self, db_path: str = "data/processed_files.db", legacy_json: str = "data/processed_files.json"):
+        self.db_path = db_path
+        self.legacy_json = legacy_json
+        # The dashboard reads from its own thread, so serialize access to the shared connection
+        self._lock = threading.Lock()
+        # Our own commits; PRAGMA data_version only counts other connections'
+        self.writes = 0
+        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        self.init_db()
+        self.migrate_json()
+    
+    def init_db(self):
+        """Open the database and create the schema"""
+        self.db = sqlite3.connect(self.db_path, check_same_thread=False)
+        self.db.row_factory = sqlite3.Row
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS processed_files (
+                watermark_id TEXT PRIMARY KEY,
+                original_filename TEXT,
+                processed_filename TEXT,
+                description TEXT,
+                created_at TEXT NOT NULL,
+                file_type TEXT,
+                source_filename TEXT,
+                file_size INTEGER
+            )
+        """)
+        self.db.execute("CREATE INDEX IF NOT EXISTS idx_processed_created ON processed_files(created_at)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS idx_processed_type ON processed_files(file_type)")
+        self.db.commit()
+    
+    def migrate_json(self):
+        """One-shot import of the old processed_files.json, renamed afterwards so it only runs once"""
+        if not os.path.exists(self.legacy_json):
+            return
+        
+        # The bot and the dashboard can both start on an unmigrated tree; one imports, the other finds it gone
+        with locked(self.legacy_json):
+            try:
+                with open(self.legacy_json, 'r') as f:
+                    legacy = json.load(f)
+            except FileNotFoundError:
+                return
+            except Exception as e:
+                print(f"Error reading legacy processed files database: {e}")
+                return
+            
+            records = []
+            for watermark_id, record in legacy.items():
+                record = dict(record)
+                record.setdefault('watermark_id', watermark_id)
+                record.setdefault('created_at', '')
+                records.append(self._row_values(record))
+            
+            with self._lock:
+                # INSERT OR IGNORE keeps anything written since, should the rename have failed last time
+                self.db.executemany(
+                    f"INSERT OR IGNORE INTO processed_files ({', '.join(self.COLUMNS)}) VALUES ({', '.join('?' * len(self.COLUMNS))})",
+                    records
+                )
+                self.db.commit()
+                self.writes += 1
+            
+            try:
+                os.replace(self.legacy_json, self.legacy_json + ".migrated")
+            except FileNotFoundError:
+                # Another process finished first
+                return
+        print(f"Migrated {len(records)} processed file record(s) to {self.db_path}")
+    
+    def _row_values(self, record: Dict) -> tuple:
+        return tuple(record.get(column) for column in self.COLUMNS)
+    
+    def _to_dict(self, row) -> Dict:
+        # Match the shape of the old JSON records: optional fields are absent rather than None
+        return {key: row[key] for key in row.keys() if row[key] is not None}
+    
+    def put(self, record: Dict):
+        """Insert or replace a single record"""
+        with self._lock:
+            self.db.execute(
+                f"INSERT OR REPLACE INTO processed_files ({', '.join(self.COLUMNS)}) VALUES ({', '.join('?' * len(self.COLUMNS))})",
+                self._row_values(record)
+            )
+            self.db.commit()
+            self.writes += 1
+    
+    def get(self, watermark_id: str) -> Optional[Dict]:
+        with self._lock:
+            row = self.db.execute("SELECT * FROM processed_files WHERE watermark_id = ?", (watermark_id,)).fetchone()
+        return self._to_dict(row) if row else None
+    
+    def delete(self, watermark_id: str) -> Optional[Dict]:
+        """Remove a record, returns it if it existed"""
+        with self._lock:
+            row = self.db.execute("SELECT * FROM processed_files WHERE watermark_id = ?", (watermark_id,)).fetchone()
+            if row is None:
+                return None
+            self.db.execute("DELETE FROM processed_files WHERE watermark_id = ?", (watermark_id,))
+            self.db.commit()
+            self.writes += 1
+        return self._to_dict(row)
+    
+    def count(self, file_type: Optional[str] = None) -> int:
+        with self._lock:
+            if file_type is None:
+                row = self.db.execute("SELECT COUNT(*) FROM processed_files").fetchone()
+            else:
+                row = self.db.execute("SELECT COUNT(*) FROM processed_files WHERE file_type = ?", (file_type,)).fetchone()
+        return row[0]
+    
+    def total_size(self) -> int:
+        """Sum of the recorded output sizes"""
+        with self._lock:
+            row = self.db.execute("SELECT COALESCE(SUM(file_size), 0) FROM processed_files").fetchone()
+        return row[0]
+    
+    def missing_sizes(self) -> List[tuple]:
+        """(watermark_id, processed_filename) of records without a file_size, e.g. migrated from JSON"""
+        with self._lock:
+            rows = self.db.execute(
+                "SELECT watermark_id, processed_filename FROM processed_files WHERE file_size IS NULL"
+            ).fetchall()
+        return [tuple(row) for row in rows]
+    
+    def set_file_sizes(self, sizes: List[tuple]):
+        """Record (watermark_id, file_size) pairs in one transaction"""
+        if not sizes:
+            return
+        with self._lock:
+            self.db.executemany(
+                "UPDATE processed_files SET file_size = ? WHERE watermark_id = ?",
+                [(file_size, watermark_id) for watermark_id, file_size in sizes]
+            )
+            self.db.commit()
+            self.writes += 1
+    
+    def version(self) -> tuple:
+        """Changes whenever this or any other process commits, cheap enough to check on every request"""
+        with self._lock:
+            data_version = self.db.execute("PRAGMA data_version").fetchone()[0]
+        return (data_version, self.writes)
+    
+    def recent(self, limit: int = 25) -> List[Dict]:
+        """Newest records first"""
+        with self._lock:
+            rows = self.db.execute(
+                "SELECT * FROM processed_files ORDER BY created_at DESC LIMIT ?", (limit,)
+            ).fetchall()
+        return [self._to_dict(row) for row in rows]
+    
+    def all(self) -> Dict[str, Dict]:
+        """Every record keyed by watermark ID, oldest first like the old JSON file"""
+        with self._lock:
+            rows = self.db.execute("SELECT * FROM processed_files ORDER BY created_at").fetchall()
+        return {row['watermark_id']: self._to_dict(row) for row in rows}
+    
+    def close(self):
+        with self._lock:
+            self.db.close()
@@ -0,0 +1,180 @@
+"""
+Per-recipient watermark rendering at claim time
+"""
+
+import asyncio
+import base64
+import hashlib
+import io
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+import discord
+from PIL import Image, ImageDraw
+from .attachment_cache import AttachmentCache
+from .watermark import build_image_overlay, overlay_font_sizes, save_watermarked, load_font, text_stamp, paste_stamp
+
+RECIPIENT_CODE_LENGTH = 6
+
+def recipient_code(watermark_id: str, user_id: int) -> str:
+    """Short code identifying one claimant of one watermark"""
+    digest = hashlib.sha256(f"{watermark_id}:{user_id}".encode()).digest()
+    return base64.b32encode(digest).decode()[:RECIPIENT_CODE_LENGTH]
+
+def recipient_watermark_id(watermark_id: str, user_id: int) -> str:
+    """Watermark ID stamped on a claimant's personal copy, e.g. ES-12345-K3F9QA"""
+    return f"{watermark_id}-{recipient_code(watermark_id, user_id)}"
+
+def split_recipient_id(text: str) -> Tuple[str, Optional[str]]:
+    """Split a stamped ID into (watermark_id, recipient code or None)"""
+    parts = text.strip().upper().split('-')
+    if len(parts) == 3 and len(parts[2]) == RECIPIENT_CODE_LENGTH:
+        return f"{parts[0]}-{parts[1]}", parts[2]
+    return text.strip(), None
+
+def match_recipient(watermark_id: str, code: str, claimant_ids) -> List[str]:
+    """Find which claimants a leaked recipient code belongs to"""
+    return [str(user_id) for user_id in claimant_ids if recipient_code(watermark_id, int(user_id)) == code]
+
+def recipient_layout(size, watermark_id: str) -> Dict:
+    """Where the recipient labels go for an image size: just clear of build_image_overlay's corner and centre boxes"""
+    width, height = size
+    main_size, corner_size = overlay_font_sizes(width, height)
+    
+    corner_font = load_font(corner_size)
+    corner_height = corner_font.getbbox(watermark_id)[3] if corner_font else 15
+    main_font = load_font(main_size)
+    main_height = main_font.getbbox(watermark_id)[3] if main_font else 15
+    
+    return {
+        'font': corner_font,
+        'top': corner_height + 35,
+        'bottom': height - corner_height - 35,
+        'center': (height + main_height) // 2 + 40
+    }
+
+def stamp_recipient(image: Image.Image, layout: Dict, label: str):
+    """Draw the claimant's ID label in both top corners, both bottom corners and under the centre"""
+    # Every claimant's label is different; bypass the shared stamp cache so they don't evict the layout's
+    stamp = text_stamp.__wrapped__(label, layout['font'])
+    label_width, label_height = stamp[0].size
+    width = image.size[0]
+    draw = ImageDraw.Draw(image)
+    
+    positions = [
+        (15, layout['top']),
+        (width - label_width - 15, layout['top']),
+        (15, layout['bottom'] - label_height),
+        (width - label_width - 15, layout['bottom'] - label_height),
+        ((width - label_width) // 2, layout['center'])
+    ]
+    for x, y in positions:
+        # Opaque: drawing on the finished image replaces pixels rather than blending
+        draw.rectangle([x - 10, y - 10, x + label_width + 10, y + label_height + 10], fill=(0, 0, 0, 255))
+        paste_stamp(image, (x, y), stamp, (255, 255, 255, 255))
+
+class RecipientRenderer:
+    def __init__(self, watermark_processor, max_workers: int = 4, max_cached_sources: int = 8):
+        self.watermark_processor = watermark_processor
+        self.max_cached_sources = max_cached_sources
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="recipient-render")
+        # watermark_id -> Future of (watermarked base, original format, label layout)
+        self._sources = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def _prepare_source(self, watermark_id: str, source_path: str):
+        """Decode the clean source and composite the upload's shared watermark onto it"""
+        with Image.open(source_path) as img:
+            original_format = img.format
+            source = img.convert('RGBA') if img.mode != 'RGBA' else img.copy()
+        source.load()
+        
+        base = Image.alpha_composite(source, build_image_overlay(source.size, watermark_id))
+        return base, original_format, recipient_layout(base.size, watermark_id)
+    
+    def _get_source(self, watermark_id: str, source_path: str):
+        """Prepare a source once and keep it in a small LRU; concurrent claims wait for the same decode"""
+        with self._lock:
+            pending = self._sources.get(watermark_id)
+            owner = pending is None
+            if owner:
+                pending = Future()
+                self._sources[watermark_id] = pending
+                while len(self._sources) > self.max_cached_sources:
+                    self._sources.popitem(last=False)
+            else:
+                self._sources.move_to_end(watermark_id)
+        
+        if owner:
+            try:
+                pending.set_result(self._prepare_source(watermark_id, source_path))
+            except Exception as e:
+                # Don't cache the failure, the next claim tries again
+                with self._lock:
+                    if self._sources.get(watermark_id) is pending:
+                        del self._sources[watermark_id]
+                pending.set_exception(e)
+        return pending.result()
+    
+    def _render(self, watermark_id: str, user_id: int, source_path: str, file_extension: str, processed_filename: str) -> Tuple[bytes, str]:
+        base, original_format, layout = self._get_source(watermark_id, source_path)
+        stamped_id = recipient_watermark_id(watermark_id, user_id)
+        
+        # Only the ID labels are drawn per claimant; the full layout is already in the cached base
+        watermarked = base.copy()
+        stamp_recipient(watermarked, layout, stamped_id)
+        
+        buffer = io.BytesIO()
+        extension = save_watermarked(watermarked, buffer, file_extension, original_format, fast=True)
+        filename = os.path.splitext(processed_filename.replace(watermark_id, stamped_id, 1))[0] + extension
+        return buffer.getvalue(), filename
+    
+    def _source(self, watermark_id: str) -> Tuple[Optional[Dict], Optional[str]]:
+        """The processed record and the path of its clean source, (None, None) if it has none on disk"""
+        processed_file = self.watermark_processor.get_processed_file(watermark_id)
+        if not processed_file or not processed_file.get('source_filename'):
+            return None, None
+        
+        source_path = os.path.join(self.watermark_processor.sources_dir, processed_file['source_filename'])
+        if not os.path.exists(source_path):
+            return None, None
+        return processed_file, source_path
+    
+    async def render(self, watermark_id: str, user_id: int) -> Optional[Tuple[bytes, str]]:
+        """Render a claimant's personal copy, returns (bytes, filename) or None if not available"""
+        processed_file, source_path = self._source(watermark_id)
+        if source_path is None:
+            return None
+        
+        loop = asyncio.get_running_loop()
+        try:
+            return await loop.run_in_executor(
+                self.executor, self._render, watermark_id, user_id, source_path,
+                processed_file.get('file_type', ''), processed_file.get('processed_filename', '')
+            )
+        except Exception as e:
+            print(f"Error rendering personal copy of {watermark_id} for {user_id}: {e}")
+            return None
+    
+    def file_factory(self, watermark_id: str, user_id: int) -> Optional[Callable[[], Awaitable[discord.File]]]:
+        """Attachment factory that renders the personal copy when the DM is actually sent; None if there is no source.
+        
+        Rendering at send time keeps a queued reveal burst from holding a full-size image per claimant.
+        """
+        if self._source(watermark_id)[1] is None:
+            return None
+        
+        async def build() -> discord.File:
+            personal_copy = await self.render(watermark_id, user_id)
+            if personal_copy is None:
+                raise RuntimeError(f"Personal copy of {watermark_id} could not be rendered")
+            data, filename = personal_copy
+            return AttachmentCache.as_file(data, filename)
+        return build
+    
+    def forget(self, watermark_id: str):
+        """Drop a cached source, e.g. after the content is deleted"""
+        with self._lock:
+            self._sources.pop(watermark_id, None)
@@ -0,0 +1,123 @@
+"""
+Process pool for CPU-bound watermark rendering
+"""
+
+import asyncio
+import errno
+import multiprocessing
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Dict, Optional
+
+# OS errors that come from the machine rather than the file being rendered
+TRANSIENT_ERRNOS = {errno.EIO, errno.EAGAIN, errno.EBUSY, errno.EMFILE, errno.ENFILE, errno.ENOMEM, errno.ENOSPC, errno.ETIMEDOUT}
+
+
+def is_transient_error(error: BaseException) -> bool:
+    """Whether the same job could succeed on retry: a crashed worker or an I/O failure, not bad input"""
+    if isinstance(error, BrokenProcessPool):
+        return True
+    return isinstance(error, OSError) and error.errno in TRANSIENT_ERRNOS
+
+
+def _noop():
+    """Used to spin up worker processes ahead of the first real job"""
+    return None
+
+
+def _timed_call(func: Callable, *args):
+    """Run a job inside a worker and report how long it actually rendered"""
+    started = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - started
+
+
+class RenderPool:
+    def __init__(self, max_workers: Optional[int] = None, initializer: Optional[Callable] = None, history_size: int = 50):
+        self.max_workers = max(1, max_workers or os.cpu_count() or 1)
+        self.initializer = initializer
+        self.executor = None
+        self.pending = 0
+        self.completed = 0
+        self.failed = 0
+        self.job_timings = deque(maxlen=history_size)
+    
+    def start(self):
+        """Start the worker processes and warm them up"""
+        if self.executor is not None:
+            return
+        
+        # Spawn instead of fork: the bot process runs discord.py's heartbeat thread
+        self.executor = ProcessPoolExecutor(
+            max_workers=self.max_workers,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=self.initializer
+        )
+        
+        # Workers are created on demand, so submit one no-op per slot to have
+        # every process imported and initialized before the first upload arrives
+        for _ in range(self.max_workers):
+            self.executor.submit(_noop)
+    
+    def shutdown(self, wait: bool = True):
+        """Stop the worker processes"""
+        if self.executor is not None:
+            self.executor.shutdown(wait=wait, cancel_futures=True)
+            self.executor = None
+    
+    async def run(self, func: Callable, *args):
+        """Run func(*args) in a worker process without blocking the event loop"""
+        self.start()
+        executor = self.executor
+        loop = asyncio.get_running_loop()
+        job_name = getattr(func, '__name__', 'job')
+        submitted_at = time.perf_counter()
+        self.pending += 1
+        
+        try:
+            result, render_seconds = await loop.run_in_executor(executor, _timed_call, func, *args)
+        except BrokenProcessPool:
+            # A worker died (e.g. OOM on a huge video); rebuild the pool for the next job.
+            # Every job in flight fails the same way, only the first one replaces the pool
+            self.failed += 1
+            if self.executor is executor:
+                self.executor = None
+                executor.shutdown(wait=False, cancel_futures=True)
+            raise
+        except Exception:
+            self.failed += 1
+            raise
+        finally:
+            self.pending -= 1
+        
+        total_seconds = time.perf_counter() - submitted_at
+        self.completed += 1
+        self.job_timings.append({
+            'job': job_name,
+            'wait_seconds': round(max(0.0, total_seconds - render_seconds), 3),
+            'render_seconds': round(render_seconds, 3),
+            'total_seconds': round(total_seconds, 3),
+            'finished_at': time.time()
+        })
+        return result
+    
+    def get_stats(self) -> Dict:
+        """Get pool size, queue depth and recent job timings"""
+        timings = list(self.job_timings)
+        avg_render = sum(t['render_seconds'] for t in timings) / len(timings) if timings else 0.0
+        avg_wait = sum(t['wait_seconds'] for t in timings) / len(timings) if timings else 0.0
+        
+        return {
+            'pool_size': self.max_workers,
+            'started': self.executor is not None,
+            'running': min(self.pending, self.max_workers),
+            'queue_depth': max(0, self.pending - self.max_workers),
+            'completed': self.completed,
+            'failed': self.failed,
+            'avg_render_seconds': round(avg_render, 3),
+            'avg_wait_seconds': round(avg_wait, 3),
+            'recent_jobs': timings
+        }
@@ -1,10 +1,13 @@
 import json
 import os
 from typing import List, Set
+from .file_watch import FileWatch, locked
 
 class UserManager:
     def __init__(self):
         self.admins_file = "data/admins.json"
+        # The bot and the dashboard both edit the admin list; watched from before the first read so nothing slips between
+        self.watch = FileWatch(self.admins_file)
         self.load_admins()
     
     def load_admins(self):
@@ -22,39 +25,57 @@ class UserManager:
             print(f"Error loading admins: {e}")
             self.admins = set()
     
+    def refresh(self):
+        """Reload if the other process changed the file; one stat call otherwise"""
+        if self.watch.changed():
+            self.load_admins()
+    
     def save_admins(self):
         """Save admin list to file"""
         try:
             os.makedirs(os.path.dirname(self.admins_file), exist_ok=True)
-            with open(self.admins_file, 'w') as f:
+            # Replaced atomically so the other process never reads a half-written file
+            temp_file = f"{self.admins_file}.{os.getpid()}.tmp"
+            with open(temp_file, 'w') as f:
                 json.dump({'admins': list(self.admins)}, f, indent=2)
+            os.replace(temp_file, self.admins_file)
         except Exception as e:
             print(f"Error saving admins: {e}")
     
     def is_admin(self, user_id: int) -> bool:
         """Check if a user is an admin"""
+        self.refresh()
         return user_id in self.admins
     
     def add_admin(self, user_id: int) -> bool:
         """Add a user to admin list. Returns True if added, False if already admin"""
-        if user_id not in self.admins:
+        # Re-read under the lock so a change the other process just made isn't overwritten
+        with locked(self.admins_file):
+            self.load_admins()
+            if user_id in self.admins:
+                return False
             self.admins.add(user_id)
             self.save_admins()
+            self.watch.mark()
             return True
-        return False
     
     def remove_admin(self, user_id: int) -> bool:
         """Remove a user from admin list. Returns True if removed, False if not admin"""
-        if user_id in self.admins:
+        with locked(self.admins_file):
+            self.load_admins()
+            if user_id not in self.admins:
+                return False
             self.admins.remove(user_id)
             self.save_admins()
+            self.watch.mark()
             return True
-        return False
     
     def get_admins(self) -> List[int]:
         """Get list of all admin user IDs"""
+        self.refresh()
         return list(self.admins)
     
     def get_admin_count(self) -> int:
         """Get number of admins"""
+        self.refresh()
         return len(self.admins)
@@ -0,0 +1,134 @@
+"""
+Cached, concurrency-bounded Discord user lookups
+"""
+
+import asyncio
+import json
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional
+import discord
+
+class UserResolver:
+    def __init__(self, bot, max_concurrency: int = 8, max_cached: int = 10000,
+                 names_file: str = "data/user_cache.json", name_ttl: float = 7 * 24 * 3600):
+        self.bot = bot
+        self.max_cached = max_cached
+        self.users: "OrderedDict[int, discord.User]" = OrderedDict()
+        self.in_flight = {}
+        self.fetch_slots = asyncio.Semaphore(max_concurrency)
+        self.hits = 0
+        self.fetches = 0
+        
+        # Display names survive restarts so /trace doesn't refetch thousands of users
+        self.names_file = names_file
+        self.name_ttl = name_ttl
+        self.names: Dict[str, list] = {}
+        self.names_dirty = False
+        self.load_names()
+    
+    def load_names(self):
+        """Load the persistent display name cache"""
+        try:
+            if os.path.exists(self.names_file):
+                with open(self.names_file, 'r') as f:
+                    self.names = json.load(f)
+        except Exception as e:
+            print(f"Error loading user cache: {e}")
+            self.names = {}
+    
+    def save_names(self):
+        """Write the display name cache, dropping expired entries"""
+        if self.names_dirty:
+            self._write_names(self._snapshot_names())
+    
+    def _snapshot_names(self) -> str:
+        # Taken on the event loop so the dict can't change while it's being serialized
+        now = time.time()
+        self.names = {user_id: entry for user_id, entry in self.names.items() if now - entry[1] < self.name_ttl}
+        self.names_dirty = False
+        return json.dumps(self.names)
+    
+    def _write_names(self, data: str):
+        try:
+            os.makedirs(os.path.dirname(self.names_file), exist_ok=True)
+            temp_file = self.names_file + ".tmp"
+            with open(temp_file, 'w') as f:
+                f.write(data)
+            os.replace(temp_file, self.names_file)
+        except Exception as e:
+            print(f"Error saving user cache: {e}")
+    
+    def _remember(self, user: discord.User):
+        self.users[user.id] = user
+        self.users.move_to_end(user.id)
+        while len(self.users) > self.max_cached:
+            self.users.popitem(last=False)
+        self._remember_name(user.id, user.display_name)
+    
+    def _remember_name(self, user_id: int, display_name: str):
+        entry = self.names.get(str(user_id))
+        if entry is None or entry[0] != display_name or time.time() - entry[1] > self.name_ttl / 2:
+            self.names[str(user_id)] = [display_name, time.time()]
+            self.names_dirty = True
+    
+    def cached_name(self, user_id: int, guild: Optional[discord.Guild] = None) -> Optional[str]:
+        """Display name without any API call: guild members, then the client cache, then the persistent cache"""
+        member = guild.get_member(user_id) if guild is not None else None
+        user = member or self.bot.get_user(user_id) or self.users.get(user_id)
+        if user is not None:
+            self._remember_name(user_id, user.display_name)
+            return user.display_name
+        
+        entry = self.names.get(str(user_id))
+        if entry is not None and time.time() - entry[1] < self.name_ttl:
+            return entry[0]
+        return None
+    
+    async def resolve(self, user_id: int) -> discord.User:
+        """Get a user from the client cache, our cache, or the API; raises discord.NotFound like fetch_user"""
+        user_id = int(user_id)
+        user = self.bot.get_user(user_id) or self.users.get(user_id)
+        if user is not None:
+            self.hits += 1
+            return user
+        
+        # Several callers asking for the same user share one API request
+        future = self.in_flight.get(user_id)
+        if future is None:
+            future = asyncio.ensure_future(self._fetch(user_id))
+            self.in_flight[user_id] = future
+            future.add_done_callback(lambda _: self.in_flight.pop(user_id, None))
+        return await asyncio.shield(future)
+    
+    async def _fetch(self, user_id: int) -> discord.User:
+        async with self.fetch_slots:
+            self.fetches += 1
+            user = await self.bot.fetch_user(user_id)
+        self._remember(user)
+        return user
+    
+    async def resolve_names(self, user_ids: Iterable, guild: Optional[discord.Guild] = None) -> Dict[int, str]:
+        """Display names for many users; only cache misses hit the API, concurrently and bounded"""
+        names = {}
+        missing = []
+        for user_id in user_ids:
+            user_id = int(user_id)
+            name = self.cached_name(user_id, guild)
+            if name is None:
+                missing.append(user_id)
+            else:
+                self.hits += 1
+                names[user_id] = name
+        
+        async def fetch_name(user_id: int):
+            try:
+                names[user_id] = (await self.resolve(user_id)).display_name
+            except discord.HTTPException:
+                names[user_id] = "Unknown User"
+        
+        await asyncio.gather(*[fetch_name(user_id) for user_id in missing])
+        if self.names_dirty:
+            await asyncio.to_thread(self._write_names, self._snapshot_names())
+        return names
@@ -0,0 +1,109 @@
+"""
+Pipelined decode/render/encode for video watermarking
+"""
+
+import queue
+import threading
+from typing import Callable, Optional
+import numpy as np
+
+_END = object()
+
+class FramePipeline:
+    """Overlaps cap.read() and out.write() with rendering using reusable frame buffers"""
+    def __init__(self, cap, out, width: int, height: int, depth: int = 4):
+        self.cap = cap
+        self.out = out
+        self.depth = max(2, depth)
+        
+        # Memory is capped at `depth` frames: buffers cycle free -> decoded -> encoded -> free
+        self.free = queue.Queue()
+        for _ in range(self.depth):
+            self.free.put(np.empty((height, width, 3), np.uint8))
+        self.decoded = queue.Queue(maxsize=self.depth)
+        self.encoded = queue.Queue(maxsize=self.depth)
+        
+        self.stop = threading.Event()
+        self.errors = []
+    
+    def _get(self, source: queue.Queue):
+        """Blocking get that gives up once the pipeline is stopping"""
+        while not self.stop.is_set():
+            try:
+                return source.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return _END
+    
+    def _put(self, target: queue.Queue, item):
+        while not self.stop.is_set():
+            try:
+                target.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+    
+    def _decode(self, start_index: int, max_frames: Optional[int]):
+        try:
+            index = start_index
+            while max_frames is None or index - start_index < max_frames:
+                buffer = self._get(self.free)
+                if buffer is _END:
+                    return
+                
+                # OpenCV decodes straight into the buffer when shape and type match
+                ret, frame = self.cap.read(buffer)
+                if not ret:
+                    break
+                
+                self._put(self.decoded, (index, frame))
+                index += 1
+        except Exception as e:
+            self.errors.append(e)
+            self.stop.set()
+        finally:
+            self._put(self.decoded, _END)
+    
+    def _encode(self):
+        try:
+            while True:
+                item = self._get(self.encoded)
+                if item is _END:
+                    return
+                
+                self.out.write(item)
+                self.free.put(item)
+        except Exception as e:
+            self.errors.append(e)
+            self.stop.set()
+    
+    def run(self, render: Callable, start_index: int = 0, max_frames: Optional[int] = None) -> int:
+        """Decode, render(frame, index) and encode every frame, returns the number of frames written"""
+        decoder = threading.Thread(target=self._decode, args=(start_index, max_frames), name="video-decode", daemon=True)
+        encoder = threading.Thread(target=self._encode, name="video-encode", daemon=True)
+        decoder.start()
+        encoder.start()
+        
+        frames = 0
+        try:
+            while True:
+                item = self._get(self.decoded)
+                if item is _END:
+                    break
+                
+                index, frame = item
+                render(frame, index)
+                self._put(self.encoded, frame)
+                frames += 1
+        except Exception:
+            self.stop.set()
+            raise
+        finally:
+            self._put(self.encoded, _END)
+            encoder.join()
+            self.stop.set()
+            decoder.join()
+        
+        if self.errors:
+            raise self.errors[0]
+        return frames
@@ -1,45 +1,506 @@
 import os
-import uuid
-import json
+import shutil
 from PIL import Image, ImageDraw, ImageFont
 import cv2
 import numpy as np
 from datetime import datetime
 import asyncio
-from typing import Dict, Optional
+from functools import lru_cache
+from typing import Dict, List, Optional
+from .processed_store import ProcessedFileStore
+from .render_pool import RenderPool, is_transient_error
+from .video_pipeline import FramePipeline
+
+FONT_PATH = "/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf"
+VIDEO_PIPELINE_DEPTH = 4  # Frames in flight between decode, render and encode
+
+@lru_cache(maxsize=32)
+def load_font(size: int):
+    """Load the watermark font at a given size, cached per process"""
+    try:
+        return ImageFont.truetype(FONT_PATH, size)
+    except:
+        try:
+            return ImageFont.load_default()
+        except:
+            return None
+
+@lru_cache(maxsize=8)
+def text_stamp(text: str, font):
+    """Rasterize a text element once into a glyph mask that can be stamped repeatedly"""
+    if font is None:
+        font = ImageFont.load_default()
+    
+    left, top, right, bottom = font.getbbox(text)
+    
+    # Keep the stamp anchored at the text origin, like draw.text would place it
+    offset_x = min(0, left)
+    offset_y = min(0, top)
+    stamp = Image.new('L', (max(1, right - offset_x), max(1, bottom - offset_y)), 0)
+    ImageDraw.Draw(stamp).text((-offset_x, -offset_y), text, fill=255, font=font)
+    return stamp, (offset_x, offset_y)
+
+def paste_stamp(overlay: Image.Image, xy, stamp, fill):
+    """Fill a stamp's glyphs with a colour at xy, same blending as draw.text"""
+    mask, (offset_x, offset_y) = stamp
+    overlay.paste(fill, (int(xy[0]) + offset_x, int(xy[1]) + offset_y), mask)
+
+def overlay_font_sizes(width: int, height: int):
+    """Main and corner font sizes build_image_overlay uses for an image of the given size"""
+    short_side = min(width, height)
+    return max(300, short_side // 2), max(35, short_side // 20)
+
+def init_render_worker():
+    """Warm up a render worker process"""
+    # PIL, cv2 and numpy are already imported with this module; preload the
+    # fonts a 1080p or 4K upload needs so the first job skips it
+    for resolution in ((1920, 1080), (3840, 2160)):
+        for size in overlay_font_sizes(*resolution):
+            load_font(size)
+
+def build_image_overlay(size, watermark_id: str) -> Image.Image:
+    """Draw the full watermark layout for an image of the given size onto a transparent overlay"""
+    # Create a transparent overlay
+    overlay = Image.new('RGBA', size, (255, 255, 255, 0))
+    draw = ImageDraw.Draw(overlay)
+    
+    # Calculate watermark position and size
+    width, height = size
+    
+    # Load the font from the worker's cache, falls back to default if not available
+    # Use corner watermark size as default - massive text
+    font_size, corner_font_size = overlay_font_sizes(width, height)  # Massive default size
+    font = load_font(font_size)
+    
+    # Add main watermark ID
+    watermark_text = watermark_id
+    if font:
+        text_bbox = draw.textbbox((0, 0), watermark_text, font=font)
+        text_width = text_bbox[2] - text_bbox[0]
+        text_height = text_bbox[3] - text_bbox[1]
+    else:
+        text_width = len(watermark_text) * 10
+        text_height = 15
+    
+    # Position: bottom-right corner with padding
+    x = width - text_width - 20
+    y = height - text_height - 20
+    
+    # Draw text background - maximum visibility
+    bg_padding = 30
+    draw.rectangle(
+        [x - bg_padding, y - bg_padding, x + text_width + bg_padding, y + text_height + bg_padding],
+        fill=(0, 0, 0, 200)  # Almost black background
+    )
+    
+    # Draw watermark text - bright white and massive
+    paste_stamp(overlay, (x, y), text_stamp(watermark_text, font), (255, 255, 255, 255))  # Pure white text
+    
+    # Create continuous watermark pattern across entire image
+    
+    # Pattern watermarks same size as main watermark
+    pattern_font = font
+    
+    # Get text dimensions
+    pattern_bbox = draw.textbbox((0, 0), watermark_id, font=pattern_font)
+    pattern_width = pattern_bbox[2] - pattern_bbox[0]
+    pattern_height = pattern_bbox[3] - pattern_bbox[1]
+    
+    # Add more spacing between watermarks to prevent text overlap
+    spacing = 20
+    
+    # Calculate how many watermarks fit horizontally
+    watermarks_per_row = (width + spacing) // (pattern_width + spacing)
+    
+    # Calculate how many rows we need to cover the image
+    rows_needed = (height + spacing) // (pattern_height + spacing) + 1
+    
+    # Rasterize the tile once and stamp it at every grid position
+    pattern_stamp = text_stamp(watermark_id, pattern_font)
+    
+    # Create continuous pattern with commas - much more visible
+    for row in range(rows_needed):
+        y_pos = row * (pattern_height + spacing)
+        
+        # Create a continuous line of watermarks with commas
+        x_pos = 0
+        for col in range(watermarks_per_row + 2):  # Extra watermarks to ensure full coverage
+            if x_pos < width:
+                # Stamp watermark with higher opacity for visibility
+                paste_stamp(overlay, (x_pos, y_pos), pattern_stamp, (255, 255, 255, 60))  # More visible
+                x_pos += pattern_width + spacing  # Add spacing to prevent overlap
+    
+    # Add much more prominent watermark in corners for visibility
+    corner_font = load_font(corner_font_size)  # Much larger corners
+    
+    corner_bbox = draw.textbbox((0, 0), watermark_id, font=corner_font)
+    corner_width = corner_bbox[2] - corner_bbox[0]
+    corner_height = corner_bbox[3] - corner_bbox[1]
+    corner_stamp = text_stamp(watermark_id, corner_font)
+    
+    # Four corners with backgrounds for maximum visibility and no overlap
+    corner_padding = 15
+    
+    # Top-left corner with background
+    draw.rectangle([5, 5, corner_width + 25, corner_height + 25], fill=(0, 0, 0, 160))
+    paste_stamp(overlay, (15, 15), corner_stamp, (255, 255, 255, 255))
+    
+    # Top-right corner with background
+    draw.rectangle([width - corner_width - 25, 5, width - 5, corner_height + 25], fill=(0, 0, 0, 160))
+    paste_stamp(overlay, (width - corner_width - 15, 15), corner_stamp, (255, 255, 255, 255))
+    
+    # Bottom-left corner with background
+    draw.rectangle([5, height - corner_height - 25, corner_width + 25, height - 5], fill=(0, 0, 0, 160))
+    paste_stamp(overlay, (15, height - corner_height - 15), corner_stamp, (255, 255, 255, 255))
+    
+    # Bottom-right corner with background
+    draw.rectangle([width - corner_width - 25, height - corner_height - 25, width - 5, height - 5], fill=(0, 0, 0, 160))
+    paste_stamp(overlay, (width - corner_width - 15, height - corner_height - 15), corner_stamp, (255, 255, 255, 255))
+    
+    # Center watermark same size as main watermark
+    center_font = font
+    
+    center_bbox = draw.textbbox((0, 0), watermark_id, font=center_font)
+    center_width = center_bbox[2] - center_bbox[0]
+    center_height = center_bbox[3] - center_bbox[1]
+    center_x = (width - center_width) // 2
+    center_y = (height - center_height) // 2
+    
+    # Large background for center watermark
+    bg_padding = 30
+    draw.rectangle(
+        [center_x - bg_padding, center_y - bg_padding, center_x + center_width + bg_padding, center_y + center_height + bg_padding],
+        fill=(0, 0, 0, 140)
+    )
+    
+    # Center watermark with high opacity for maximum visibility
+    paste_stamp(overlay, (center_x, center_y), text_stamp(watermark_id, center_font), (255, 255, 255, 255))
+    
+    return overlay
+
+def save_watermarked(watermarked: Image.Image, output, file_extension: str, original_format: str, fast: bool = False) -> str:
+    """Encode a watermarked image to a path or file object, returns the extension used"""
+    if file_extension == '.png' and original_format == 'PNG':
+        # Keep PNG format with transparency
+        if fast:
+            watermarked.save(output, 'PNG', compress_level=1)
+        else:
+            watermarked.save(output, 'PNG', optimize=True)
+        return '.png'
+    
+    # Convert to RGB for JPEG
+    if watermarked.mode == 'RGBA':
+        rgb_img = Image.new('RGB', watermarked.size, (255, 255, 255))
+        rgb_img.paste(watermarked, mask=watermarked.split()[-1])
+        watermarked = rgb_img
+    
+    watermarked.save(output, 'JPEG', quality=95, optimize=not fast)
+    return '.jpg'
+
+def render_image(image_path: str, output_dir: str, watermark_id: str) -> Dict:
+    """Render the watermarked copy of an image (runs inside a render worker)"""
+    try:
+        # Open image
+        with Image.open(image_path) as img:
+            # Remember the source format before converting
+            original_format = img.format
+            
+            # Convert to RGBA if not already
+            if img.mode != 'RGBA':
+                img = img.convert('RGBA')
+            
+            # Draw every watermark element onto a transparent overlay
+            overlay = build_image_overlay(img.size, watermark_id)
+            
+            # Composite the overlay onto the original image
+            watermarked = Image.alpha_composite(img, overlay)
+            
+            # Save the watermarked image
+            output_filename = f"{watermark_id}_{os.path.basename(image_path)}"
+            output_path = os.path.join(output_dir, output_filename)
+            
+            # Check original file format to preserve transparency
+            file_extension = os.path.splitext(image_path)[1].lower()
+            
+            if not (file_extension == '.png' and original_format == 'PNG'):
+                # Change extension to .jpg for non-PNG files
+                base_name = os.path.splitext(output_filename)[0]
+                output_filename = f"{base_name}.jpg"
+                output_path = os.path.join(output_dir, output_filename)
+            
+            save_watermarked(watermarked, output_path, file_extension, original_format)
+            
+            return {'success': True, 'processed_filename': output_filename}
+            
+    except Exception as e:
+        print(f"Error processing image: {e}")
+        return {'success': False, 'error': str(e), 'transient': is_transient_error(e)}
+
+
+def video_text_params(width: int, height: int):
+    """Font face, scale and thickness for a video of the given size"""
+    # Calculate text properties - massive size
+    font = cv2.FONT_HERSHEY_SIMPLEX
+    font_scale = max(12.0, min(width, height) / 50)  # Massive font scale
+    thickness = max(20, int(font_scale * 10))  # Very thick text
+    return font, font_scale, thickness
+
+def draw_video_watermarks(frame, watermark_id: str, with_center: bool):
+    """Draw the full video watermark layout onto a single frame"""
+    height, width = frame.shape[:2]
+    font, font_scale, thickness = video_text_params(width, height)
+    
+    # Add watermarks to frame
+    # Bottom-right watermark
+    text_size = cv2.getTextSize(watermark_id, font, font_scale, thickness)[0]
+    x = width - text_size[0] - 20
+    y = height - 20
+    
+    # Add background rectangle
+    cv2.rectangle(frame, (x - 10, y - text_size[1] - 10), (x + text_size[0] + 10, y + 10), (0, 0, 0), -1)
+    cv2.putText(frame, watermark_id, (x, y), font, font_scale, (255, 255, 255), thickness)
+    
+    # Top-left watermark
+    cv2.putText(frame, watermark_id, (10, 30), font, font_scale * 0.7, (255, 255, 255), max(1, thickness - 1))
+    
+    # Top-right watermark
+    top_right_x = width - text_size[0] - 10
+    cv2.putText(frame, watermark_id, (top_right_x, 30), font, font_scale * 0.7, (255, 255, 255), max(1, thickness - 1))
+    
+    # Center watermark (every 20 frames for more frequent visibility)
+    if with_center:
+        center_text = f"{watermark_id}"
+        center_size = cv2.getTextSize(center_text, font, font_scale * 2.0, thickness + 2)[0]  # Much larger center
+        center_x = (width - center_size[0]) // 2
+        center_y = (height + center_size[1]) // 2
+        
+        # More prominent background
+        center_overlay = frame.copy()
+        cv2.rectangle(center_overlay, (center_x - 30, center_y - 50), (center_x + center_size[0] + 30, center_y + 30), (0, 0, 0), -1)
+        cv2.addWeighted(center_overlay, 0.6, frame, 0.4, 0, frame)  # More visible background
+        cv2.putText(frame, center_text, (center_x, center_y), font, font_scale * 2.0, (255, 255, 255), thickness + 2)
+    
+    # Create overlay for transparent watermarks covering entire screen
+    overlay = frame.copy()
+    
+    # Grid pattern with proper spacing to avoid text overlap
+    grid_rows = 8   # Fewer rows to prevent overlap
+    grid_cols = 10  # Fewer columns to prevent overlap
+    
+    for row in range(grid_rows):
+        for col in range(grid_cols):
+            # Calculate position for each watermark
+            x_pos = (col * width) // grid_cols + (width // grid_cols // 2)
+            y_pos = (row * height) // grid_rows + (height // grid_rows // 2)
+            
+            # Massive, highly visible watermarks in grid
+            if (row + col) % 3 == 0:
+                scale = font_scale * 1.5  # Massive
+            elif (row + col) % 3 == 1:
+                scale = font_scale * 1.3  # Very large
+            else:
+                scale = font_scale * 1.4  # Very large
+            
+            # Add watermark to overlay with higher thickness
+            cv2.putText(overlay, watermark_id, (x_pos, y_pos), font, scale, (255, 255, 255), max(2, thickness))
+    
+    # Much larger corner watermarks for maximum visibility
+    corner_scale = font_scale * 1.2  # Much larger corners
+    text_size = cv2.getTextSize(watermark_id, font, corner_scale, thickness + 1)[0]
+    
+    cv2.putText(overlay, watermark_id, (15, 35), font, corner_scale, (255, 255, 255), thickness + 1)
+    cv2.putText(overlay, watermark_id, (width - text_size[0] - 15, 35), font, corner_scale, (255, 255, 255), thickness + 1)
+    cv2.putText(overlay, watermark_id, (15, height - 15), font, corner_scale, (255, 255, 255), thickness + 1)
+    cv2.putText(overlay, watermark_id, (width - text_size[0] - 15, height - 15), font, corner_scale, (255, 255, 255), thickness + 1)
+    
+    # Edge watermarks for extra coverage - larger and more frequent
+    edge_scale = font_scale * 0.7  # Much larger edge watermarks
+    edge_spacing = 60  # Closer spacing for more coverage
+    
+    # Top and bottom edges
+    for x in range(edge_spacing, width - edge_spacing, edge_spacing):
+        cv2.putText(overlay, watermark_id, (x, 25), font, edge_scale, (255, 255, 255), max(2, thickness-1))
+        cv2.putText(overlay, watermark_id, (x, height - 15), font, edge_scale, (255, 255, 255), max(2, thickness-1))
+    
+    # Left and right edges
+    for y in range(edge_spacing, height - edge_spacing, edge_spacing):
+        cv2.putText(overlay, watermark_id, (10, y), font, edge_scale, (255, 255, 255), 1)
+        edge_text_size = cv2.getTextSize(watermark_id, font, edge_scale, 1)[0]
+        cv2.putText(overlay, watermark_id, (width - edge_text_size[0] - 10, y), font, edge_scale, (255, 255, 255), 1)
+    
+    # Apply overlay with 0.6 transparency
+    cv2.addWeighted(overlay, 0.6, frame, 0.4, 0, frame)
+
+class VideoOverlay:
+    """Precomputed per-pixel blend equivalent to draw_video_watermarks"""
+    def __init__(self, width: int, height: int, watermark_id: str, with_center: bool):
+        # Every drawing step is either an opaque fill or an addWeighted blend, so
+        # the whole layout is an affine map per pixel: out = frame * gain + bias.
+        # Render it once over a black and a white frame to recover both terms.
+        black = np.zeros((height, width, 3), np.uint8)
+        white = np.full((height, width, 3), 255, np.uint8)
+        draw_video_watermarks(black, watermark_id, with_center)
+        draw_video_watermarks(white, watermark_id, with_center)
+        
+        # All watermark colours are grey, so one channel describes the map;
+        # store it in 8.8 fixed point (bias carries the rounding half)
+        bias = black[:, :, :1].astype(np.float32)
+        gain = (white[:, :, :1].astype(np.float32) - bias) / 255.0
+        self.gain = np.rint(gain * 256).astype(np.uint16)
+        self.bias = (np.rint(bias * 256) + 128).astype(np.uint16)
+        self.buffer = np.empty((height, width, 3), np.uint16)
+    
+    def apply(self, frame):
+        """Blend the watermark into a BGR uint8 frame in place"""
+        np.multiply(frame, self.gain, out=self.buffer)
+        self.buffer += self.bias
+        self.buffer >>= 8
+        np.copyto(frame, self.buffer, casting='unsafe')
+        return frame
+
+@lru_cache(maxsize=2)
+def get_video_overlay(width: int, height: int, watermark_id: str, with_center: bool) -> VideoOverlay:
+    """Overlay cached per worker, so segments of one video share the build cost"""
+    return VideoOverlay(width, height, watermark_id, with_center)
+
+def probe_video(video_path: str) -> Dict:
+    """Read the properties needed to plan a segmented render"""
+    cap = cv2.VideoCapture(video_path)
+    try:
+        return {
+            'fps': int(cap.get(cv2.CAP_PROP_FPS)),
+            'width': int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
+            'height': int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+            'frames': int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        }
+    finally:
+        cap.release()
+
+def plan_video_segments(total_frames: int, segments: int, min_frames: int):
+    """Split [0, total_frames) into up to `segments` contiguous frame ranges"""
+    segments = max(1, min(segments, total_frames // max(1, min_frames)))
+    bounds = [total_frames * i // segments for i in range(segments + 1)]
+    
+    # The last range runs to end of stream, since CAP_PROP_FRAME_COUNT is an estimate
+    ranges = [(bounds[i], bounds[i + 1]) for i in range(segments)]
+    ranges[-1] = (ranges[-1][0], None)
+    return ranges
+
+def render_video_segment(video_path: str, segment_path: str, watermark_id: str, start_frame: int, end_frame: Optional[int]) -> Dict:
+    """Render frames [start_frame, end_frame) of a video into its own file (runs inside a render worker)"""
+    try:
+        cap = cv2.VideoCapture(video_path)
+        fps = int(cap.get(cv2.CAP_PROP_FPS))
+        width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        
+        # Seek to the segment start; the backend jumps to the previous keyframe and
+        # decodes forward. If the container can't seek exactly, walk there instead.
+        if start_frame > 0:
+            cap.set(cv2.CAP_PROP_POS_FRAMES, start_frame)
+            if int(cap.get(cv2.CAP_PROP_POS_FRAMES)) != start_frame:
+                cap.release()
+                cap = cv2.VideoCapture(video_path)
+                for _ in range(start_frame):
+                    if not cap.grab():
+                        break
+        
+        fourcc = cv2.VideoWriter_fourcc(*'H264')
+        out = cv2.VideoWriter(segment_path, fourcc, fps, (width, height))
+        
+        overlay = get_video_overlay(width, height, watermark_id, False)
+        center_overlay = get_video_overlay(width, height, watermark_id, True)
+        
+        def render(frame, frame_index):
+            # Keep the center box on the same global frames as a sequential render
+            if frame_index % 20 == 0:
+                center_overlay.apply(frame)
+            else:
+                overlay.apply(frame)
+        
+        max_frames = None if end_frame is None else end_frame - start_frame
+        pipeline = FramePipeline(cap, out, width, height, depth=VIDEO_PIPELINE_DEPTH)
+        try:
+            frames = pipeline.run(render, start_index=start_frame, max_frames=max_frames)
+        finally:
+            cap.release()
+            out.release()
+        
+        return {'success': True, 'frames': frames}
+        
+    except Exception as e:
+        print(f"Error processing video segment {start_frame}-{end_frame}: {e}")
+        return {'success': False, 'error': str(e), 'transient': is_transient_error(e)}
+
+def render_video(video_path: str, output_dir: str, watermark_id: str) -> Dict:
+    """Render the watermarked copy of a video (runs inside a render worker)"""
+    try:
+        output_filename = f"{watermark_id}_{os.path.basename(video_path)}"
+        output_path = os.path.join(output_dir, output_filename)
+        
+        # Open video
+        cap = cv2.VideoCapture(video_path)
+        
+        # Get video properties
+        fps = int(cap.get(cv2.CAP_PROP_FPS))
+        width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        
+        # Define codec and create VideoWriter with better compatibility
+        fourcc = cv2.VideoWriter_fourcc(*'H264')
+        out = cv2.VideoWriter(output_path, fourcc, fps, (width, height))
+        
+        # Precompute the overlay once, plus the variant with the center box
+        overlay = get_video_overlay(width, height, watermark_id, False)
+        center_overlay = get_video_overlay(width, height, watermark_id, True)
+        
+        def render(frame, frame_index):
+            # Center watermark (every 20 frames for more frequent visibility)
+            if frame_index % 20 == 0:
+                center_overlay.apply(frame)
+            else:
+                overlay.apply(frame)
+        
+        # Decode, render and encode run as overlapping stages
+        pipeline = FramePipeline(cap, out, width, height, depth=VIDEO_PIPELINE_DEPTH)
+        try:
+            pipeline.run(render)
+        finally:
+            # Release everything
+            cap.release()
+            out.release()
+        
+        return {'success': True, 'processed_filename': output_filename}
+        
+    except Exception as e:
+        print(f"Error processing video: {e}")
+        return {'success': False, 'error': str(e), 'transient': is_transient_error(e)}
+
 
 class WatermarkProcessor:
-    def __init__(self):
-        self.processed_files_db = "data/processed_files.json"
+    def __init__(self, render_workers: Optional[int] = None, per_recipient: bool = False,
+                 video_segments: int = 0, min_segment_frames: int = 300):
         self.output_dir = "output"
+        self.sources_dir = "sources"
+        self.temp_dir = "temp"
+        self.per_recipient = per_recipient
+        self.render_pool = RenderPool(max_workers=render_workers, initializer=init_render_worker)
+        self.video_segments = video_segments or self.render_pool.max_workers
+        self.min_segment_frames = min_segment_frames
+        # Segments are joined with ffmpeg; without it every video renders as one job
+        self.ffmpeg_available = shutil.which('ffmpeg') is not None
+        if self.video_segments > 1 and not self.ffmpeg_available:
+            print(f"ffmpeg not found on PATH: videos will render as a single segment instead of {self.video_segments}")
         self.ensure_directories()
-        self.load_processed_files()
+        self.store = ProcessedFileStore()
     
     def ensure_directories(self):
         """Ensure required directories exist"""
         os.makedirs(self.output_dir, exist_ok=True)
+        os.makedirs(self.sources_dir, exist_ok=True)
         os.makedirs("data", exist_ok=True)
-        os.makedirs("temp", exist_ok=True)
-    
-    def load_processed_files(self):
-        """Load processed files database"""
-        try:
-            if os.path.exists(self.processed_files_db):
-                with open(self.processed_files_db, 'r') as f:
-                    self.processed_files = json.load(f)
-            else:
-                self.processed_files = {}
-        except Exception as e:
-            print(f"Error loading processed files database: {e}")
-            self.processed_files = {}
-    
-    def save_processed_files(self):
-        """Save processed files database"""
-        try:
-            with open(self.processed_files_db, 'w') as f:
-                json.dump(self.processed_files, f, indent=2)
-        except Exception as e:
-            print(f"Error saving processed files database: {e}")
+        os.makedirs(self.temp_dir, exist_ok=True)
     
     def generate_watermark_id(self) -> str:
         """Generate a unique watermark ID"""
@@ -49,7 +510,7 @@ class WatermarkProcessor:
         random_numbers = ''.join([str(random.randint(0, 9)) for _ in range(num_digits)])
         return f"ES-{random_numbers}"
     
-    async def process_file(self, file_path: str, description: str) -> Dict:
+    async def process_file(self, file_path: str, description: str, original_filename: Optional[str] = None) -> Dict:
         """Process a file with watermark"""
         try:
             watermark_id = self.generate_watermark_id()
@@ -61,19 +522,31 @@ class WatermarkProcessor:
             elif file_extension in ['.mp4', '.mov', '.avi']:
                 result = await self.process_video(file_path, watermark_id, description)
             else:
-                return {'status': 'error', 'error': 'Unsupported file format'}
+                return {'status': 'error', 'error': 'Unsupported file format', 'transient': False}
             
             if result['success']:
-                # Store in database
-                self.processed_files[watermark_id] = {
-                    'original_filename': os.path.basename(file_path),
-                    'processed_filename': result.get('processed_filename', ''),
+                processed_filename = result.get('processed_filename', '')
+                record = {
+                    'original_filename': original_filename or os.path.basename(file_path),
+                    'processed_filename': processed_filename,
                     'description': description,
                     'created_at': datetime.now().isoformat(),
                     'file_type': file_extension,
                     'watermark_id': watermark_id
                 }
-                self.save_processed_files()
+                
+                output_path = os.path.join(self.output_dir, processed_filename)
+                if os.path.exists(output_path):
+                    record['file_size'] = os.path.getsize(output_path)
+                
+                # Keep the clean source so claims can get a personal copy
+                if self.per_recipient and file_extension in ['.jpg', '.jpeg', '.png']:
+                    source_filename = f"{watermark_id}{file_extension}"
+                    shutil.copy2(file_path, os.path.join(self.sources_dir, source_filename))
+                    record['source_filename'] = source_filename
+                
+                # Store in database
+                self.store.put(record)
                 
                 return {
                     'status': 'success',
@@ -85,316 +558,112 @@ class WatermarkProcessor:
                 
         except Exception as e:
             print(f"Error processing file: {e}")
-            return {'status': 'error', 'error': str(e)}
+            return {'status': 'error', 'error': str(e), 'transient': is_transient_error(e)}
     
     async def process_image(self, image_path: str, watermark_id: str, description: str) -> Dict:
         """Process an image with watermark"""
-        try:
-            # Open image
-            with Image.open(image_path) as img:
-                # Convert to RGBA if not already
-                if img.mode != 'RGBA':
-                    img = img.convert('RGBA')
-                
-                # Create a transparent overlay
-                overlay = Image.new('RGBA', img.size, (255, 255, 255, 0))
-                draw = ImageDraw.Draw(overlay)
-                
-                # Calculate watermark position and size
-                width, height = img.size
-                
-                # Try to load a font, fall back to default if not available
-                try:
-                    # Use corner watermark size as default - massive text
-                    font_size = max(300, min(width, height) // 2)  # Massive default size
-                    font = ImageFont.truetype("/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf", font_size)
-                except:
-                    try:
-                        font = ImageFont.load_default()
-                    except:
-                        font = None
-                
-                # Add main watermark ID
-                watermark_text = watermark_id
-                if font:
-                    text_bbox = draw.textbbox((0, 0), watermark_text, font=font)
-                    text_width = text_bbox[2] - text_bbox[0]
-                    text_height = text_bbox[3] - text_bbox[1]
-                else:
-                    text_width = len(watermark_text) * 10
-                    text_height = 15
-                
-                # Position: bottom-right corner with padding
-                x = width - text_width - 20
-                y = height - text_height - 20
-                
-                # Draw text background - maximum visibility
-                bg_padding = 30
-                draw.rectangle(
-                    [x - bg_padding, y - bg_padding, x + text_width + bg_padding, y + text_height + bg_padding],
-                    fill=(0, 0, 0, 200)  # Almost black background
-                )
-                
-                # Draw watermark text - bright white and massive
-                draw.text((x, y), watermark_text, fill=(255, 255, 255, 255), font=font)  # Pure white text
-                
-                # Corner watermarks same size as main watermark
-                corner_font_size = font_size  # Same massive size
-                try:
-                    corner_font = ImageFont.truetype("/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf", corner_font_size)
-                except:
-                    corner_font = font
-                
-                # Create continuous watermark pattern across entire image
-                
-                # Pattern watermarks same size as main watermark
-                pattern_font_size = font_size  # Same massive size
-                try:
-                    pattern_font = ImageFont.truetype("/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf", pattern_font_size)
-                except:
-                    pattern_font = font
-                
-                # Get text dimensions
-                pattern_bbox = draw.textbbox((0, 0), watermark_id, font=pattern_font)
-                pattern_width = pattern_bbox[2] - pattern_bbox[0]
-                pattern_height = pattern_bbox[3] - pattern_bbox[1]
-                
-                # Add more spacing between watermarks to prevent text overlap
-                spacing = 20
-                
-                # Calculate how many watermarks fit horizontally
-                watermarks_per_row = (width + spacing) // (pattern_width + spacing)
-                
-                # Calculate how many rows we need to cover the image
-                rows_needed = (height + spacing) // (pattern_height + spacing) + 1
-                
-                # Create continuous pattern with commas - much more visible
-                for row in range(rows_needed):
-                    y_pos = row * (pattern_height + spacing)
-                    
-                    # Create a continuous line of watermarks with commas
-                    x_pos = 0
-                    for col in range(watermarks_per_row + 2):  # Extra watermarks to ensure full coverage
-                        if x_pos < width:
-                            # Draw watermark with higher opacity for visibility
-                            draw.text((x_pos, y_pos), watermark_id, fill=(255, 255, 255, 60), font=pattern_font)  # More visible
-                            x_pos += pattern_width + spacing  # Add spacing to prevent overlap
-                
-                # Add much more prominent watermark in corners for visibility
-                corner_font_size = max(35, min(width, height) // 20)  # Much larger corners
-                try:
-                    corner_font = ImageFont.truetype("/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf", corner_font_size)
-                except:
-                    corner_font = pattern_font
-                
-                corner_bbox = draw.textbbox((0, 0), watermark_id, font=corner_font)
-                corner_width = corner_bbox[2] - corner_bbox[0]
-                corner_height = corner_bbox[3] - corner_bbox[1]
-                
-                # Four corners with backgrounds for maximum visibility and no overlap
-                corner_padding = 15
-                
-                # Top-left corner with background
-                draw.rectangle([5, 5, corner_width + 25, corner_height + 25], fill=(0, 0, 0, 160))
-                draw.text((15, 15), watermark_id, fill=(255, 255, 255, 255), font=corner_font)
-                
-                # Top-right corner with background
-                draw.rectangle([width - corner_width - 25, 5, width - 5, corner_height + 25], fill=(0, 0, 0, 160))
-                draw.text((width - corner_width - 15, 15), watermark_id, fill=(255, 255, 255, 255), font=corner_font)
-                
-                # Bottom-left corner with background
-                draw.rectangle([5, height - corner_height - 25, corner_width + 25, height - 5], fill=(0, 0, 0, 160))
-                draw.text((15, height - corner_height - 15), watermark_id, fill=(255, 255, 255, 255), font=corner_font)
-                
-                # Bottom-right corner with background
-                draw.rectangle([width - corner_width - 25, height - corner_height - 25, width - 5, height - 5], fill=(0, 0, 0, 160))
-                draw.text((width - corner_width - 15, height - corner_height - 15), watermark_id, fill=(255, 255, 255, 255), font=corner_font)
-                
-                # Center watermark same size as main watermark
-                center_font_size = font_size  # Same massive size
-                try:
-                    center_font = ImageFont.truetype("/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf", center_font_size)
-                except:
-                    center_font = corner_font
-                
-                center_bbox = draw.textbbox((0, 0), watermark_id, font=center_font)
-                center_width = center_bbox[2] - center_bbox[0]
-                center_height = center_bbox[3] - center_bbox[1]
-                center_x = (width - center_width) // 2
-                center_y = (height - center_height) // 2
-                
-                # Large background for center watermark
-                bg_padding = 30
-                draw.rectangle(
-                    [center_x - bg_padding, center_y - bg_padding, center_x + center_width + bg_padding, center_y + center_height + bg_padding],
-                    fill=(0, 0, 0, 140)
-                )
-                
-                # Center watermark with high opacity for maximum visibility
-                draw.text((center_x, center_y), watermark_id, fill=(255, 255, 255, 255), font=center_font)
-                
-                # Composite the overlay onto the original image
-                watermarked = Image.alpha_composite(img, overlay)
-                
-                # Save the watermarked image
-                output_filename = f"{watermark_id}_{os.path.basename(image_path)}"
-                output_path = os.path.join(self.output_dir, output_filename)
-                
-                # Check original file format to preserve transparency
-                original_format = Image.open(image_path).format
-                file_extension = os.path.splitext(image_path)[1].lower()
-                
-                if file_extension == '.png' and original_format == 'PNG':
-                    # Keep PNG format with transparency
-                    watermarked.save(output_path, 'PNG', optimize=True)
-                else:
-                    # Convert to RGB for JPEG
-                    if watermarked.mode == 'RGBA':
-                        rgb_img = Image.new('RGB', watermarked.size, (255, 255, 255))
-                        rgb_img.paste(watermarked, mask=watermarked.split()[-1])
-                        watermarked = rgb_img
-                    
-                    # Change extension to .jpg for non-PNG files
-                    base_name = os.path.splitext(output_filename)[0]
-                    output_filename = f"{base_name}.jpg"
-                    output_path = os.path.join(self.output_dir, output_filename)
-                    watermarked.save(output_path, 'JPEG', quality=95, optimize=True)
-                
-                return {'success': True, 'processed_filename': output_filename}
-                
-        except Exception as e:
-            print(f"Error processing image: {e}")
-            return {'success': False, 'error': str(e)}
+        return await self.render_pool.run(render_image, image_path, self.output_dir, watermark_id)
     
     async def process_video(self, video_path: str, watermark_id: str, description: str) -> Dict:
         """Process a video with watermark"""
+        # Long videos are split across the pool when ffmpeg is around to join the parts
+        if self.video_segments > 1 and self.ffmpeg_available:
+            info = await self.render_pool.run(probe_video, video_path)
+            segments = plan_video_segments(info['frames'], self.video_segments, self.min_segment_frames)
+            if len(segments) > 1:
+                return await self.process_video_segments(video_path, watermark_id, segments)
+        
+        return await self.render_pool.run(render_video, video_path, self.output_dir, watermark_id)
+    
+    async def process_video_segments(self, video_path: str, watermark_id: str, segments) -> Dict:
+        """Render frame-range segments in parallel, then concatenate them without re-encoding"""
+        output_filename = f"{watermark_id}_{os.path.basename(video_path)}"
+        output_path = os.path.join(self.output_dir, output_filename)
+        file_extension = os.path.splitext(video_path)[1].lower()
+        work_dir = os.path.join(self.temp_dir, f"segments_{watermark_id}")
+        os.makedirs(work_dir, exist_ok=True)
+        
         try:
-            output_filename = f"{watermark_id}_{os.path.basename(video_path)}"
-            output_path = os.path.join(self.output_dir, output_filename)
-            
-            # Open video
-            cap = cv2.VideoCapture(video_path)
-            
-            # Get video properties
-            fps = int(cap.get(cv2.CAP_PROP_FPS))
-            width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-            height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-            total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-            
-            # Define codec and create VideoWriter with better compatibility
-            fourcc = cv2.VideoWriter_fourcc(*'H264')
-            out = cv2.VideoWriter(output_path, fourcc, fps, (width, height))
+            segment_paths = [os.path.abspath(os.path.join(work_dir, f"segment_{i:03d}{file_extension}")) for i in range(len(segments))]
+            results = await asyncio.gather(*[
+                self.render_pool.run(render_video_segment, video_path, segment_path, watermark_id, start, end)
+                for segment_path, (start, end) in zip(segment_paths, segments)
+            ])
             
-            # Calculate text properties - massive size
-            font = cv2.FONT_HERSHEY_SIMPLEX
-            font_scale = max(12.0, min(width, height) / 50)  # Massive font scale
-            thickness = max(20, int(font_scale * 10))  # Very thick text
+            failed = [result for result in results if not result['success']]
+            if failed:
+                return {'success': False, 'error': failed[0].get('error', 'Segment render failed'),
+                        'transient': failed[0].get('transient', False)}
             
-            frame_count = 0
-            
-            while True:
-                ret, frame = cap.read()
-                if not ret:
-                    break
-                
-                # Add watermarks to frame
-                # Bottom-right watermark
-                text_size = cv2.getTextSize(watermark_id, font, font_scale, thickness)[0]
-                x = width - text_size[0] - 20
-                y = height - 20
-                
-                # Add background rectangle
-                cv2.rectangle(frame, (x - 10, y - text_size[1] - 10), (x + text_size[0] + 10, y + 10), (0, 0, 0), -1)
-                cv2.putText(frame, watermark_id, (x, y), font, font_scale, (255, 255, 255), thickness)
-                
-                # Top-left watermark
-                cv2.putText(frame, watermark_id, (10, 30), font, font_scale * 0.7, (255, 255, 255), max(1, thickness - 1))
-                
-                # Top-right watermark
-                top_right_x = width - text_size[0] - 10
-                cv2.putText(frame, watermark_id, (top_right_x, 30), font, font_scale * 0.7, (255, 255, 255), max(1, thickness - 1))
-                
-                # Center watermark (every 20 frames for more frequent visibility)
-                if frame_count % 20 == 0:
-                    center_text = f"{watermark_id}"
-                    center_size = cv2.getTextSize(center_text, font, font_scale * 2.0, thickness + 2)[0]  # Much larger center
-                    center_x = (width - center_size[0]) // 2
-                    center_y = (height + center_size[1]) // 2
-                    
-                    # More prominent background
-                    center_overlay = frame.copy()
-                    cv2.rectangle(center_overlay, (center_x - 30, center_y - 50), (center_x + center_size[0] + 30, center_y + 30), (0, 0, 0), -1)
-                    cv2.addWeighted(center_overlay, 0.6, frame, 0.4, 0, frame)  # More visible background
-                    cv2.putText(frame, center_text, (center_x, center_y), font, font_scale * 2.0, (255, 255, 255), thickness + 2)
-                
-                # Create overlay for transparent watermarks covering entire screen
-                overlay = frame.copy()
-                
-                # Grid pattern with proper spacing to avoid text overlap
-                grid_rows = 8   # Fewer rows to prevent overlap
-                grid_cols = 10  # Fewer columns to prevent overlap
-                
-                for row in range(grid_rows):
-                    for col in range(grid_cols):
-                        # Calculate position for each watermark
-                        x_pos = (col * width) // grid_cols + (width // grid_cols // 2)
-                        y_pos = (row * height) // grid_rows + (height // grid_rows // 2)
-                        
-                        # Massive, highly visible watermarks in grid
-                        if (row + col) % 3 == 0:
-                            scale = font_scale * 1.5  # Massive
-                        elif (row + col) % 3 == 1:
-                            scale = font_scale * 1.3  # Very large
-                        else:
-                            scale = font_scale * 1.4  # Very large
-                        
-                        # Add watermark to overlay with higher thickness
-                        cv2.putText(overlay, watermark_id, (x_pos, y_pos), font, scale, (255, 255, 255), max(2, thickness))
-                
-                # Much larger corner watermarks for maximum visibility
-                corner_scale = font_scale * 1.2  # Much larger corners
-                text_size = cv2.getTextSize(watermark_id, font, corner_scale, thickness + 1)[0]
-                
-                cv2.putText(overlay, watermark_id, (15, 35), font, corner_scale, (255, 255, 255), thickness + 1)
-                cv2.putText(overlay, watermark_id, (width - text_size[0] - 15, 35), font, corner_scale, (255, 255, 255), thickness + 1)
-                cv2.putText(overlay, watermark_id, (15, height - 15), font, corner_scale, (255, 255, 255), thickness + 1)
-                cv2.putText(overlay, watermark_id, (width - text_size[0] - 15, height - 15), font, corner_scale, (255, 255, 255), thickness + 1)
-                
-                # Edge watermarks for extra coverage - larger and more frequent
-                edge_scale = font_scale * 0.7  # Much larger edge watermarks
-                edge_spacing = 60  # Closer spacing for more coverage
-                
-                # Top and bottom edges
-                for x in range(edge_spacing, width - edge_spacing, edge_spacing):
-                    cv2.putText(overlay, watermark_id, (x, 25), font, edge_scale, (255, 255, 255), max(2, thickness-1))
-                    cv2.putText(overlay, watermark_id, (x, height - 15), font, edge_scale, (255, 255, 255), max(2, thickness-1))
-                
-                # Left and right edges
-                for y in range(edge_spacing, height - edge_spacing, edge_spacing):
-                    cv2.putText(overlay, watermark_id, (10, y), font, edge_scale, (255, 255, 255), 1)
-                    edge_text_size = cv2.getTextSize(watermark_id, font, edge_scale, 1)[0]
-                    cv2.putText(overlay, watermark_id, (width - edge_text_size[0] - 10, y), font, edge_scale, (255, 255, 255), 1)
-                
-                # Apply overlay with 0.6 transparency
-                cv2.addWeighted(overlay, 0.6, frame, 0.4, 0, frame)
-                
-                out.write(frame)
-                frame_count += 1
+            # Stream-copy concat: segments share codec settings, so no re-encode is needed
+            list_path = os.path.join(work_dir, "segments.txt")
+            with open(list_path, 'w') as f:
+                for segment_path in segment_paths:
+                    f.write(f"file '{segment_path}'\n")
             
-            # Release everything
-            cap.release()
-            out.release()
+            proc = await asyncio.create_subprocess_exec(
+                'ffmpeg', '-y', '-loglevel', 'error', '-f', 'concat', '-safe', '0',
+                '-i', list_path, '-c', 'copy', output_path,
+                stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.PIPE
+            )
+            _, stderr = await proc.communicate()
+            if proc.returncode != 0:
+                return {'success': False, 'error': f"Segment concat failed: {stderr.decode(errors='replace').strip()[:200]}"}
             
             return {'success': True, 'processed_filename': output_filename}
             
         except Exception as e:
-            print(f"Error processing video: {e}")
-            return {'success': False, 'error': str(e)}
+            print(f"Error processing video segments: {e}")
+            return {'success': False, 'error': str(e), 'transient': is_transient_error(e)}
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    
+    def get_render_stats(self) -> Dict:
+        """Get render pool size, queue depth and recent job timings"""
+        return self.render_pool.get_stats()
     
     def get_processed_file(self, watermark_id: str) -> Optional[Dict]:
         """Get processed file information by watermark ID"""
-        return self.processed_files.get(watermark_id)
+        return self.store.get(watermark_id)
     
     def get_all_processed_files(self) -> Dict:
         """Get all processed files"""
-        return self.processed_files.copy()
+        return self.store.all()
+    
+    def get_recent_processed_files(self, limit: int = 25) -> List[Dict]:
+        """Get the most recently processed files, newest first"""
+        return self.store.recent(limit)
+    
+    def get_processed_file_count(self, file_type: Optional[str] = None) -> int:
+        """Count processed files, optionally of one file type"""
+        return self.store.count(file_type)
+    
+    def get_processed_total_size(self) -> int:
+        """Bytes of watermarked output, from the sizes recorded when each file was processed"""
+        missing = self.store.missing_sizes()
+        if missing:
+            # Records from before file_size was stored get measured once (0 if the output is gone)
+            sizes = []
+            for watermark_id, processed_filename in missing:
+                path = os.path.join(self.output_dir, processed_filename or '')
+                sizes.append((watermark_id, os.path.getsize(path) if processed_filename and os.path.isfile(path) else 0))
+            self.store.set_file_sizes(sizes)
+        return self.store.total_size()
+    
+    def get_processed_files_version(self) -> tuple:
+        """Changes whenever processed file records change, in this process or the other one"""
+        return self.store.version()
+    
+    def delete_processed_file(self, watermark_id: str) -> Optional[Dict]:
+        """Delete a processed file's record, output and kept source, returns the removed record"""
+        record = self.store.delete(watermark_id)
+        if record is None:
+            return None
+        
+        for directory, key in ((self.output_dir, 'processed_filename'), (self.sources_dir, 'source_filename')):
+            if record.get(key):
+                try:
+                    os.remove(os.path.join(directory, record[key]))
+                except OSError:
+                    pass
+        return record
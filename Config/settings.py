@@ -16,11 +16,28 @@ SUPPORTED_VIDEO_FORMATS = ['.mp4', '.mov', '.avi']
 WATERMARK_OPACITY = float(os.getenv('WATERMARK_OPACITY', '0.7'))
 WATERMARK_FONT_SIZE_RATIO = float(os.getenv('WATERMARK_FONT_SIZE_RATIO', '30'))  # Divisor for image size
 
+# Render Configuration
+RENDER_WORKERS = int(os.getenv('RENDER_WORKERS', '0')) or (os.cpu_count() or 1)  # Render pool processes
+PER_RECIPIENT_WATERMARKS = os.getenv('PER_RECIPIENT_WATERMARKS', 'false').lower() in ('1', 'true', 'yes')  # Stamp claimant IDs on images
+RECIPIENT_RENDER_THREADS = int(os.getenv('RECIPIENT_RENDER_THREADS', '4'))
+# Parallel video segments, 0 = one per render worker. Segments are joined with the
+# ffmpeg binary, which must be on PATH; without it videos render as a single segment
+VIDEO_SEGMENTS = int(os.getenv('VIDEO_SEGMENTS', '0'))
+VIDEO_MIN_SEGMENT_FRAMES = int(os.getenv('VIDEO_MIN_SEGMENT_FRAMES', '300'))
+RENDER_JOB_WORKERS = int(os.getenv('RENDER_JOB_WORKERS', '2'))  # Upload jobs rendered concurrently
+JOB_MAX_ATTEMPTS = int(os.getenv('JOB_MAX_ATTEMPTS', '3'))
+JOB_RETRY_DELAY_SECONDS = float(os.getenv('JOB_RETRY_DELAY_SECONDS', '10'))  # Doubles with each failed attempt
+
 # Rate Limiting
 DM_DELAY_SECONDS = float(os.getenv('DM_DELAY_SECONDS', '1.0'))
+DM_BURST = int(os.getenv('DM_BURST', '5'))  # DMs that may go out back to back before pacing kicks in
+DM_CONCURRENCY = int(os.getenv('DM_CONCURRENCY', '4'))
+BULK_DM_DELAY_SECONDS = float(os.getenv('BULK_DM_DELAY_SECONDS', '0.25'))  # Bulk campaigns have their own queue and pace
+BULK_DM_MAX_RECIPIENTS = int(os.getenv('BULK_DM_MAX_RECIPIENTS', '5000'))
+ATTACHMENT_CACHE_MB = int(os.getenv('ATTACHMENT_CACHE_MB', '256'))  # Memory for DM attachment bytes
 
 # Logging Configuration
-MAX_LOG_ENTRIES = int(os.getenv('MAX_LOG_ENTRIES', '1000'))
+MAX_LOG_ENTRIES = int(os.getenv('MAX_LOG_ENTRIES', '1000'))  # Recent entries kept in memory; the full history is in data/logs
 
 # Web Server Configuration - GCE compatibility
 WEB_SERVER_PORT = int(os.getenv('PORT', '5000'))
@@ -47,6 +64,8 @@ print(f"✅ Bot configuration loaded:")
 print(f"   - Command Prefix: {COMMAND_PREFIX}")
 print(f"   - Max File Size: {MAX_FILE_SIZE_MB}MB")
 print(f"   - Log Channel ID: {LOG_CHANNEL_ID or 'Not set'}")
-print(f"   - DM Delay: {DM_DELAY_SECONDS}s")
+print(f"   - DM Delay: {DM_DELAY_SECONDS}s (burst {DM_BURST}, {DM_CONCURRENCY} concurrent)")
+print(f"   - Render Workers: {RENDER_WORKERS}")
+print(f"   - Per-Recipient Watermarks: {'Enabled' if PER_RECIPIENT_WATERMARKS else 'Disabled'}")
 print(f"   - Web Server Port: {WEB_SERVER_PORT}")
 print(f"   - Bot Owner ID: {BOT_OWNER_ID or 'Not set'}")
@@ -3,14 +3,26 @@ import discord
 from discord.ext import commands
 import os
 import asyncio
-import json
-import tempfile
-import requests
+import aiohttp
 from datetime import datetime
 from bot.watermark import WatermarkProcessor
 from bot.user_manager import UserManager
 from bot.logger import BotLogger
 from bot.normal_content import NormalContentManager
+from bot.job_queue import JobQueue
+from bot.claim_store import ClaimStore
+from bot.dm_scheduler import DMScheduler
+from bot.user_resolver import UserResolver
+from bot.bulk_campaign import BulkCampaign
+from bot.attachment_cache import AttachmentCache
+from bot.downloader import Downloader, DownloadError
+from bot.recipient_render import RecipientRenderer, split_recipient_id, match_recipient
+from Config.settings import (
+    MAX_FILE_SIZE_MB, RENDER_WORKERS, PER_RECIPIENT_WATERMARKS, RECIPIENT_RENDER_THREADS,
+    VIDEO_SEGMENTS, VIDEO_MIN_SEGMENT_FRAMES, RENDER_JOB_WORKERS, JOB_MAX_ATTEMPTS, JOB_RETRY_DELAY_SECONDS,
+    DM_DELAY_SECONDS, DM_BURST, DM_CONCURRENCY, BULK_DM_DELAY_SECONDS, BULK_DM_MAX_RECIPIENTS,
+    ATTACHMENT_CACHE_MB, MAX_LOG_ENTRIES, LOG_CHANNEL_ID
+)
 
 # Your Discord User ID as bot owner
 BOT_OWNER_ID = 841757046625534002
@@ -19,16 +31,111 @@ BOT_OWNER_ID = 841757046625534002
 intents = discord.Intents.all()
 bot = commands.Bot(command_prefix='!', intents=intents)
 
-# Initialize components
-watermark_processor = WatermarkProcessor()
-user_manager = UserManager()
-normal_content_manager = NormalContentManager()
-logger = BotLogger()
+def init_components():
+    """Create the shared components; called only from the real bot process.
+    
+    Render workers are spawned and re-import this script as __mp_main__, so nothing
+    here may run at import time or each worker would open its own logger, claim
+    journal, job queue and database on the files the bot is writing.
+    """
+    global watermark_processor, job_queue, recipient_renderer, downloader, claim_store, dm_scheduler, campaign_scheduler
+    global user_resolver, attachment_cache, bulk_campaign, user_manager, normal_content_manager, logger
+    
+    watermark_processor = WatermarkProcessor(
+        render_workers=RENDER_WORKERS,
+        per_recipient=PER_RECIPIENT_WATERMARKS,
+        video_segments=VIDEO_SEGMENTS,
+        min_segment_frames=VIDEO_MIN_SEGMENT_FRAMES
+    )
+    job_queue = JobQueue(watermark_processor, workers=RENDER_JOB_WORKERS, max_attempts=JOB_MAX_ATTEMPTS,
+                         retry_delay=JOB_RETRY_DELAY_SECONDS)
+    job_queue.on_finished = lambda job, result: send_job_result(job, result)
+    recipient_renderer = RecipientRenderer(watermark_processor, max_workers=RECIPIENT_RENDER_THREADS) if PER_RECIPIENT_WATERMARKS else None
+    downloader = Downloader(max_bytes=MAX_FILE_SIZE_MB * 1024 * 1024)
+    claim_store = ClaimStore()
+    dm_scheduler = DMScheduler(delay_seconds=DM_DELAY_SECONDS, burst=DM_BURST, max_concurrency=DM_CONCURRENCY)
+    # Separate pace for bulk campaigns: a 1000-user send takes minutes and reveals aren't stuck behind it
+    campaign_scheduler = DMScheduler(delay_seconds=BULK_DM_DELAY_SECONDS, burst=DM_BURST, max_concurrency=DM_CONCURRENCY)
+    user_resolver = UserResolver(bot)
+    attachment_cache = AttachmentCache(watermark_processor.output_dir, max_bytes=ATTACHMENT_CACHE_MB * 1024 * 1024)
+    bulk_campaign = BulkCampaign(campaign_scheduler, claim_store, user_resolver)
+    user_manager = UserManager()
+    normal_content_manager = NormalContentManager()
+    logger = BotLogger(max_recent=MAX_LOG_ENTRIES)
 
 def is_owner(user_id):
     """Check if user is the bot owner"""
     return user_id == BOT_OWNER_ID
 
+async def send_job_result(job, result, interaction=None):
+    """Tell the uploader how their watermark job ended"""
+    if result.get('status') == 'success':
+        watermark_id = result.get('watermark_id', 'Unknown')
+        message = f"File uploaded and watermarked successfully!\nWatermark ID: `{watermark_id}`\nUse `/reveal {watermark_id}` to create a booster reveal."
+        
+        if job and job.get('requester_id'):
+            try:
+                uploader = interaction.user if interaction is not None else (bot.get_user(job['requester_id']) or await bot.fetch_user(job['requester_id']))
+                await logger.log_upload(uploader, watermark_id, job.get('original_filename') or 'Unknown', job.get('description') or 'No description')
+            except discord.HTTPException as e:
+                print(f"Error logging upload for job {job['id']}: {e}")
+    else:
+        message = f"Upload failed: {result.get('error', 'Unknown error')}"
+    
+    # Interaction followups expire after 15 minutes, fall back to a DM
+    if interaction is not None:
+        try:
+            await interaction.followup.send(message, ephemeral=True)
+            return
+        except discord.HTTPException:
+            pass
+    
+    if job and job.get('requester_id'):
+        user = bot.get_user(job['requester_id']) or await bot.fetch_user(job['requester_id'])
+        await dm_scheduler.send(user, f"Job #{job['id']}: {message}", key="jobs")
+
+# Strong references to fire-and-forget notices so they aren't garbage collected mid-send
+background_tasks = set()
+
+def run_in_background(coro):
+    task = asyncio.create_task(coro)
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+
+# (watermark_id, user_id) of reveal DMs still in the queue; a second click can't queue another copy
+pending_reveals = set()
+
+def report_reveal_delivery(future, interaction, watermark_id):
+    """Done callback for a queued reveal DM: record the claim once delivered, tell the claimant when it wasn't"""
+    pending_reveals.discard((watermark_id, interaction.user.id))
+    if future.cancelled():
+        return
+    
+    error = future.exception()
+    if error is None:
+        claim_store.claim(watermark_id, interaction.user.id, source="button")
+        run_in_background(logger.log_delivery(interaction.user, watermark_id, "success_reveal", bot.user))
+        return
+    
+    # Nothing was recorded, so the claimant can click again once the problem is fixed
+    print(f"Reveal DM of {watermark_id} to {interaction.user.id} failed: {error}")
+    if isinstance(error, discord.Forbidden):
+        message = "Couldn't deliver your copy: your DMs are closed. Open them and click again."
+        status = "failed_dms_closed"
+    else:
+        message = "Couldn't deliver your copy, please try again in a moment."
+        status = "failed"
+    run_in_background(logger.log_delivery(interaction.user, watermark_id, status, bot.user))
+    
+    async def notify():
+        # Followup tokens expire after 15 minutes; past that the console line above is all we can do
+        try:
+            await interaction.followup.send(message, ephemeral=True)
+        except discord.HTTPException:
+            pass
+    
+    run_in_background(notify())
+
 @bot.event
 async def on_ready():
     print(f'{bot.user} has connected to Discord!')
@@ -37,6 +144,25 @@ async def on_ready():
     # Add persistent view to handle buttons after restart
     bot.add_view(RevealView(""))
     
+    # Spin up the render workers so the first upload doesn't pay for imports
+    watermark_processor.render_pool.start()
+    
+    # Resume any watermark jobs interrupted by a restart
+    job_queue.start()
+    
+    # Mirror log entries to the log channel, if one is configured
+    if LOG_CHANNEL_ID:
+        try:
+            logger.set_log_channel(bot.get_channel(LOG_CHANNEL_ID) or await bot.fetch_channel(LOG_CHANNEL_ID))
+        except discord.HTTPException as e:
+            print(f'Log channel {LOG_CHANNEL_ID} unavailable, logging to file only: {e}')
+    
+    # Background claim journal and log flushing, paced DM delivery
+    claim_store.start()
+    logger.start()
+    dm_scheduler.start()
+    campaign_scheduler.start()
+    
     try:
         synced = await bot.tree.sync()
         print(f'Synced {len(synced)} command(s)')
@@ -105,32 +231,10 @@ async def add_admin_command(interaction: discord.Interaction, user: discord.Memb
     user_manager.add_admin(user.id)
     await interaction.response.send_message(f"{user.mention} has been added as a bot admin.", ephemeral=True)
 
-@bot.tree.command(name="trace", description="Trace who downloaded specific watermarked content")
-async def trace_command(interaction: discord.Interaction, watermark_id: str):
-    """Trace downloads for specific watermarked content"""
-    if not is_owner(interaction.user.id):
-        await interaction.response.send_message("Only the bot owner can use this command.", ephemeral=True)
-        return
-    
-    # Get processed file info
-    processed_file = watermark_processor.get_processed_file(watermark_id)
-    if not processed_file:
-        await interaction.response.send_message("Watermark ID not found.", ephemeral=True)
-        return
-    
-    # Load claims to see who downloaded
-    claims_file = 'data/reveal_claims.json'
-    claimed_users = []
-    
-    try:
-        if os.path.exists(claims_file):
-            with open(claims_file, 'r') as f:
-                all_claims = json.load(f)
-                claimed_users = all_claims.get(watermark_id, [])
-    except:
-        claimed_users = []
-    
-    # Create trace report
+TRACE_PAGE_SIZE = 15
+
+async def build_trace_embed(watermark_id, processed_file, claimed_users, page=0, recipient_code=None, guild=None):
+    """Trace report for one page of claimants; only that page's names are looked up"""
     embed = discord.Embed(
         title=f"Trace Report: {watermark_id}",
         description=f"**File:** {processed_file.get('original_filename', 'Unknown')}\n**Description:** {processed_file.get('description', 'No description')}",
@@ -138,20 +242,18 @@ async def trace_command(interaction: discord.Interaction, watermark_id: str):
     )
     
     if claimed_users:
-        user_list = []
-        for user_id_str in claimed_users:
-            try:
-                user_id = int(user_id_str)
-                user = bot.get_user(user_id) or await bot.fetch_user(user_id)
-                user_list.append(f"• {user.display_name} ({user.mention}) - ID: {user_id}")
-            except:
-                user_list.append(f"• Unknown User - ID: {user_id_str}")
+        page_ids = claimed_users[page * TRACE_PAGE_SIZE:(page + 1) * TRACE_PAGE_SIZE]
+        names = await user_resolver.resolve_names(page_ids, guild)
+        user_list = [f"• {names.get(int(user_id), 'Unknown User')} (<@{user_id}>) - ID: {user_id}" for user_id in page_ids]
         
         embed.add_field(
             name=f"Downloaded by {len(claimed_users)} user(s):",
-            value="\n".join(user_list[:10]) + (f"\n... and {len(user_list)-10} more" if len(user_list) > 10 else ""),
+            value="\n".join(user_list),
             inline=False
         )
+        page_count = (len(claimed_users) + TRACE_PAGE_SIZE - 1) // TRACE_PAGE_SIZE
+        if page_count > 1:
+            embed.set_footer(text=f"Page {page + 1}/{page_count}")
     else:
         embed.add_field(
             name="Downloads:",
@@ -159,6 +261,31 @@ async def trace_command(interaction: discord.Interaction, watermark_id: str):
             inline=False
         )
     
+    if recipient_code:
+        leakers = match_recipient(watermark_id, recipient_code, claimed_users)
+        embed.add_field(
+            name=f"Personal Copy {watermark_id}-{recipient_code}:",
+            value="\n".join(f"• <@{user_id}> - ID: {user_id}" for user_id in leakers) if leakers else "No claimant matches this code",
+            inline=False
+        )
+    
+    # How fast the reveal was claimed: first-day count kept with the claim window, busiest hour from the hourly rollup
+    claim_window = claim_store.get_claim_window(watermark_id)
+    if claim_window:
+        first_claim, latest_claim = claim_window
+        hourly = claim_store.get_claim_curve(watermark_id, 'hour')
+        # Usually already known; reveals from before it was kept are counted once from the event archive
+        first_day = await asyncio.to_thread(claim_store.get_first_day_claims, watermark_id)
+        activity = f"First claim: <t:{int(first_claim)}:f>\nLatest claim: <t:{int(latest_claim)}:R>\nFirst 24h: {first_day} claims"
+        if hourly:
+            peak_hour, peak_count = max(hourly, key=lambda item: item[1])
+            activity += f"\nBusiest hour: <t:{peak_hour}:f> ({peak_count} claims)"
+        embed.add_field(
+            name="Claim Activity:",
+            value=activity,
+            inline=False
+        )
+    
     # Add upload info
     upload_date = processed_file.get('created_at', 'Unknown')
     if upload_date != 'Unknown' and 'T' in upload_date:
@@ -180,7 +307,36 @@ async def trace_command(interaction: discord.Interaction, watermark_id: str):
         inline=True
     )
     
-    await interaction.response.send_message(embed=embed, ephemeral=True)
+    return embed
+
+@bot.tree.command(name="trace", description="Trace who downloaded specific watermarked content")
+async def trace_command(interaction: discord.Interaction, watermark_id: str):
+    """Trace downloads for specific watermarked content"""
+    if not is_owner(interaction.user.id):
+        await interaction.response.send_message("Only the bot owner can use this command.", ephemeral=True)
+        return
+    
+    # Name lookups can outlast the 3 second interaction deadline
+    await interaction.response.defer(ephemeral=True)
+    
+    # Personal copies carry a claimant code after the watermark ID
+    watermark_id, recipient_code = split_recipient_id(watermark_id)
+    
+    # Get processed file info
+    processed_file = watermark_processor.get_processed_file(watermark_id)
+    if not processed_file:
+        await interaction.followup.send("Watermark ID not found.", ephemeral=True)
+        return
+    
+    # See who downloaded, in a stable order for paging
+    claimed_users = sorted(claim_store.get_claims(watermark_id), key=int)
+    
+    embed = await build_trace_embed(watermark_id, processed_file, claimed_users, 0, recipient_code, interaction.guild)
+    if len(claimed_users) > TRACE_PAGE_SIZE:
+        view = TracePageView(watermark_id, processed_file, claimed_users, recipient_code, interaction.guild)
+        await interaction.followup.send(embed=embed, view=view, ephemeral=True)
+    else:
+        await interaction.followup.send(embed=embed, ephemeral=True)
 
 @bot.tree.command(name="trace_all", description="Show download statistics for all content")
 async def trace_all_command(interaction: discord.Interaction):
@@ -189,22 +345,11 @@ async def trace_all_command(interaction: discord.Interaction):
         await interaction.response.send_message("Only the bot owner can use this command.", ephemeral=True)
         return
     
-    # Get all processed files
-    all_files = watermark_processor.get_all_processed_files()
-    if not all_files:
+    total_files = watermark_processor.get_processed_file_count()
+    if not total_files:
         await interaction.response.send_message("No watermarked content found.", ephemeral=True)
         return
     
-    # Load all claims
-    claims_file = 'data/reveal_claims.json'
-    all_claims = {}
-    try:
-        if os.path.exists(claims_file):
-            with open(claims_file, 'r') as f:
-                all_claims = json.load(f)
-    except:
-        all_claims = {}
-    
     # Create summary report
     embed = discord.Embed(
         title="Complete Trace Report",
@@ -212,21 +357,28 @@ async def trace_all_command(interaction: discord.Interaction):
         color=0x0099ff
     )
     
-    total_files = len(all_files)
-    total_downloads = sum(len(claims) for claims in all_claims.values())
+    total_downloads = claim_store.get_total_claims()
     
     embed.add_field(name="Total Files:", value=str(total_files), inline=True)
     embed.add_field(name="Total Downloads:", value=str(total_downloads), inline=True)
     embed.add_field(name="Average Downloads:", value=f"{total_downloads/total_files:.1f}" if total_files > 0 else "0", inline=True)
     
-    # Show top downloaded content
+    # Show top downloaded content from the incrementally kept ranking; deleted content is skipped
     file_stats = []
-    for watermark_id, file_info in all_files.items():
-        download_count = len(all_claims.get(watermark_id, []))
-        filename = file_info.get('original_filename', 'Unknown')[:30]
-        file_stats.append((download_count, watermark_id, filename))
+    for watermark_id, download_count in claim_store.get_top(claim_store.top_k):
+        file_info = watermark_processor.get_processed_file(watermark_id)
+        if not file_info:
+            # Deleted from the dashboard, which runs in its own process; free the slot for live content
+            claim_store.forget(watermark_id)
+        elif len(file_stats) < 10:
+            file_stats.append((download_count, watermark_id, file_info.get('original_filename', 'Unknown')[:30]))
     
-    file_stats.sort(reverse=True)  # Sort by download count
+    # Fewer than 10 downloaded files: fill up with recent content nobody has claimed yet
+    if len(file_stats) < 10:
+        for file_info in watermark_processor.get_recent_processed_files(10):
+            watermark_id = file_info['watermark_id']
+            if len(file_stats) < 10 and not claim_store.get_claim_count(watermark_id):
+                file_stats.append((0, watermark_id, file_info.get('original_filename', 'Unknown')[:30]))
     
     if file_stats:
         top_files = []
@@ -254,6 +406,9 @@ async def send_dm_command(interaction: discord.Interaction, user: discord.Member
         await interaction.response.send_message("Watermark ID not found.", ephemeral=True)
         return
     
+    # The DM waits its turn in the paced queue, which can take longer than the 3 second response deadline
+    await interaction.response.defer(ephemeral=True)
+    
     # Create DM message
     upload_date = processed_file.get('created_at', 'Unknown')
     if upload_date != 'Unknown' and 'T' in upload_date:
@@ -274,76 +429,80 @@ This content was sent directly by {interaction.user.display_name}."""
         # Send watermarked file
         processed_filename = processed_file.get('processed_filename', '')
         if processed_filename:
-            watermarked_file_path = os.path.join('output', processed_filename)
-            if os.path.exists(watermarked_file_path):
-                with open(watermarked_file_path, 'rb') as f:
-                    file = discord.File(f, filename=processed_filename)
-                    await user.send(content=dm_message, file=file)
+            file_factory = await attachment_cache.file_factory(processed_filename)
+            if file_factory is not None:
+                await dm_scheduler.send(user, dm_message, file_factory, key=watermark_id)
             else:
-                await user.send(dm_message + "\n\nFile not available on server.")
+                await dm_scheduler.send(user, dm_message + "\n\nFile not available on server.", key=watermark_id)
         else:
-            await user.send(dm_message + "\n\nNo file available.")
+            await dm_scheduler.send(user, dm_message + "\n\nNo file available.", key=watermark_id)
         
         # Record this manual delivery in claims
-        claims_file = 'data/reveal_claims.json'
-        os.makedirs('data', exist_ok=True)
-        
-        all_claims = {}
-        if os.path.exists(claims_file):
-            try:
-                with open(claims_file, 'r') as f:
-                    all_claims = json.load(f)
-            except:
-                all_claims = {}
-        
-        if watermark_id not in all_claims:
-            all_claims[watermark_id] = []
-        
-        user_id_str = str(user.id)
-        if user_id_str not in all_claims[watermark_id]:
-            all_claims[watermark_id].append(user_id_str)
-        
-        try:
-            with open(claims_file, 'w') as f:
-                json.dump(all_claims, f, indent=2)
-        except Exception as e:
-            print(f"Failed to save manual delivery record: {e}")
+        claim_store.claim(watermark_id, user.id, source="send_dm")
+        await logger.log_delivery(user, watermark_id, "success", interaction.user)
         
-        # Defer after we know we're processing
-        await interaction.response.defer(ephemeral=True)
         await interaction.followup.send(f"Successfully sent {processed_file.get('original_filename', 'content')} to {user.display_name} via DM.", ephemeral=True)
         
     except discord.Forbidden:
-        if not interaction.response.is_done():
-            await interaction.response.send_message(f"Cannot send DM to {user.display_name}. They may have DMs disabled.", ephemeral=True)
-        else:
-            await interaction.followup.send(f"Cannot send DM to {user.display_name}. They may have DMs disabled.", ephemeral=True)
+        await logger.log_delivery(user, watermark_id, "failed_dms_closed", interaction.user)
+        await interaction.followup.send(f"Cannot send DM to {user.display_name}. They may have DMs disabled.", ephemeral=True)
     except Exception as e:
-        if not interaction.response.is_done():
-            await interaction.response.send_message(f"Failed to send content to {user.display_name}: {str(e)}", ephemeral=True)
-        else:
-            await interaction.followup.send(f"Failed to send content to {user.display_name}: {str(e)}", ephemeral=True)
+        await interaction.followup.send(f"Failed to send content to {user.display_name}: {str(e)}", ephemeral=True)
+
+def parse_user_ids(text: str):
+    """User IDs from pasted IDs or mentions separated by spaces, commas or newlines"""
+    user_input = text.replace(',', ' ').replace('<@', '').replace('>', '').replace('!', '')
+    user_ids = []
+    
+    for item in user_input.split():
+        try:
+            user_ids.append(int(item.strip()))
+        except:
+            continue
+    return user_ids
 
 @bot.tree.command(name="bulk_dm", description="Send content to multiple users via dropdown selection")
-async def bulk_dm_command(interaction: discord.Interaction):
+@discord.app_commands.describe(
+    role="Send to every member with this role",
+    recipients="Text file of user IDs or mentions, for lists too long to paste"
+)
+async def bulk_dm_command(interaction: discord.Interaction, role: discord.Role = None, recipients: discord.Attachment = None):
     """Send watermarked content to multiple users"""
     if not is_owner(interaction.user.id):
         await interaction.response.send_message("Only the bot owner can use this command.", ephemeral=True)
         return
     
     # Get all processed files
-    all_files = watermark_processor.get_all_processed_files()
-    if not all_files:
+    if not watermark_processor.get_processed_file_count():
         await interaction.response.send_message("No watermarked content available for bulk sending.", ephemeral=True)
         return
     
+    # The paste box holds about 200 IDs; a role or a file covers campaigns of any size
+    user_ids = None
+    if role is not None or recipients is not None:
+        user_ids = [member.id for member in role.members if not member.bot] if role is not None else []
+        if recipients is not None:
+            if recipients.size > 1024 * 1024:
+                await interaction.response.send_message("The recipients file must be under 1 MB.", ephemeral=True)
+                return
+            user_ids += parse_user_ids((await recipients.read()).decode('utf-8', errors='ignore'))
+        if not user_ids:
+            await interaction.response.send_message("No recipients found in that role or file.", ephemeral=True)
+            return
+        if len(set(user_ids)) > BULK_DM_MAX_RECIPIENTS:
+            await interaction.response.send_message(
+                f"That's {len(set(user_ids))} recipients; a single campaign is limited to {BULK_DM_MAX_RECIPIENTS}. Split the list and send it in parts.",
+                ephemeral=True
+            )
+            return
+    
     embed = discord.Embed(
         title="Bulk DM Delivery",
-        description="Select content to send to multiple users:",
+        description="Select content to send to multiple users:" if user_ids is None else f"Select content to send to {len(set(user_ids))} users:",
         color=0xff9500
     )
     
-    view = BulkDMSelectView()
+    view = BulkDMSelectView(user_ids)
     await interaction.response.send_message(embed=embed, view=view, ephemeral=True)
 
 @bot.tree.command(name="settings", description="Bot settings and configuration")
@@ -360,24 +519,31 @@ async def settings_command(interaction: discord.Interaction):
     )
     
     # Get statistics
-    all_files = watermark_processor.get_all_processed_files()
+    file_count = watermark_processor.get_processed_file_count()
     all_content = normal_content_manager.get_all_content()
     
-    # Load claims for statistics
-    claims_file = 'data/reveal_claims.json'
-    all_claims = {}
-    try:
-        if os.path.exists(claims_file):
-            with open(claims_file, 'r') as f:
-                all_claims = json.load(f)
-    except:
-        all_claims = {}
-    
-    total_downloads = sum(len(claims) for claims in all_claims.values())
+    total_downloads = claim_store.get_total_claims()
     
     embed.add_field(
         name="📊 Content Statistics",
-        value=f"Watermarked Files: {len(all_files)}\nBasic Content: {len(all_content)}\nTotal Downloads: {total_downloads}",
+        value=f"Watermarked Files: {file_count}\nBasic Content: {len(all_content)}\nTotal Downloads: {total_downloads}",
+        inline=True
+    )
+    
+    render_stats = watermark_processor.get_render_stats()
+    job_stats = job_queue.get_stats()
+    embed.add_field(
+        name="🖥️ Render Pool",
+        value=f"Workers: {render_stats['pool_size']}\nRendering: {render_stats['running']}\nQueued: {render_stats['queue_depth']}\nAvg Render: {render_stats['avg_render_seconds']:.1f}s\nJobs Waiting: {job_stats['queued']}\nJobs Failed: {job_stats['failed']}",
+        inline=True
+    )
+    
+    dm_stats = dm_scheduler.get_stats()
+    campaign_stats = campaign_scheduler.get_stats()
+    cache_stats = attachment_cache.get_stats()
+    embed.add_field(
+        name="📬 DM Delivery",
+        value=f"Queued: {dm_stats['queue_depth']}\nSending: {dm_stats['in_flight']}\nPace: {dm_stats['rate_per_second']:.2f}/s\nAvg Latency: {dm_stats['avg_latency_seconds']:.1f}s\nRate Limited: {dm_stats['rate_limited']}\nFailed: {dm_stats['failed']}\nCampaigns: {campaign_stats['queue_depth']} queued at {campaign_stats['rate_per_second']:.2f}/s\nFile Cache: {cache_stats['bytes'] / (1024 * 1024):.0f}MB, {cache_stats['hits']} hits / {cache_stats['misses']} misses",
         inline=True
     )
     
@@ -442,51 +608,34 @@ class UploadModal(discord.ui.Modal, title="Upload Content"):
         await interaction.response.defer(ephemeral=True)
         
         try:
-            # Download the file
-            response = requests.get(self.filename.value, timeout=30)
-            response.raise_for_status()
-            
-            # Get file extension
-            file_ext = os.path.splitext(self.filename.value)[1].lower()
-            if not file_ext:
-                content_type = response.headers.get('content-type', '')
-                if 'image/jpeg' in content_type:
-                    file_ext = '.jpg'
-                elif 'image/png' in content_type:
-                    file_ext = '.png'
-                elif 'video/mp4' in content_type:
-                    file_ext = '.mp4'
-                else:
-                    file_ext = '.bin'
-            
-            # Save to temp file
-            with tempfile.NamedTemporaryFile(delete=False, suffix=file_ext) as temp_file:
-                temp_file.write(response.content)
-                temp_path = temp_file.name
+            # Stream the file to disk without blocking the event loop
+            temp_path, file_ext = await downloader.download(self.filename.value)
             
             # Generate filename
             original_filename = f"upload_{datetime.now().strftime('%Y%m%d_%H%M%S')}{file_ext}"
             
             try:
-                # Process the file with watermark
-                result = await watermark_processor.process_file(
-                    temp_path, 
-                    original_filename, 
-                    self.description.value or "No description"
+                # Queue the file; the job owns it from here and survives restarts
+                job_id = job_queue.submit(
+                    temp_path,
+                    self.description.value or "No description",
+                    original_filename=original_filename,
+                    requester_id=interaction.user.id
                 )
-                
-                watermark_id = result.get('watermark_id', 'Unknown')
-                
-                await interaction.followup.send(f"File uploaded and watermarked successfully!\nWatermark ID: `{watermark_id}`\nUse `/reveal {watermark_id}` to create a booster reveal.", ephemeral=True)
-                
-            finally:
-                # Clean up temp file
+            except Exception:
                 try:
                     os.unlink(temp_path)
                 except:
                     pass
-                    
-        except requests.RequestException as e:
+                raise
+            
+            position = job_queue.get_position(job_id)
+            await interaction.followup.send(f"File downloaded and queued for watermarking (job #{job_id}, {position} ahead of it).", ephemeral=True)
+            
+            result = await job_queue.wait(job_id)
+            await send_job_result(job_queue.get_job(job_id), result, interaction)
+            
+        except (DownloadError, aiohttp.ClientError) as e:
             await interaction.followup.send(f"Failed to download file: {str(e)}", ephemeral=True)
         except Exception as e:
             await interaction.followup.send(f"Upload failed: {str(e)}", ephemeral=True)
@@ -495,42 +644,12 @@ class RevealView(discord.ui.View):
     def __init__(self, watermark_id: str):
         super().__init__(timeout=None)
         self.watermark_id = watermark_id
-        
-        # Load existing claims
-        claims_file = 'data/reveal_claims.json'
-        try:
-            if os.path.exists(claims_file):
-                with open(claims_file, 'r') as f:
-                    all_claims = json.load(f)
-                    self.claimed_users = set(all_claims.get(watermark_id, []))
-            else:
-                self.claimed_users = set()
-        except:
-            self.claimed_users = set()
-
-    def _save_claims(self):
-        claims_file = 'data/reveal_claims.json'
-        os.makedirs('data', exist_ok=True)
-        
-        all_claims = {}
-        if os.path.exists(claims_file):
-            try:
-                with open(claims_file, 'r') as f:
-                    all_claims = json.load(f)
-            except:
-                all_claims = {}
-        
-        all_claims[self.watermark_id] = list(self.claimed_users)
-        
-        try:
-            with open(claims_file, 'w') as f:
-                json.dump(all_claims, f, indent=2)
-        except Exception as e:
-            print(f"Failed to save claims: {e}")
 
     @discord.ui.button(label="🎁 Claim Your Copy", style=discord.ButtonStyle.primary, custom_id="persistent_reveal_button")
     async def reveal_button(self, interaction: discord.Interaction, button: discord.ui.Button):
         """ONE COPY PER USER - prevents duplicate claims"""
+        claim_key = None
+        delivery = None
         try:
             # Extract watermark_id from custom_id for persistent buttons
             if button.custom_id and button.custom_id.startswith('reveal_'):
@@ -540,34 +659,13 @@ class RevealView(discord.ui.View):
                 
             await interaction.response.defer(ephemeral=True)
             
-            # Load current claims for this specific content
-            claims_file = 'data/reveal_claims.json'
-            all_claims = {}
-            if os.path.exists(claims_file):
-                try:
-                    with open(claims_file, 'r') as f:
-                        all_claims = json.load(f)
-                except:
-                    all_claims = {}
-            
-            user_id_str = str(interaction.user.id)
-            claimed_users = set(all_claims.get(watermark_id, []))
-            
-            if user_id_str in claimed_users:
+            # The claim is recorded once the DM is delivered; until then the pending entry stops double clicks
+            if claim_store.has_claimed(watermark_id, interaction.user.id):
                 await interaction.followup.send("You already have this content.", ephemeral=True)
                 return
-            
-            # Add user to claims
-            claimed_users.add(user_id_str)
-            all_claims[watermark_id] = list(claimed_users)
-            
-            # Save claims
-            os.makedirs('data', exist_ok=True)
-            try:
-                with open(claims_file, 'w') as f:
-                    json.dump(all_claims, f, indent=2)
-            except Exception as e:
-                print(f"Failed to save claims: {e}")
+            if (watermark_id, interaction.user.id) in pending_reveals:
+                await interaction.followup.send("Your copy is already on its way.", ephemeral=True)
+                return
             
             processed_file = watermark_processor.get_processed_file(watermark_id)
             if not processed_file:
@@ -588,26 +686,68 @@ class RevealView(discord.ui.View):
 Date: {upload_date}
 {processed_file.get('description', '')}"""
             
-            # Send watermarked file
+            # Personal copy with the claimant's ID stamped on it, when enabled; rendered when its DM goes out
+            personal_factory = None
+            if recipient_renderer:
+                personal_factory = recipient_renderer.file_factory(watermark_id, interaction.user.id)
+            
+            # Queue the watermarked file; a big reveal can keep the queue busy for minutes, so don't wait on it here
+            claim_key = (watermark_id, interaction.user.id)
+            pending_reveals.add(claim_key)
             processed_filename = processed_file.get('processed_filename', '')
-            if processed_filename:
-                watermarked_file_path = os.path.join('output', processed_filename)
-                if os.path.exists(watermarked_file_path):
-                    with open(watermarked_file_path, 'rb') as f:
-                        file = discord.File(f, filename=processed_filename)
-                        await interaction.user.send(content=dm_message, file=file)
+            if personal_factory:
+                delivery = dm_scheduler.submit(interaction.user, dm_message, personal_factory, key=watermark_id)
+            elif processed_filename:
+                # Every claimant gets the same bytes, so serve them from memory (or disk, for big videos)
+                file_factory = await attachment_cache.file_factory(processed_filename)
+                if file_factory is not None:
+                    delivery = dm_scheduler.submit(interaction.user, dm_message, file_factory, key=watermark_id)
                 else:
-                    await interaction.user.send(dm_message + "\n\nFile not available.")
+                    delivery = dm_scheduler.submit(interaction.user, dm_message + "\n\nFile not available.", key=watermark_id)
             else:
-                await interaction.user.send(dm_message + "\n\nNo file available.")
+                delivery = dm_scheduler.submit(interaction.user, dm_message + "\n\nNo file available.", key=watermark_id)
+            delivery.add_done_callback(lambda future: report_reveal_delivery(future, interaction, watermark_id))
             
-            await interaction.followup.send("Sent to your DMs.", ephemeral=True)
+            await interaction.followup.send("Queued, your copy will arrive in your DMs shortly.", ephemeral=True)
             
-        except discord.Forbidden:
-            await interaction.followup.send("Can't send DM. Check your privacy settings.", ephemeral=True)
         except Exception as e:
+            if claim_key is not None and delivery is None:
+                # Never queued, so no done callback will clear it
+                pending_reveals.discard(claim_key)
             await interaction.followup.send("Error sending reveal info.", ephemeral=True)
 
+class TracePageView(discord.ui.View):
+    """Previous/next buttons for trace reports with many claimants"""
+    def __init__(self, watermark_id, processed_file, claimed_users, recipient_code=None, guild=None):
+        super().__init__(timeout=600)
+        self.watermark_id = watermark_id
+        self.processed_file = processed_file
+        self.claimed_users = claimed_users
+        self.recipient_code = recipient_code
+        self.guild = guild
+        self.page = 0
+        self.page_count = max(1, (len(claimed_users) + TRACE_PAGE_SIZE - 1) // TRACE_PAGE_SIZE)
+        self.update_buttons()
+
+    def update_buttons(self):
+        self.previous_button.disabled = self.page == 0
+        self.next_button.disabled = self.page >= self.page_count - 1
+
+    async def show_page(self, interaction: discord.Interaction, page: int):
+        self.page = max(0, min(page, self.page_count - 1))
+        self.update_buttons()
+        await interaction.response.defer()
+        embed = await build_trace_embed(self.watermark_id, self.processed_file, self.claimed_users, self.page, self.recipient_code, self.guild)
+        await interaction.edit_original_response(embed=embed, view=self)
+
+    @discord.ui.button(label="◀ Previous", style=discord.ButtonStyle.secondary)
+    async def previous_button(self, interaction: discord.Interaction, button: discord.ui.Button):
+        await self.show_page(interaction, self.page - 1)
+
+    @discord.ui.button(label="Next ▶", style=discord.ButtonStyle.secondary)
+    async def next_button(self, interaction: discord.Interaction, button: discord.ui.Button):
+        await self.show_page(interaction, self.page + 1)
+
 # Dropdown menu system for reveals
 class RevealTypeDropdownView(discord.ui.View):
     """View with dropdown to select reveal type"""
@@ -642,9 +782,7 @@ class RevealTypeDropdown(discord.ui.Select):
             
             if self.values[0] == "booster":
                 # Handle booster reveal selection
-                processed_files = watermark_processor.get_all_processed_files()
-                
-                if not processed_files:
+                if not watermark_processor.get_processed_file_count():
                     await interaction.followup.send("No watermarked content available for booster reveal.", ephemeral=True)
                     return
                 
@@ -687,12 +825,13 @@ class BoosterRevealSelectView(discord.ui.View):
 class BoosterRevealDropdown(discord.ui.Select):
     """Dropdown to select watermarked content for booster reveal"""
     def __init__(self):
-        # Get all watermarked content
-        all_files = watermark_processor.get_all_processed_files()
+        # Newest watermarked content first, Discord allows at most 25 options
+        recent_files = watermark_processor.get_recent_processed_files(25)
         
         options = []
-        if all_files:
-            for watermark_id, file_info in list(all_files.items())[:25]:  # Discord limit
+        if recent_files:
+            for file_info in recent_files:
+                watermark_id = file_info['watermark_id']
                 filename = file_info.get('original_filename', 'Unknown file')[:50]
                 description = file_info.get('description', 'No description')[:50]
                 
@@ -825,19 +964,24 @@ class BasicRevealDropdown(discord.ui.Select):
 # Bulk DM system
 class BulkDMSelectView(discord.ui.View):
     """View for selecting content for bulk DM"""
-    def __init__(self):
+    def __init__(self, user_ids=None):
         super().__init__(timeout=None)
-        dropdown = BulkDMContentDropdown()
+        dropdown = BulkDMContentDropdown(user_ids)
         self.add_item(dropdown)
 
 class BulkDMContentDropdown(discord.ui.Select):
     """Dropdown to select content for bulk DM"""
-    def __init__(self):
-        all_files = watermark_processor.get_all_processed_files()
+    def __init__(self, user_ids=None):
+        # Recipients from a role or file; None means ask for them in the modal
+        self.user_ids = user_ids
+        
+        # Newest first, Discord allows at most 25 options
+        recent_files = watermark_processor.get_recent_processed_files(25)
         
         options = []
-        if all_files:
-            for watermark_id, file_info in list(all_files.items())[:25]:
+        if recent_files:
+            for file_info in recent_files:
+                watermark_id = file_info['watermark_id']
                 filename = file_info.get('original_filename', 'Unknown file')[:50]
                 description = file_info.get('description', 'No description')[:50]
                 
@@ -858,25 +1002,32 @@ class BulkDMContentDropdown(discord.ui.Select):
 
     async def callback(self, interaction: discord.Interaction):
         try:
-            await interaction.response.defer(ephemeral=True)
-            
             if self.values[0] == "none":
-                await interaction.followup.send("No content available.", ephemeral=True)
+                await interaction.response.send_message("No content available.", ephemeral=True)
                 return
             
             watermark_id = self.values[0]
             file_info = watermark_processor.get_processed_file(watermark_id)
             
             if not file_info:
-                await interaction.followup.send("Content not found.", ephemeral=True)
+                await interaction.response.send_message("Content not found.", ephemeral=True)
                 return
             
-            # Show bulk DM modal for user input
-            modal = BulkDMModal(watermark_id, file_info.get('original_filename', 'content'))
+            filename = file_info.get('original_filename', 'content')
+            if self.user_ids is not None:
+                await interaction.response.defer(ephemeral=True)
+                await run_bulk_delivery(interaction, watermark_id, filename, self.user_ids)
+                return
+            
+            # A modal has to be the first response, so no defer on this path
+            modal = BulkDMModal(watermark_id, filename)
             await interaction.response.send_modal(modal)
             
         except Exception as e:
-            await interaction.followup.send(f"Error: {str(e)}", ephemeral=True)
+            if interaction.response.is_done():
+                await interaction.followup.send(f"Error: {str(e)}", ephemeral=True)
+            else:
+                await interaction.response.send_message(f"Error: {str(e)}", ephemeral=True)
 
 class BulkDMModal(discord.ui.Modal):
     def __init__(self, watermark_id: str, filename: str):
@@ -884,128 +1035,113 @@ class BulkDMModal(discord.ui.Modal):
         self.watermark_id = watermark_id
         self.filename = filename
 
+    # Discord caps text inputs at 4000 characters, about 200 IDs; /bulk_dm's role or file option takes more
     user_list = discord.ui.TextInput(
-        label="User IDs or Mentions",
-        placeholder="Enter user IDs or mentions separated by spaces or commas...",
+        label="User IDs or Mentions (up to ~200)",
+        placeholder="IDs or mentions, separated by spaces or commas. For more, use /bulk_dm role: or recipients:",
         style=discord.TextStyle.paragraph,
-        max_length=1000,
+        max_length=4000,
         required=True
     )
 
     async def on_submit(self, interaction: discord.Interaction):
         await interaction.response.defer(ephemeral=True)
         
-        try:
-            # Parse user input
-            user_input = self.user_list.value.replace(',', ' ').replace('<@', '').replace('>', '').replace('!', '')
-            user_ids = []
-            
-            for item in user_input.split():
-                try:
-                    user_id = int(item.strip())
-                    user_ids.append(user_id)
-                except:
-                    continue
-            
-            if not user_ids:
-                await interaction.followup.send("No valid user IDs found in input.", ephemeral=True)
-                return
-            
-            # Get processed file info
-            processed_file = watermark_processor.get_processed_file(self.watermark_id)
-            if not processed_file:
-                await interaction.followup.send("Content not found.", ephemeral=True)
-                return
-            
-            # Prepare DM message
-            upload_date = processed_file.get('created_at', 'Unknown')
-            if upload_date != 'Unknown' and 'T' in upload_date:
-                try:
-                    dt = datetime.fromisoformat(upload_date.replace('Z', '+00:00'))
-                    upload_date = dt.strftime('%d-%m-%Y')
-                except:
-                    upload_date = upload_date.split('T')[0]
-            
-            dm_message = f"""**{processed_file.get('original_filename', 'Content')}** (Bulk Delivery)
+        user_ids = parse_user_ids(self.user_list.value)
+        if not user_ids:
+            await interaction.followup.send("No valid user IDs found in input.", ephemeral=True)
+            return
+        
+        await run_bulk_delivery(interaction, self.watermark_id, self.filename, user_ids)
+
+async def run_bulk_delivery(interaction: discord.Interaction, watermark_id: str, filename: str, user_ids):
+    """Send content to every user in the list; interaction must already be deferred"""
+    progress_message = None
+    
+    user_ids = list(dict.fromkeys(user_ids))
+    if len(user_ids) > BULK_DM_MAX_RECIPIENTS:
+        await interaction.followup.send(
+            f"That's {len(user_ids)} recipients; a single campaign is limited to {BULK_DM_MAX_RECIPIENTS}. Split the list and send it in parts.",
+            ephemeral=True
+        )
+        return
+    
+    try:
+        # Get processed file info
+        processed_file = watermark_processor.get_processed_file(watermark_id)
+        if not processed_file:
+            await interaction.followup.send("Content not found.", ephemeral=True)
+            return
+        
+        # Prepare DM message
+        upload_date = processed_file.get('created_at', 'Unknown')
+        if upload_date != 'Unknown' and 'T' in upload_date:
+            try:
+                dt = datetime.fromisoformat(upload_date.replace('Z', '+00:00'))
+                upload_date = dt.strftime('%d-%m-%Y')
+            except:
+                upload_date = upload_date.split('T')[0]
+        
+        dm_message = f"""**{processed_file.get('original_filename', 'Content')}** (Bulk Delivery)
 
 Date: {upload_date}
 {processed_file.get('description', '')}
 
 This content was sent via bulk delivery by {interaction.user.display_name}."""
-            
-            # Send to all users
-            successful_sends = []
-            failed_sends = []
-            
-            for user_id in user_ids:
-                try:
-                    user = bot.get_user(user_id) or await bot.fetch_user(user_id)
-                    
-                    # Send file
-                    processed_filename = processed_file.get('processed_filename', '')
-                    if processed_filename:
-                        watermarked_file_path = os.path.join('output', processed_filename)
-                        if os.path.exists(watermarked_file_path):
-                            with open(watermarked_file_path, 'rb') as f:
-                                file = discord.File(f, filename=processed_filename)
-                                await user.send(content=dm_message, file=file)
-                        else:
-                            await user.send(dm_message + "\n\nFile not available.")
-                    else:
-                        await user.send(dm_message + "\n\nNo file available.")
-                    
-                    successful_sends.append(user.display_name)
-                    
-                    # Record delivery
-                    claims_file = 'data/reveal_claims.json'
-                    os.makedirs('data', exist_ok=True)
-                    
-                    all_claims = {}
-                    if os.path.exists(claims_file):
-                        try:
-                            with open(claims_file, 'r') as f:
-                                all_claims = json.load(f)
-                        except:
-                            all_claims = {}
-                    
-                    if self.watermark_id not in all_claims:
-                        all_claims[self.watermark_id] = []
-                    
-                    user_id_str = str(user_id)
-                    if user_id_str not in all_claims[self.watermark_id]:
-                        all_claims[self.watermark_id].append(user_id_str)
-                    
-                    try:
-                        with open(claims_file, 'w') as f:
-                            json.dump(all_claims, f, indent=2)
-                    except:
-                        pass
-                    
-                except discord.Forbidden:
-                    failed_sends.append(f"User {user_id} (DMs disabled)")
-                except discord.NotFound:
-                    failed_sends.append(f"User {user_id} (not found)")
-                except Exception as e:
-                    failed_sends.append(f"User {user_id} ({str(e)})")
-            
-            # Report results
-            result_message = f"Bulk delivery completed for {self.filename}:\n"
-            result_message += f"✅ Successful: {len(successful_sends)} users\n"
-            result_message += f"❌ Failed: {len(failed_sends)} users"
-            
-            if successful_sends:
-                result_message += f"\n\nSuccessful deliveries: {', '.join(successful_sends[:10])}"
-                if len(successful_sends) > 10:
-                    result_message += f" (+{len(successful_sends)-10} more)"
-            
-            if failed_sends:
-                result_message += f"\n\nFailed deliveries:\n" + '\n'.join(failed_sends[:5])
-                if len(failed_sends) > 5:
-                    result_message += f"\n(+{len(failed_sends)-5} more failures)"
-            
+        
+        processed_filename = processed_file.get('processed_filename', '')
+        file_factory = await attachment_cache.file_factory(processed_filename)
+        if file_factory is None:
+            dm_message += "\n\nFile not available." if processed_filename else "\n\nNo file available."
+        
+        # A big campaign outlives the 15 minute interaction token, so progress goes to a DM we can keep editing
+        status = f"Sending {filename} to {len(user_ids)} users..."
+        try:
+            progress_message = await campaign_scheduler.send(interaction.user, status, key="campaign-status")
+        except discord.HTTPException:
+            progress_message = None
+        
+        if progress_message is not None:
+            await interaction.followup.send(f"{status}\nProgress and results will be posted in your DMs.", ephemeral=True)
+        else:
+            await interaction.followup.send(status, ephemeral=True)
+        
+        async def show_progress(sent, failed, total):
+            await progress_message.edit(content=f"Sending {filename}: {sent + failed}/{total} done ({sent} sent, {failed} failed)")
+        
+        # Sends run concurrently through the campaign scheduler; claims are recorded in batches
+        results = await bulk_campaign.run(watermark_id, user_ids, dm_message, file_factory,
+                                          on_progress=show_progress if progress_message is not None else None)
+        successful_sends = results['sent']
+        failed_sends = results['failed']
+        
+        # Individual claims are in the claim store; the log gets one line per campaign
+        await logger.log_admin_action(interaction.user, f"Bulk delivery of {filename} ({watermark_id}): {len(successful_sends)} sent, {len(failed_sends)} failed")
+        
+        # Report results
+        result_message = f"Bulk delivery completed for {filename}:\n"
+        result_message += f"✅ Successful: {len(successful_sends)} users\n"
+        result_message += f"❌ Failed: {len(failed_sends)} users"
+        
+        if successful_sends:
+            result_message += f"\n\nSuccessful deliveries: {', '.join(successful_sends[:10])}"
+            if len(successful_sends) > 10:
+                result_message += f" (+{len(successful_sends)-10} more)"
+        
+        if failed_sends:
+            result_message += f"\n\nFailed deliveries:\n" + '\n'.join(failed_sends[:5])
+            if len(failed_sends) > 5:
+                result_message += f"\n(+{len(failed_sends)-5} more failures)"
+        
+        if progress_message is not None:
+            await progress_message.edit(content=result_message[:2000])
+        else:
             await interaction.followup.send(result_message[:2000], ephemeral=True)
-            
-        except Exception as e:
+        
+    except Exception as e:
+        if progress_message is not None:
+            await progress_message.edit(content=f"Bulk delivery of {filename} failed: {str(e)}")
+        else:
             await interaction.followup.send(f"Bulk delivery failed: {str(e)}", ephemeral=True)
 
 # Get bot token from environment
@@ -1017,4 +1153,9 @@ if __name__ == "__main__":
         exit(1)
     
     print(f"Starting bot with owner ID: {BOT_OWNER_ID}")
-    bot.run(BOT_TOKEN)
\ No newline at end of file
+    init_components()
+    bot.run(BOT_TOKEN)
+    
+    # Fold any claims still in the journal into reveal_claims.json
+    claim_store.compact()
+    logger.flush()
\ No newline at end of file
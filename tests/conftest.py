@@ -0,0 +1,26 @@
+"""
+Shared fixtures for the Bot package tests
+"""
+
+import asyncio
+import os
+import sys
+
+import pytest
+
+# Tests import the package by its directory name, like the bot does
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def run():
+    """Run a coroutine to completion on a fresh event loop"""
+    return asyncio.run
+
+
+@pytest.fixture
+def data_dir(tmp_path):
+    """Absolute directory for a test's databases and journals"""
+    path = tmp_path / "data"
+    path.mkdir()
+    return str(path)
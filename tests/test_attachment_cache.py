@@ -0,0 +1,73 @@
+"""
+Tests for the byte-budgeted attachment cache
+"""
+
+import os
+
+import pytest
+
+pytest.importorskip("discord")
+
+from Bot.attachment_cache import AttachmentCache
+
+
+def write(directory, name: str, data: bytes, mtime_ns: int = None) -> str:
+    path = os.path.join(directory, name)
+    with open(path, 'wb') as f:
+        f.write(data)
+    if mtime_ns is not None:
+        os.utime(path, ns=(mtime_ns, mtime_ns))
+    return path
+
+
+def test_repeated_reads_are_served_from_memory(run, tmp_path):
+    write(tmp_path, "a.png", b"a" * 10)
+    cache = AttachmentCache(str(tmp_path), max_bytes=100)
+    
+    assert run(cache.get("a.png")) == b"a" * 10
+    assert run(cache.get("a.png")) == b"a" * 10
+    
+    stats = cache.get_stats()
+    assert (stats['hits'], stats['misses'], stats['bytes']) == (1, 1, 10)
+
+
+def test_least_recently_used_files_are_evicted_over_budget(run, tmp_path):
+    for name in ("a", "b", "c"):
+        write(tmp_path, name, name.encode() * 40)
+    cache = AttachmentCache(str(tmp_path), max_bytes=100, max_file_bytes=50)
+    
+    run(cache.get("a"))
+    run(cache.get("b"))
+    run(cache.get("a"))
+    run(cache.get("c"))
+    
+    assert list(cache.entries) == ["a", "c"]
+    assert cache.size == 80
+
+
+def test_rewritten_or_deleted_files_are_not_served_stale(run, tmp_path):
+    write(tmp_path, "a.png", b"old", mtime_ns=1_000_000_000)
+    cache = AttachmentCache(str(tmp_path), max_bytes=100)
+    run(cache.get("a.png"))
+    
+    write(tmp_path, "a.png", b"new", mtime_ns=2_000_000_000)
+    assert run(cache.get("a.png")) == b"new"
+    
+    os.remove(os.path.join(tmp_path, "a.png"))
+    assert run(cache.get("a.png")) is None
+    assert cache.size == 0
+
+
+def test_oversized_files_stream_from_disk(run, tmp_path):
+    path = write(tmp_path, "big.mp4", b"v" * 60)
+    cache = AttachmentCache(str(tmp_path), max_bytes=100, max_file_bytes=50)
+    
+    factory = run(cache.file_factory("big.mp4"))
+    
+    assert factory is not None
+    assert cache.get_stats()['files'] == 0
+    attachment = factory()
+    assert attachment.filename == "big.mp4"
+    attachment.close()
+    assert run(cache.file_factory("missing.mp4")) is None
+    assert run(cache.file_factory("")) is None
@@ -0,0 +1,80 @@
+"""
+Tests for bulk DM campaigns: bounded concurrency, failure reasons and batched claims
+"""
+
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+discord = pytest.importorskip("discord")
+
+from Bot.bulk_campaign import BulkCampaign
+from Bot.claim_store import ClaimStore
+
+
+def http_error(cls, status: int):
+    return cls(SimpleNamespace(status=status, reason="error", headers={}), "error")
+
+
+class FakeResolver:
+    async def resolve(self, user_id: int):
+        if user_id == 404:
+            raise http_error(discord.NotFound, 404)
+        return SimpleNamespace(id=user_id, display_name=f"user{user_id}")
+
+
+class FakeScheduler:
+    """Tracks how many sends are in flight at once"""
+    def __init__(self):
+        self.in_flight = 0
+        self.peak = 0
+        self.sent = []
+    
+    async def send(self, user, content, file_factory=None, key="default"):
+        self.in_flight += 1
+        self.peak = max(self.peak, self.in_flight)
+        try:
+            await asyncio.sleep(0.01)
+            if user.id == 403:
+                raise http_error(discord.Forbidden, 403)
+            self.sent.append((user.id, key))
+        finally:
+            self.in_flight -= 1
+
+
+def make_claim_store(data_dir) -> ClaimStore:
+    return ClaimStore(claims_file=f"{data_dir}/reveal_claims.json", journal_file=f"{data_dir}/reveal_claims.journal",
+                      rollups_file=f"{data_dir}/claim_rollups.json", events_file=f"{data_dir}/claim_events.jsonl")
+
+
+def test_campaign_reports_each_outcome_and_records_claims(run, data_dir):
+    scheduler = FakeScheduler()
+    claims = make_claim_store(data_dir)
+    campaign = BulkCampaign(scheduler, claims, FakeResolver(), max_in_flight=3, claim_batch=2)
+    recipients = [1, 2, 403, 3, 404, 4, 2]
+    
+    results = run(campaign.run('ES-1', recipients, "hello"))
+    
+    assert sorted(results['sent']) == ['user1', 'user2', 'user3', 'user4']
+    assert sorted(results['failed']) == ['User 403 (DMs disabled)', 'User 404 (not found)']
+    # Duplicates get the content once, every send is keyed by the watermark
+    assert sorted(scheduler.sent) == [(1, 'ES-1'), (2, 'ES-1'), (3, 'ES-1'), (4, 'ES-1')]
+    assert scheduler.peak <= 3
+    assert sorted(claims.get_claims('ES-1')) == ['1', '2', '3', '4']
+
+
+def test_campaign_reports_progress_while_running(run, data_dir):
+    scheduler = FakeScheduler()
+    campaign = BulkCampaign(scheduler, make_claim_store(data_dir), FakeResolver(), max_in_flight=1,
+                            progress_interval=0.02)
+    updates = []
+    
+    async def on_progress(sent, failed, total):
+        updates.append((sent, failed, total))
+    
+    run(campaign.run('ES-1', list(range(1, 11)), "hello", on_progress=on_progress))
+    
+    assert updates
+    assert all(total == 10 for _, _, total in updates)
+    assert updates == sorted(updates)
@@ -0,0 +1,186 @@
+"""
+Tests for the reveal claim index: journal replay, compaction and the read-only follower
+"""
+
+import os
+
+from Bot.claim_store import ClaimStore
+
+
+def make_store(data_dir, **kwargs) -> ClaimStore:
+    return ClaimStore(claims_file=os.path.join(data_dir, "reveal_claims.json"),
+                      journal_file=os.path.join(data_dir, "reveal_claims.journal"),
+                      rollups_file=os.path.join(data_dir, "claim_rollups.json"),
+                      events_file=os.path.join(data_dir, "claim_events.jsonl"), **kwargs)
+
+
+def test_claims_are_deduplicated_per_user(data_dir):
+    store = make_store(data_dir)
+    
+    assert store.claim('ES-1', 100) is True
+    assert store.claim('ES-1', '100') is False
+    assert store.add_claims('ES-1', [100, 101, 102, 101]) == 2
+    
+    assert store.has_claimed('ES-1', 101)
+    assert store.get_claim_count('ES-1') == 3
+    assert store.get_total_claims() == 3
+
+
+def test_flushed_journal_is_replayed_on_load(data_dir):
+    store = make_store(data_dir)
+    store.add_claims('ES-1', [1, 2])
+    store.claim('ES-2', 3)
+    store.flush()
+    
+    reloaded = make_store(data_dir)
+    assert sorted(reloaded.get_claims('ES-1')) == ['1', '2']
+    assert reloaded.get_total_claims() == 3
+    assert reloaded.seq == store.seq
+
+
+def test_unflushed_claims_are_not_on_disk(data_dir):
+    store = make_store(data_dir)
+    store.claim('ES-1', 1)
+    
+    assert make_store(data_dir).get_total_claims() == 0
+
+
+def test_compaction_folds_journal_into_snapshot(data_dir):
+    store = make_store(data_dir)
+    store.add_claims('ES-1', [1, 2, 3])
+    store.compact()
+    
+    assert os.path.getsize(store.journal_file) == 0
+    assert os.path.getsize(store.events_file) > 0
+    
+    store.claim('ES-1', 4)
+    store.flush()
+    reloaded = make_store(data_dir)
+    assert reloaded.get_claim_count('ES-1') == 4
+    # Events already in the rollups aren't counted again on replay
+    assert reloaded.get_claims_in_bucket(reloaded.claim_windows['ES-1'][0], 'day') == 4
+
+
+def test_torn_journal_line_is_ignored_until_complete(data_dir):
+    store = make_store(data_dir)
+    store.claim('ES-1', 1)
+    store.flush()
+    with open(store.journal_file, 'a') as f:
+        f.write('{"seq": 99, "watermark_id": "ES-1", "user_id": "2"')
+    
+    assert make_store(data_dir).get_claim_count('ES-1') == 1
+
+
+def test_reader_follows_journal_across_compaction(data_dir):
+    writer = make_store(data_dir)
+    reader = make_store(data_dir)
+    
+    writer.add_claims('ES-1', [1, 2])
+    writer.flush()
+    reader.refresh()
+    assert reader.get_claim_count('ES-1') == 2
+    
+    # Claims the reader hadn't seen yet are archived by the compaction and picked up from there
+    writer.claim('ES-1', 3)
+    writer.flush()
+    writer.compact()
+    writer.claim('ES-2', 4)
+    writer.flush()
+    reader.refresh()
+    
+    assert reader.get_claim_count('ES-1') == 3
+    assert reader.get_claim_count('ES-2') == 1
+    assert reader.get_total_claims() == 4
+    
+    # Re-reading is harmless
+    reader.refresh()
+    assert reader.get_total_claims() == 4
+
+
+def test_top_ranking_follows_claim_counts(data_dir):
+    store = make_store(data_dir, top_k=2)
+    store.add_claims('ES-1', [1])
+    store.add_claims('ES-2', [1, 2])
+    store.add_claims('ES-3', [1, 2, 3])
+    assert store.get_top() == [('ES-3', 3), ('ES-2', 2)]
+    
+    # Overtaking the lowest entry replaces it
+    store.add_claims('ES-1', [2, 3, 4])
+    assert store.get_top() == [('ES-1', 4), ('ES-3', 3)]
+
+
+def test_top_ranking_is_rebuilt_on_load(data_dir):
+    store = make_store(data_dir, top_k=2)
+    for count, watermark_id in enumerate(['ES-1', 'ES-2', 'ES-3'], start=1):
+        store.add_claims(watermark_id, range(count))
+    store.compact()
+    
+    assert make_store(data_dir, top_k=2).get_top() == [('ES-3', 3), ('ES-2', 2)]
+
+
+def test_forget_frees_the_slot_and_keeps_claims(data_dir):
+    store = make_store(data_dir, top_k=2)
+    for count, watermark_id in enumerate(['ES-1', 'ES-2', 'ES-3'], start=1):
+        store.add_claims(watermark_id, range(count))
+    
+    store.forget('ES-3')
+    
+    assert store.get_top() == [('ES-2', 2), ('ES-1', 1)]
+    assert store.get_claim_count('ES-3') == 3
+    # Later claims don't bring deleted content back into the ranking
+    store.add_claims('ES-3', [10, 11])
+    assert store.get_top() == [('ES-2', 2), ('ES-1', 1)]
+    
+    # Forgetting something outside the ranking leaves it alone
+    store.forget('ES-9')
+    assert store.get_top() == [('ES-2', 2), ('ES-1', 1)]
+
+
+def test_rollups_bucket_claims_per_watermark_and_overall(data_dir, monkeypatch):
+    store = make_store(data_dir)
+    now = 1_700_000_000.0
+    monkeypatch.setattr('time.time', lambda: now)
+    store.add_claims('ES-1', [1, 2])
+    now += 3600
+    store.add_claims('ES-2', [1])
+    
+    hour = int((now - 3600) // 3600 * 3600)
+    assert store.get_claim_curve('ES-1', 'hour') == [(hour, 2)]
+    assert store.get_claim_curve(resolution='hour') == [(hour, 2), (hour + 3600, 1)]
+    assert store.get_claim_curve(resolution='hour', since=hour + 1) == [(hour + 3600, 1)]
+    assert store.get_claims_in_bucket(now, 'hour') == 1
+    assert store.get_claim_window('ES-1') == (now - 3600, now - 3600)
+
+
+def test_first_day_count_survives_hourly_pruning(data_dir, monkeypatch):
+    store = make_store(data_dir)
+    clock = [1_700_000_000.0]
+    monkeypatch.setattr('time.time', lambda: clock[0])
+    store.add_claims('ES-1', [1, 2])
+    clock[0] += 3600
+    store.claim('ES-1', 3)
+    clock[0] += 2 * 86400
+    store.claim('ES-1', 4)
+    assert store.get_first_day_claims('ES-1') == 3
+    
+    # Long after the hourly buckets are gone the count is still there, also after a reload
+    clock[0] += 120 * 86400
+    store.compact()
+    assert 'ES-1' not in store.rollups['hour']
+    assert make_store(data_dir).get_first_day_claims('ES-1') == 3
+
+
+def test_first_day_count_is_recounted_for_old_windows(data_dir, monkeypatch):
+    store = make_store(data_dir)
+    clock = [1_700_000_000.0]
+    monkeypatch.setattr('time.time', lambda: clock[0])
+    store.add_claims('ES-1', [1, 2])
+    clock[0] += 2 * 86400
+    store.claim('ES-1', 3)
+    store.compact()
+    
+    # Windows saved before the count was kept have no third field
+    reloaded = make_store(data_dir)
+    reloaded.claim_windows['ES-1'] = reloaded.claim_windows['ES-1'][:2] + [None]
+    assert reloaded.get_first_day_claims('ES-1') == 2
+    assert reloaded.claim_windows['ES-1'][2] == 2
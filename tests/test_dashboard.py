@@ -0,0 +1,207 @@
+"""
+Tests for the dashboard's serving primitives: content negotiation, ETags, shared snapshots and the worker pool
+"""
+
+import gzip
+import http.client
+import threading
+import time
+from http.server import BaseHTTPRequestHandler
+
+import pytest
+
+dashboard = pytest.importorskip("dashboard")
+
+from dashboard import DashboardHandler, DashboardServer, SnapshotCache, StaticAsset, accepted_encodings
+
+BODY = b"<html>" + b"dashboard " * 500 + b"</html>"
+
+
+def serve(handler_class, workers: int = 4):
+    server = DashboardServer(('127.0.0.1', 0), handler_class, workers=workers)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+def stop(server):
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.mark.parametrize("header, expected", [
+    ("", set()),
+    ("gzip, deflate, br", {'gzip', 'deflate', 'br'}),
+    ("GZip;q=0.5, br;q=1.0", {'gzip', 'br'}),
+    ("gzip;q=0, br", {'br'}),
+    ("br;q=0.0, *", {'*'}),
+    ("gzip;q=oops", {'gzip'}),
+])
+def test_accepted_encodings(header, expected):
+    assert accepted_encodings(header) == expected
+
+
+def test_static_asset_picks_smallest_accepted_variant():
+    asset = StaticAsset(BODY, 'text/html', 'no-cache')
+    
+    encoding, body, etag = asset.choose("gzip, deflate")
+    assert encoding == 'gzip'
+    assert gzip.decompress(body) == BODY
+    
+    identity = asset.choose("gzip;q=0")
+    assert identity[0] == 'identity'
+    assert identity[1] == BODY
+    # Every representation has its own ETag, stable across builds of the same bytes
+    assert identity[2] != etag
+    assert StaticAsset(BODY, 'text/html', 'no-cache').choose("gzip")[2] == etag
+
+
+def test_tiny_asset_is_served_uncompressed():
+    asset = StaticAsset(b"ok", 'text/plain', 'no-cache')
+    
+    assert asset.choose("gzip, br")[0] == 'identity'
+
+
+class AssetHandler(DashboardHandler):
+    """The dashboard's asset route without the bot components behind it"""
+    static_assets = {'/': StaticAsset(BODY, 'text/html; charset=utf-8', 'no-cache')}
+    
+    @classmethod
+    def initialize_components(cls):
+        pass
+    
+    @classmethod
+    def refresh_components(cls):
+        pass
+
+
+def test_asset_revalidation_returns_304_on_matching_etag():
+    server = serve(AssetHandler)
+    try:
+        connection = http.client.HTTPConnection(*server.server_address)
+        connection.request('GET', '/', headers={'Accept-Encoding': 'gzip'})
+        response = connection.getresponse()
+        body = response.read()
+        etag = response.getheader('ETag')
+        assert response.status == 200
+        assert response.getheader('Content-Encoding') == 'gzip'
+        assert response.getheader('Vary') == 'Accept-Encoding'
+        assert gzip.decompress(body) == BODY
+        
+        # Same keep-alive connection; a proxy's weak prefix still matches
+        connection.request('GET', '/', headers={'Accept-Encoding': 'gzip', 'If-None-Match': f'"other", W/{etag}'})
+        response = connection.getresponse()
+        assert response.status == 304
+        assert response.read() == b''
+        
+        connection.request('GET', '/', headers={'If-None-Match': etag})
+        response = connection.getresponse()
+        assert response.status == 200
+        assert response.read() == BODY
+        connection.close()
+    finally:
+        stop(server)
+
+
+class SlowHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    
+    def do_GET(self):
+        time.sleep(0.3)
+        self.send_response(200)
+        self.send_header('Content-Length', '2')
+        self.end_headers()
+        self.wfile.write(b'ok')
+    
+    def log_message(self, format, *args):
+        pass
+
+
+def test_slow_requests_are_served_concurrently():
+    server = serve(SlowHandler, workers=4)
+    statuses = []
+    
+    def fetch():
+        connection = http.client.HTTPConnection(*server.server_address)
+        connection.request('GET', '/')
+        statuses.append(connection.getresponse().status)
+        connection.close()
+    
+    try:
+        started = time.monotonic()
+        threads = [threading.Thread(target=fetch) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.monotonic() - started
+    finally:
+        stop(server)
+    
+    assert statuses == [200] * 4
+    # One at a time would take 1.2 seconds
+    assert elapsed < 0.9
+
+
+def test_snapshot_is_computed_once_for_concurrent_readers():
+    started = threading.Event()
+    
+    def compute():
+        started.set()
+        time.sleep(0.2)
+        return {'value': 1}
+    
+    cache = SnapshotCache(compute, lambda: 1)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get())) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    
+    assert cache.computations == 1
+    assert all(result is results[0] for result in results)
+
+
+def test_snapshot_recomputes_on_version_change_after_min_age():
+    version = [1]
+    cache = SnapshotCache(lambda: version[0], lambda: version[0], ttl=60, min_age=0.05)
+    assert cache.get() == 1
+    
+    # Changes inside min_age are served from the snapshot
+    version[0] = 2
+    assert cache.get() == 1
+    
+    time.sleep(0.06)
+    assert cache.get() == 2
+    assert cache.computations == 2
+    assert cache.get() == 2
+    assert cache.computations == 2
+
+
+def test_snapshot_expires_after_ttl_and_on_invalidate():
+    cache = SnapshotCache(lambda: object(), lambda: 1, ttl=0.05, min_age=0)
+    first = cache.get()
+    assert cache.get() is first
+    
+    time.sleep(0.06)
+    second = cache.get()
+    assert second is not first
+    
+    cache.invalidate()
+    assert cache.get() is not second
+
+
+def test_failed_computation_lets_the_next_reader_retry():
+    calls = []
+    
+    def compute():
+        calls.append(1)
+        if len(calls) == 1:
+            raise RuntimeError("database locked")
+        return 'ok'
+    
+    cache = SnapshotCache(compute, lambda: 1)
+    with pytest.raises(RuntimeError):
+        cache.get()
+    assert cache.get() == 'ok'
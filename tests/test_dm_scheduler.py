@@ -0,0 +1,133 @@
+"""
+Tests for DM pacing: the token bucket, round-robin between keys, retries and rate limits
+"""
+
+import asyncio
+import time
+from types import SimpleNamespace
+
+import pytest
+
+discord = pytest.importorskip("discord")
+
+from Bot.dm_scheduler import DMScheduler, TokenBucket
+
+
+def http_error(cls, status: int, headers=None):
+    response = SimpleNamespace(status=status, reason="error", headers=headers or {})
+    return cls(response, "error")
+
+
+class FakeUser:
+    """Records every DM; scripted errors are raised on the first sends"""
+    def __init__(self, name: str, log: list, errors=()):
+        self.name = name
+        self.log = log
+        self.errors = list(errors)
+    
+    async def send(self, content=None, file=None):
+        if self.errors:
+            raise self.errors.pop(0)
+        self.log.append((self.name, content, file))
+        return (self.name, content)
+
+
+def test_bucket_allows_burst_then_paces(run):
+    async def timed():
+        bucket = TokenBucket(rate=50, capacity=3)
+        started = time.monotonic()
+        for _ in range(3):
+            await bucket.acquire()
+        burst = time.monotonic() - started
+        for _ in range(5):
+            await bucket.acquire()
+        return burst, time.monotonic() - started
+    
+    burst, total = run(timed())
+    assert burst < 0.02
+    # Five more tokens at 50 per second
+    assert 0.08 <= total < 0.5
+
+
+def test_bucket_block_holds_sends_and_drops_burst(run):
+    async def timed():
+        bucket = TokenBucket(rate=1000, capacity=5)
+        bucket.block(0.1)
+        started = time.monotonic()
+        await bucket.acquire()
+        return time.monotonic() - started, bucket.tokens
+    
+    waited, tokens = run(timed())
+    assert waited >= 0.09
+    assert tokens < 1
+
+
+def test_keys_are_served_round_robin(run):
+    log = []
+    
+    async def deliver():
+        scheduler = DMScheduler(delay_seconds=0, burst=1, max_concurrency=1)
+        big = [scheduler.submit(FakeUser('big', log), f"big-{i}", key='big') for i in range(3)]
+        small = [scheduler.submit(FakeUser('small', log), f"small-{i}", key='small') for i in range(2)]
+        await asyncio.gather(*big, *small)
+        await scheduler.stop()
+    
+    run(deliver())
+    assert [content for _, content, _ in log] == ['big-0', 'small-0', 'big-1', 'small-1', 'big-2']
+
+
+def test_file_factory_may_be_async_and_runs_per_attempt(run):
+    log = []
+    built = []
+    
+    async def build():
+        built.append(len(built))
+        return f"file-{len(built)}"
+    
+    async def deliver():
+        scheduler = DMScheduler(delay_seconds=0, max_retries=2)
+        user = FakeUser('u', log, errors=[http_error(discord.HTTPException, 503)])
+        message = await scheduler.send(user, "hello", build, key='k')
+        await scheduler.stop()
+        return message, scheduler
+    
+    # The 503 retry sleeps for two seconds before trying again
+    message, scheduler = run(asyncio.wait_for(deliver(), timeout=10))
+    assert message == ('u', 'hello')
+    assert log == [('u', 'hello', 'file-2')]
+    assert built == [0, 1]
+    assert scheduler.retried == 1
+
+
+def test_forbidden_fails_immediately(run):
+    async def deliver():
+        scheduler = DMScheduler(delay_seconds=0)
+        user = FakeUser('u', [], errors=[http_error(discord.Forbidden, 403)])
+        with pytest.raises(discord.Forbidden):
+            await scheduler.send(user, "hello")
+        await scheduler.stop()
+        return scheduler.get_stats()
+    
+    stats = run(deliver())
+    assert stats['failed'] == 1
+    assert stats['retried'] == 0
+
+
+def test_rate_limit_pauses_every_send_and_requeues_in_order(run):
+    log = []
+    
+    async def deliver():
+        scheduler = DMScheduler(delay_seconds=0, burst=5, max_concurrency=1)
+        limited = FakeUser('a', log, errors=[http_error(discord.HTTPException, 429, {'Retry-After': '0.2'})])
+        started = time.monotonic()
+        first = scheduler.submit(limited, "a-0", key='a')
+        second = scheduler.submit(FakeUser('a', log), "a-1", key='a')
+        await asyncio.gather(first, second)
+        await scheduler.stop()
+        return time.monotonic() - started, scheduler.get_stats()
+    
+    elapsed, stats = run(deliver())
+    assert elapsed >= 0.19
+    assert [content for _, content, _ in log] == ['a-0', 'a-1']
+    assert stats['rate_limited'] == 1
+    assert stats['queue_depth'] == 0
@@ -0,0 +1,124 @@
+"""
+Tests for streaming /upload downloads: format sniffing and the size cap
+"""
+
+import os
+
+import pytest
+
+from Bot.downloader import Downloader, DownloadError, sniff_extension
+
+PNG_HEAD = b'\x89PNG\r\n\x1a\n' + b'\x00' * 8
+JPG_HEAD = b'\xff\xd8\xff\xe0' + b'\x00' * 12
+
+
+class FakeContent:
+    """Serves a body in fixed-size chunks like aiohttp's StreamReader"""
+    def __init__(self, body: bytes, chunk: int):
+        self.body = body
+        self.chunk = chunk
+        self.position = 0
+        self.served = 0
+    
+    async def read(self, n: int) -> bytes:
+        data = self.body[self.position:self.position + min(n, self.chunk)]
+        self.position += len(data)
+        self.served += len(data)
+        return data
+    
+    async def iter_chunked(self, n: int):
+        while True:
+            data = await self.read(n)
+            if not data:
+                return
+            yield data
+
+
+class FakeResponse:
+    def __init__(self, body: bytes, status: int = 200, content_length=None, chunk: int = 4):
+        self.status = status
+        self.content_length = content_length
+        self.content = FakeContent(body, chunk)
+    
+    async def __aenter__(self):
+        return self
+    
+    async def __aexit__(self, *exc):
+        return False
+
+
+class FakeSession:
+    closed = False
+    
+    def __init__(self, response: FakeResponse):
+        self.response = response
+    
+    def get(self, url: str) -> FakeResponse:
+        return self.response
+
+
+def make_downloader(response: FakeResponse, max_bytes: int = 64) -> Downloader:
+    downloader = Downloader(max_bytes=max_bytes, chunk_size=8)
+    downloader.session = FakeSession(response)
+    return downloader
+
+
+@pytest.mark.parametrize("head, extension", [
+    (JPG_HEAD, '.jpg'),
+    (PNG_HEAD, '.png'),
+    (b'\x00\x00\x00\x18ftypisom', '.mp4'),
+    (b'\x00\x00\x00\x14ftypqt  ', '.mov'),
+    (b'RIFF\x00\x00\x00\x00AVI ', '.avi'),
+])
+def test_sniff_extension_recognizes_supported_formats(head, extension):
+    assert sniff_extension(head) == extension
+
+
+def test_sniff_extension_rejects_other_content():
+    assert sniff_extension(b'<!DOCTYPE html>') is None
+    assert sniff_extension(b'GIF89a') is None
+    assert sniff_extension(b'') is None
+
+
+def test_download_writes_body_with_sniffed_extension(run):
+    body = PNG_HEAD + b'x' * 30
+    temp_path, extension = run(make_downloader(FakeResponse(body)).download("http://example/file"))
+    try:
+        assert extension == '.png'
+        assert temp_path.endswith('.png')
+        with open(temp_path, 'rb') as f:
+            assert f.read() == body
+    finally:
+        os.unlink(temp_path)
+
+
+def test_download_rejects_declared_size_before_reading(run):
+    response = FakeResponse(PNG_HEAD + b'x' * 100, content_length=116)
+    with pytest.raises(DownloadError, match="larger than"):
+        run(make_downloader(response).download("http://example/file"))
+    assert response.content.served == 0
+
+
+def test_download_rejects_unknown_format_from_first_bytes(run, tmp_path, monkeypatch):
+    monkeypatch.setattr('tempfile.tempdir', str(tmp_path))
+    response = FakeResponse(b'<html>' + b'x' * 1000)
+    with pytest.raises(DownloadError, match="Unsupported file format"):
+        run(make_downloader(response, max_bytes=4096).download("http://example/file"))
+    # Only the sniffing window was read and nothing was written to disk
+    assert response.content.served < 32
+    assert os.listdir(tmp_path) == []
+
+
+def test_download_enforces_cap_without_content_length(run, tmp_path, monkeypatch):
+    monkeypatch.setattr('tempfile.tempdir', str(tmp_path))
+    response = FakeResponse(JPG_HEAD + b'x' * 1000)
+    with pytest.raises(DownloadError, match="larger than"):
+        run(make_downloader(response).download("http://example/file"))
+    # Stopped shortly after crossing the cap and removed the partial file
+    assert response.content.served <= 64 + 8
+    assert os.listdir(tmp_path) == []
+
+
+def test_download_rejects_http_errors(run):
+    with pytest.raises(DownloadError, match="HTTP 404"):
+        run(make_downloader(FakeResponse(b'', status=404)).download("http://example/file"))
@@ -0,0 +1,65 @@
+"""
+Tests for cross-process change detection on shared data files
+"""
+
+import os
+
+from Bot.file_watch import FileWatch, locked
+
+
+def test_reports_each_change_once(tmp_path):
+    path = str(tmp_path / "admins.json")
+    watch = FileWatch(path)
+    assert watch.changed() is False
+    
+    with open(path, 'w') as f:
+        f.write("[1]")
+    assert watch.changed() is True
+    assert watch.changed() is False
+
+
+def test_atomic_replace_is_seen_even_with_same_size_and_mtime(tmp_path):
+    path = str(tmp_path / "admins.json")
+    with open(path, 'w') as f:
+        f.write("[1]")
+    stat = os.stat(path)
+    watch = FileWatch(path)
+    
+    temp = path + ".tmp"
+    with open(temp, 'w') as f:
+        f.write("[2]")
+    os.utime(temp, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    os.replace(temp, path)
+    
+    assert watch.changed() is True
+
+
+def test_mark_hides_our_own_write(tmp_path):
+    path = str(tmp_path / "admins.json")
+    watch = FileWatch(path)
+    
+    with open(path, 'w') as f:
+        f.write("[1]")
+    watch.mark()
+    
+    assert watch.changed() is False
+
+
+def test_deletion_counts_as_a_change(tmp_path):
+    path = str(tmp_path / "admins.json")
+    with open(path, 'w') as f:
+        f.write("[1]")
+    watch = FileWatch(path)
+    
+    os.remove(path)
+    
+    assert watch.changed() is True
+
+
+def test_locked_creates_lock_file_next_to_target(tmp_path):
+    path = str(tmp_path / "nested" / "data.json")
+    
+    with locked(path):
+        assert os.path.exists(path + ".lock")
+    with locked(path):
+        pass
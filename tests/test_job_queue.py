@@ -0,0 +1,167 @@
+"""
+Tests for the persistent watermark job queue: retries, backoff and restart recovery
+"""
+
+import asyncio
+import os
+import time
+from concurrent.futures.process import BrokenProcessPool
+
+from Bot.job_queue import JobQueue
+
+
+class FakeProcessor:
+    """Returns (or raises) the scripted outcomes in order, repeating the last one"""
+    def __init__(self, *outcomes):
+        self.outcomes = list(outcomes)
+        self.calls = []
+    
+    async def process_file(self, file_path, description, original_filename=None):
+        self.calls.append(file_path)
+        outcome = self.outcomes[min(len(self.calls), len(self.outcomes)) - 1]
+        if isinstance(outcome, BaseException):
+            raise outcome
+        return outcome
+
+
+def make_queue(data_dir, processor, **kwargs) -> JobQueue:
+    kwargs.setdefault('retry_delay', 0.01)
+    return JobQueue(processor, db_path=os.path.join(data_dir, "jobs.db"),
+                    spool_dir=os.path.join(data_dir, "spool"), workers=1, **kwargs)
+
+
+def upload(data_dir, name: str = "upload.png") -> str:
+    path = os.path.join(data_dir, name)
+    with open(path, 'wb') as f:
+        f.write(b'data')
+    return path
+
+
+async def submit_and_wait(queue: JobQueue, path: str):
+    queue.start()
+    try:
+        job_id = queue.submit(path, "description")
+        return job_id, await asyncio.wait_for(queue.wait(job_id), timeout=5)
+    finally:
+        await queue.stop()
+
+
+SUCCESS = {'status': 'success', 'watermark_id': 'ES-12345', 'processed_filename': 'out.png'}
+
+
+def test_submit_spools_input_and_removes_it_when_done(run, data_dir):
+    path = upload(data_dir)
+    queue = make_queue(data_dir, FakeProcessor(SUCCESS))
+    
+    job_id, result = run(submit_and_wait(queue, path))
+    
+    assert result['status'] == 'success'
+    assert result['watermark_id'] == 'ES-12345'
+    assert not os.path.exists(path)
+    assert os.listdir(queue.spool_dir) == []
+    assert queue.get_stats()['done'] == 1
+
+
+def test_permanent_error_fails_without_retry(run, data_dir):
+    processor = FakeProcessor({'status': 'error', 'error': 'cannot identify image file', 'transient': False})
+    queue = make_queue(data_dir, processor, max_attempts=3)
+    
+    _, result = run(submit_and_wait(queue, upload(data_dir)))
+    
+    assert result['status'] == 'error'
+    assert result['error'] == 'cannot identify image file'
+    assert len(processor.calls) == 1
+
+
+def test_transient_error_is_retried_until_success(run, data_dir):
+    processor = FakeProcessor({'status': 'error', 'error': 'No space left on device', 'transient': True}, SUCCESS)
+    queue = make_queue(data_dir, processor, max_attempts=3)
+    
+    _, result = run(submit_and_wait(queue, upload(data_dir)))
+    
+    assert result['status'] == 'success'
+    assert len(processor.calls) == 2
+
+
+def test_crashed_worker_is_retried_and_attempts_are_capped(run, data_dir):
+    processor = FakeProcessor(BrokenProcessPool("worker died"))
+    queue = make_queue(data_dir, processor, max_attempts=3)
+    
+    job_id, result = run(submit_and_wait(queue, upload(data_dir)))
+    
+    assert result['status'] == 'error'
+    assert len(processor.calls) == 3
+    assert queue.get_job(job_id)['status'] == 'failed'
+
+
+def test_unexpected_exception_is_permanent(run, data_dir):
+    processor = FakeProcessor(ValueError("bad frame"))
+    queue = make_queue(data_dir, processor, max_attempts=3)
+    
+    _, result = run(submit_and_wait(queue, upload(data_dir)))
+    
+    assert result['error'] == 'bad frame'
+    assert len(processor.calls) == 1
+
+
+def test_retry_backoff_doubles_and_is_capped(run, data_dir):
+    queue = make_queue(data_dir, FakeProcessor(), retry_delay=10, max_retry_delay=25, max_attempts=5)
+    path = upload(data_dir)
+    
+    async def fail_attempts(count):
+        job_id = queue.submit(path, "description")
+        delays = []
+        for _ in range(count):
+            # Make the retry due now so the next attempt can be claimed straight away
+            queue.db.execute("UPDATE jobs SET not_before = 0 WHERE id = ?", (job_id,))
+            job = queue._claim_next()
+            failed_at = time.time()
+            await queue._complete(job, {'status': 'error', 'error': 'EIO', 'transient': True})
+            delays.append(round(queue.get_job(job_id)['not_before'] - failed_at))
+        return delays
+    
+    assert run(fail_attempts(3)) == [10, 20, 25]
+
+
+def test_interrupted_jobs_resume_after_restart(run, data_dir):
+    path = upload(data_dir)
+    first = make_queue(data_dir, FakeProcessor())
+    job_id = first.submit(path, "description", original_filename="clip.png")
+    # Simulate a crash mid-render: the job is left running with no process behind it
+    assert first._claim_next()['id'] == job_id
+    first.db.close()
+    
+    processor = FakeProcessor(SUCCESS)
+    second = make_queue(data_dir, processor)
+    finished = []
+    
+    async def on_finished(job, result):
+        finished.append((job['id'], result['status']))
+    
+    second.on_finished = on_finished
+    
+    async def resume():
+        second.start()
+        try:
+            for _ in range(500):
+                if finished:
+                    return
+                await asyncio.sleep(0.01)
+        finally:
+            await second.stop()
+    
+    run(resume())
+    
+    assert finished == [(job_id, 'success')]
+    assert len(processor.calls) == 1
+
+
+def test_position_follows_priority_then_submission_order(data_dir):
+    queue = make_queue(data_dir, FakeProcessor())
+    first = queue.submit(upload(data_dir, "a.png"), "a")
+    second = queue.submit(upload(data_dir, "b.png"), "b")
+    urgent = queue.submit(upload(data_dir, "c.png"), "c", priority=1)
+    
+    assert queue.get_position(urgent) == 0
+    assert queue.get_position(first) == 1
+    assert queue.get_position(second) == 2
@@ -0,0 +1,150 @@
+"""
+Tests for the segmented JSONL log: rotation, recovery, indexed lookups and time-range queries
+"""
+
+import gzip
+import json
+import os
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+pytest.importorskip("discord")
+
+import Bot.logger as bot_logger
+from Bot.logger import BotLogger
+
+START = datetime(2026, 1, 1)
+
+
+def entry(i: int, **fields) -> dict:
+    """One entry a minute, alternating between two watermarks and three users"""
+    return dict({
+        'timestamp': (START + timedelta(minutes=i)).isoformat(),
+        'action': 'delivery' if i % 2 else 'upload',
+        'watermark_id': f"ES-{i % 2}",
+        'recipient_id': 1000 + i % 3,
+        'seq': i
+    }, **fields)
+
+
+def make_logger(data_dir, **kwargs) -> BotLogger:
+    kwargs.setdefault('segment_bytes', 2048)
+    return BotLogger(log_dir=os.path.join(data_dir, "logs"), legacy_file=os.path.join(data_dir, "delivery_log.json"),
+                     max_recent=20, **kwargs)
+
+
+def write(logger: BotLogger, count: int, first: int = 0):
+    for i in range(first, first + count):
+        logger.append_log(entry(i))
+
+
+def test_full_segments_are_rotated_gzipped_and_indexed(data_dir):
+    logger = make_logger(data_dir)
+    write(logger, 100)
+    
+    names = sorted(os.listdir(logger.log_dir))
+    sealed = [name for name in names if name.endswith('.jsonl.gz')]
+    assert len(sealed) >= 2
+    assert all(name.replace('.jsonl.gz', '.idx.json') in names for name in sealed)
+    assert sum(1 for name in names if name.endswith('.jsonl')) == 1
+    
+    with gzip.open(os.path.join(logger.log_dir, sealed[0]), 'rt') as f:
+        assert json.loads(f.readline())['seq'] == 0
+
+
+def test_history_and_recent_entries_survive_reload(data_dir):
+    write(make_logger(data_dir), 100)
+    
+    reloaded = make_logger(data_dir)
+    assert [e['seq'] for e in reloaded.iter_logs()] == list(range(100))
+    assert [e['seq'] for e in reloaded.get_recent_logs(5)] == [95, 96, 97, 98, 99]
+    assert [e['seq'] for e in reloaded.get_recent_logs(50)][0] == 50
+
+
+def test_torn_last_line_is_trimmed_before_appending(data_dir):
+    logger = make_logger(data_dir, segment_bytes=1 << 20)
+    write(logger, 3)
+    with open(logger._segment_path(logger.segment_index), 'a') as f:
+        f.write('{"timestamp": "2026-01-01T00:0')
+    
+    reloaded = make_logger(data_dir, segment_bytes=1 << 20)
+    reloaded.append_log(entry(3))
+    
+    assert [e['seq'] for e in make_logger(data_dir).iter_logs()] == [0, 1, 2, 3]
+
+
+def test_legacy_json_log_is_migrated(data_dir):
+    legacy = os.path.join(data_dir, "delivery_log.json")
+    with open(legacy, 'w') as f:
+        json.dump([{'timestamp': START.isoformat(), 'action': 'upload', 'uploader': 'Someone (42)',
+                    'watermark_id': 'ES-7'}], f)
+    
+    logger = make_logger(data_dir)
+    
+    assert os.path.exists(legacy + ".migrated")
+    # Old entries only carry "Name (id)" strings; the index still finds them by user
+    assert [e['watermark_id'] for e in logger.get_logs_by_user(42)] == ['ES-7']
+
+
+def test_lookups_cover_sealed_active_and_unflushed_entries(data_dir):
+    logger = make_logger(data_dir)
+    write(logger, 100)
+    # Queued but not flushed yet, as while the background flusher is running
+    logger.flusher_task = object()
+    logger.append_log(entry(100))
+    
+    by_watermark = [e['seq'] for e in logger.get_logs_by_watermark_id('ES-0')]
+    assert by_watermark == list(range(0, 101, 2))
+    by_user = [e['seq'] for e in logger.get_logs_by_user(1001)]
+    assert by_user == [i for i in range(101) if i % 3 == 1]
+    assert logger.get_logs_by_watermark_id('ES-9') == []
+
+
+def test_reader_process_follows_writer_across_rotation(data_dir):
+    writer = make_logger(data_dir)
+    write(writer, 10)
+    reader = make_logger(data_dir, read_only=True)
+    
+    write(writer, 90, first=10)
+    reader.refresh()
+    
+    assert [e['seq'] for e in reader.get_logs_by_watermark_id('ES-1')] == list(range(1, 100, 2))
+    assert [e['seq'] for e in reader.get_recent_logs(3)] == [97, 98, 99]
+
+
+@pytest.fixture
+def small_stride(monkeypatch):
+    # Several time samples per segment, so queries have something to bisect
+    monkeypatch.setattr(bot_logger, 'TIME_INDEX_STRIDE', 4)
+
+
+@pytest.mark.parametrize("start, end", [
+    (None, None),
+    (10, 20),
+    (0, 1),
+    (37, 95),
+    (95, None),
+    (None, 3),
+    (200, None),
+])
+def test_query_returns_exactly_the_time_window(data_dir, small_stride, start, end):
+    logger = make_logger(data_dir)
+    write(logger, 100)
+    
+    def moment(minutes):
+        return None if minutes is None else START + timedelta(minutes=minutes)
+    
+    seqs = [e['seq'] for e in logger.query(moment(start), moment(end))]
+    assert seqs == list(range(100))[start:end]
+
+
+def test_query_filters_by_action_and_accepts_aware_datetimes(data_dir, small_stride):
+    logger = make_logger(data_dir)
+    write(logger, 40)
+    logger.flusher_task = object()
+    logger.append_log(entry(40))
+    
+    aware_start = (START + timedelta(minutes=30)).replace(tzinfo=timezone.utc)
+    seqs = [e['seq'] for e in logger.query(aware_start, action='upload')]
+    assert seqs == [30, 32, 34, 36, 38, 40]
@@ -0,0 +1,81 @@
+"""
+Tests for the SQLite processed file store and its one-shot JSON migration
+"""
+
+import json
+import os
+
+from Bot.processed_store import ProcessedFileStore
+
+
+def record(watermark_id: str, created_at: str, **extra) -> dict:
+    return dict({
+        'watermark_id': watermark_id,
+        'original_filename': f"{watermark_id}.png",
+        'processed_filename': f"{watermark_id}_out.png",
+        'description': "desc",
+        'created_at': created_at,
+        'file_type': '.png'
+    }, **extra)
+
+
+def make_store(data_dir) -> ProcessedFileStore:
+    return ProcessedFileStore(db_path=os.path.join(data_dir, "processed_files.db"),
+                              legacy_json=os.path.join(data_dir, "processed_files.json"))
+
+
+def test_put_get_delete_round_trip(data_dir):
+    store = make_store(data_dir)
+    store.put(record('ES-1', '2026-01-01T00:00:00', file_size=10))
+    
+    assert store.get('ES-1')['file_size'] == 10
+    # Optional fields that were never set are absent, like in the old JSON records
+    assert 'source_filename' not in store.get('ES-1')
+    
+    assert store.delete('ES-1')['watermark_id'] == 'ES-1'
+    assert store.get('ES-1') is None
+    assert store.delete('ES-1') is None
+
+
+def test_recent_count_and_total_size(data_dir):
+    store = make_store(data_dir)
+    store.put(record('ES-1', '2026-01-01T00:00:00', file_size=10))
+    store.put(record('ES-2', '2026-01-03T00:00:00', file_size=5))
+    store.put(record('ES-3', '2026-01-02T00:00:00', file_type='.mp4'))
+    
+    assert [r['watermark_id'] for r in store.recent(2)] == ['ES-2', 'ES-3']
+    assert store.count() == 3
+    assert store.count('.mp4') == 1
+    assert store.total_size() == 15
+    assert store.missing_sizes() == [('ES-3', 'ES-3_out.png')]
+    
+    store.set_file_sizes([('ES-3', 7)])
+    assert store.total_size() == 22
+    assert store.missing_sizes() == []
+
+
+def test_legacy_json_is_migrated_once(data_dir):
+    legacy = os.path.join(data_dir, "processed_files.json")
+    with open(legacy, 'w') as f:
+        json.dump({'ES-9': {'original_filename': 'old.png', 'created_at': '2025-12-31T00:00:00'}}, f)
+    
+    store = make_store(data_dir)
+    assert store.get('ES-9')['original_filename'] == 'old.png'
+    assert not os.path.exists(legacy)
+    assert os.path.exists(legacy + ".migrated")
+    
+    # Rows written after the migration survive a second store opening the same database
+    store.put(record('ES-10', '2026-01-01T00:00:00'))
+    store.close()
+    assert set(make_store(data_dir).all()) == {'ES-9', 'ES-10'}
+
+
+def test_version_changes_on_writes_from_other_connections(data_dir):
+    reader = make_store(data_dir)
+    writer = make_store(data_dir)
+    before = reader.version()
+    
+    writer.put(record('ES-1', '2026-01-01T00:00:00'))
+    
+    assert reader.version() != before
+    assert reader.get('ES-1') is not None
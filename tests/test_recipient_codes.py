@@ -0,0 +1,44 @@
+"""
+Tests for per-recipient codes and matching a leaked copy back to its claimant
+"""
+
+import string
+
+import pytest
+
+pytest.importorskip("PIL")
+
+from Bot.recipient_render import (RECIPIENT_CODE_LENGTH, match_recipient, recipient_code,
+                                  recipient_watermark_id, split_recipient_id)
+
+
+def test_code_is_stable_and_differs_per_user_and_watermark():
+    code = recipient_code('ES-12345', 111)
+    
+    assert code == recipient_code('ES-12345', 111)
+    assert len(code) == RECIPIENT_CODE_LENGTH
+    assert set(code) <= set(string.ascii_uppercase + '234567')
+    assert code != recipient_code('ES-12345', 112)
+    assert code != recipient_code('ES-12346', 111)
+
+
+def test_split_recipient_id_round_trips():
+    stamped = recipient_watermark_id('ES-12345', 111)
+    
+    assert split_recipient_id(stamped) == ('ES-12345', recipient_code('ES-12345', 111))
+    # Typed by hand from a screenshot
+    assert split_recipient_id(f"  {stamped.lower()} ") == ('ES-12345', recipient_code('ES-12345', 111))
+
+
+def test_split_plain_watermark_id_has_no_code():
+    assert split_recipient_id('ES-12345') == ('ES-12345', None)
+    assert split_recipient_id(' ES-12345 ') == ('ES-12345', None)
+
+
+def test_match_recipient_finds_the_claimant():
+    claimants = ['111', '222', 333]
+    code = recipient_code('ES-12345', 222)
+    
+    assert match_recipient('ES-12345', code, claimants) == ['222']
+    assert match_recipient('ES-12345', 'ZZZZZZ', claimants) == []
+    assert match_recipient('ES-99999', code, claimants) == []
@@ -0,0 +1,38 @@
+"""
+Tests for splitting a video into frame ranges for segment-parallel rendering
+"""
+
+import pytest
+
+pytest.importorskip("cv2")
+pytest.importorskip("PIL")
+
+from Bot.watermark import plan_video_segments
+
+
+def test_short_video_stays_one_segment():
+    assert plan_video_segments(250, 8, 300) == [(0, None)]
+    assert plan_video_segments(0, 8, 300) == [(0, None)]
+
+
+def test_segments_are_contiguous_and_cover_every_frame():
+    ranges = plan_video_segments(1000, 4, 100)
+    
+    assert ranges == [(0, 250), (250, 500), (500, 750), (750, None)]
+
+
+def test_segment_count_is_limited_by_minimum_length():
+    ranges = plan_video_segments(1000, 8, 300)
+    
+    assert len(ranges) == 3
+    assert ranges[0][0] == 0
+    assert all(end == start for (_, end), (start, _) in zip(ranges, ranges[1:]))
+
+
+def test_last_segment_runs_to_end_of_stream():
+    # Frame counts from the container are estimates, so the tail is open-ended
+    assert plan_video_segments(1001, 2, 1)[-1] == (500, None)
+
+
+def test_single_segment_requested():
+    assert plan_video_segments(10_000, 1, 300) == [(0, None)]